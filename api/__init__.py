@@ -5,9 +5,13 @@ import flask
 import ujson
 
 from api.metrics import api_request_count
+from api.metrics import read_replica_fallback_count
+from api.metrics import read_replica_recent_write_count
 from app.logging import get_logger
+from app.logging import threadctx
+from app.models import use_read_replica
 
-__all__ = ["api_operation"]
+__all__ = ["api_operation", "read_only_operation"]
 
 STATUS_CODE = "status_code"
 PROCESSING_TIME = "processing_time"
@@ -44,6 +48,38 @@ def api_operation(old_func):
     return new_func
 
 
+def read_only_operation(old_func):
+    """
+    Marks a read only API request operation. Its queries go to the read replica, if one is
+    configured and it does not lag behind the primary by more than the maximum lag. Otherwise
+    they go to the primary, same as the queries of all the other operations. So do the reads
+    of an account that wrote recently, to see its own writes.
+    """
+
+    @wraps(old_func)
+    def new_func(*args, **kwargs):
+        replica_lag_monitor = flask.current_app.replica_lag_monitor
+        if not replica_lag_monitor:
+            return old_func(*args, **kwargs)
+
+        # The identity keeps the account of the request in the thread context.
+        if flask.current_app.replica_recent_writes.recent(threadctx.account_number):
+            read_replica_recent_write_count.inc()
+            return old_func(*args, **kwargs)
+
+        replica_usable = replica_lag_monitor.usable()
+        if not replica_usable:
+            read_replica_fallback_count.inc()
+
+        use_read_replica(replica_usable)
+        try:
+            return old_func(*args, **kwargs)
+        finally:
+            use_read_replica(False)
+
+    return new_func
+
+
 def _get_status_code(results):
     if isinstance(results, str):
         # Flask interprets a string response as a HTTP 200
@@ -62,5 +98,15 @@ def flask_json_response(json_data, status=200):
     return flask.Response(ujson.dumps(json_data), status=status, mimetype="application/json")
 
 
+def flask_serialized_json_response(serialized_json, status=200):
+    return flask.Response(serialized_json, status=status, mimetype="application/json")
+
+
+def flask_not_modified_response(etag):
+    response = flask.Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
 def build_collection_response(data, page, per_page, total):
     return {"total": total, "count": len(data), "page": page, "per_page": per_page, "results": data}
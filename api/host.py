@@ -1,4 +1,6 @@
+import hashlib
 from enum import Enum
+from functools import partial
 
 import connexion
 import flask
@@ -9,14 +11,31 @@ from marshmallow import ValidationError
 from api import api_operation
 from api import build_collection_response
 from api import flask_json_response
+from api import flask_not_modified_response
+from api import flask_serialized_json_response
 from api import metrics
+from api import read_only_operation
+from api.host_delete_job import create_delete_job
+from api.host_delete_job import find_delete_job
+from api.host_query import build_host_export_lines
 from api.host_query import build_paginated_host_list_response
 from api.host_query import staleness_timestamps
-from api.host_query_db import get_host_list as get_host_list_db
+from api.host_query_db import export_host_list as export_host_list_db
+from api.host_query_db import get_host_tags as get_host_tags_db
+from api.host_query_db import host_id_list_version
+from api.host_query_db import host_list_query
+from api.host_query_db import host_list_version
+from api.host_query_db import lookup_host_ids
+from api.host_query_db import paginate_host_list
 from api.host_query_db import params_to_order_by
+from api.host_query_db import TAG_FIELDS
+from api.host_query_db import with_system_profile_fields
+from api.host_query_db import with_tag_count
 from api.host_query_xjoin import get_host_list as get_host_list_xjoin
 from api.metrics import rest_post_request_count
 from api.metrics import tags_ignored_from_http_count
+from api.shadow_read import bulk_query_filters
+from api.shadow_read import timed_bulk_query
 from app import db
 from app import inventory_config
 from app.auth import current_identity
@@ -26,6 +45,7 @@ from app.exceptions import ValidationException
 from app.logging import get_logger
 from app.logging import threadctx
 from app.models import Host
+from app.models import HostTagsOperationSchema
 from app.models import PatchHostSchema
 from app.payload_tracker import get_payload_tracker
 from app.payload_tracker import PayloadTrackerContext
@@ -35,21 +55,40 @@ from app.queue.events import build_event
 from app.queue.events import EventType
 from app.queue.events import message_headers
 from app.queue.queue import EGRESS_HOST_FIELDS
+from app.serialization import DEFAULT_FIELDS
 from app.serialization import deserialize_host_http
+from app.serialization import deserialize_tags
+from app.serialization import load_package_sets
 from app.serialization import serialize_host
+from app.serialization import serialize_host_delete_job
 from app.serialization import serialize_host_system_profile
-from app.utils import Tag
+from app.serialization import serialize_host_system_profile_fields
+from app.xjoin_client import XjoinUnavailableError
 from lib.host_delete import delete_hosts
 from lib.host_repository import add_host
 from lib.host_repository import AddHostResult
 from lib.host_repository import find_non_culled_hosts
+from lib.host_repository import patch_hosts
+from lib.host_repository import update_host_tags
 
 
 FactOperations = Enum("FactOperations", ("merge", "replace"))
 TAG_OPERATIONS = ("apply", "remove")
-GET_HOST_LIST_FUNCTIONS = {BulkQuerySource.db: get_host_list_db, BulkQuerySource.xjoin: get_host_list_xjoin}
 XJOIN_HEADER = "x-rh-cloud-bulk-query-source"  # will be xjoin or db
+# The host list filters, in the order of the host_list_query arguments.
+HOST_FILTER_NAMES = (
+    "display_name",
+    "fqdn",
+    "hostname_or_id",
+    "insights_id",
+    "tags",
+    "staleness",
+    "registered_with",
+    "system_profile",
+)
 REFERAL_HEADER = "referer"
+# Same as the stalenessParam default in the API specification
+DEFAULT_STALENESS = ("fresh", "stale", "unknown")
 
 logger = get_logger(__name__)
 
@@ -142,6 +181,30 @@ def _add_host(input_host):
 
 
 def get_bulk_query_source():
+    bulk_query_source = _requested_bulk_query_source()
+    if (
+        bulk_query_source == BulkQuerySource.xjoin
+        and inventory_config().xjoin_fallback_to_db
+        and flask.current_app.xjoin_client.circuit_breaker.is_open()
+    ):
+        # The database is slower for the bulk queries, but it answers.
+        metrics.xjoin_fallback_count.inc()
+        return BulkQuerySource.db
+    return bulk_query_source
+
+
+def xjoin_fallback_source():
+    """
+    Serves a bulk query that failed on xjoin-search from the database instead, unless the fallback is disabled.
+    """
+    if not inventory_config().xjoin_fallback_to_db:
+        flask.abort(503, "Error, xjoin-search is unavailable")
+
+    metrics.xjoin_fallback_count.inc()
+    return BulkQuerySource.db
+
+
+def _requested_bulk_query_source():
     if XJOIN_HEADER in connexion.request.headers:
         if connexion.request.headers[XJOIN_HEADER].lower() == "xjoin":
             return BulkQuerySource.xjoin
@@ -154,6 +217,7 @@ def get_bulk_query_source():
 
 
 @api_operation
+@read_only_operation
 @metrics.api_request_time.time()
 def get_host_list(
     display_name=None,
@@ -167,33 +231,209 @@ def get_host_list(
     order_how=None,
     staleness=None,
     registered_with=None,
+    system_profile=None,
+    installed_package=None,
+    fields=None,
 ):
     total = 0
     host_list = ()
 
-    bulk_query_source = get_bulk_query_source()
+    system_profile = _system_profile_filters(system_profile, installed_package)
+    host_fields = _host_fields(fields) or DEFAULT_FIELDS
 
-    get_host_list = GET_HOST_LIST_FUNCTIONS[bulk_query_source]
+    bulk_query_source = get_bulk_query_source()
+    host_filters = (display_name, fqdn, hostname_or_id, insights_id, tags, staleness, registered_with, system_profile)
+    filters = bulk_query_filters(**dict(zip(HOST_FILTER_NAMES, host_filters)))
 
+    etag = None
     try:
-        host_list, total = get_host_list(
-            display_name,
-            fqdn,
-            hostname_or_id,
-            insights_id,
-            tags,
-            page,
-            per_page,
-            order_by,
-            order_how,
-            staleness,
-            registered_with,
-        )
+        if bulk_query_source == BulkQuerySource.xjoin:
+            try:
+                with timed_bulk_query(bulk_query_source, "hosts", filters):
+                    host_list, total = get_host_list_xjoin(
+                        display_name,
+                        fqdn,
+                        hostname_or_id,
+                        insights_id,
+                        tags,
+                        page,
+                        per_page,
+                        order_by,
+                        order_how,
+                        staleness,
+                        registered_with,
+                        system_profile,
+                    )
+            except XjoinUnavailableError:
+                bulk_query_source = xjoin_fallback_source()
+
+        if bulk_query_source == BulkQuerySource.db:
+            with timed_bulk_query(bulk_query_source, "hosts", filters):
+                # The query is built once, both to compute the ETag and to fetch the hosts. The host count of the
+                # version is the total, it is not counted again.
+                query = host_list_query(current_identity.account_number, *host_filters)
+                hosts_version = host_list_version(query)
+                etag = _build_etag(hosts_version)
+                if flask.request.if_none_match.contains_weak(etag):
+                    return flask_not_modified_response(etag)
+
+                _, host_count = hosts_version
+                host_list, total = paginate_host_list(
+                    query, page, per_page, order_by, order_how, host_fields, total=host_count
+                )
     except ValueError as e:
         flask.abort(400, str(e))
 
-    json_data = build_paginated_host_list_response(total, page, per_page, host_list)
-    return flask_json_response(json_data)
+    shadow_reader = flask.current_app.shadow_reader
+    if shadow_reader.sampled():
+        # The xjoin hosts are deserialized lazily. An invalid one is a server error, not a bad request.
+        host_list = list(host_list)
+        shadow_source, shadow_query = SHADOW_HOST_ID_QUERIES[bulk_query_source]
+        served_result = ([str(host.id) for host in host_list], total)
+        shadow_query = partial(shadow_query, host_filters, page, per_page, order_by, order_how)
+        shadow_reader.submit("hosts", shadow_source, filters, served_result, shadow_query)
+
+    serialized_json = build_paginated_host_list_response(total, page, per_page, host_list, host_fields)
+    response = flask_serialized_json_response(serialized_json)
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _get_host_ids_db(host_filters, page, per_page, order_by, order_how):
+    query = host_list_query(current_identity.account_number, *host_filters)
+    host_list, total = paginate_host_list(query, page, per_page, order_by, order_how, ("id",))
+    return [str(host.id) for host in host_list], total
+
+
+def _get_host_ids_xjoin(host_filters, page, per_page, order_by, order_how):
+    display_name, fqdn, hostname_or_id, insights_id, tags, staleness, registered_with, system_profile = host_filters
+    host_list, total = get_host_list_xjoin(
+        display_name,
+        fqdn,
+        hostname_or_id,
+        insights_id,
+        tags,
+        page,
+        per_page,
+        order_by,
+        order_how,
+        staleness,
+        registered_with,
+        system_profile,
+    )
+    return [str(host.id) for host in host_list], total
+
+
+# The other source of the host list and its query, returning the host ids and the total.
+SHADOW_HOST_ID_QUERIES = {
+    BulkQuerySource.db: (BulkQuerySource.xjoin, _get_host_ids_xjoin),
+    BulkQuerySource.xjoin: (BulkQuerySource.db, _get_host_ids_db),
+}
+
+
+def _sparse_fieldset(fields, resource):
+    """
+    Returns the fields of the resource requested by the fields[resource] parameter, or None if all
+    the fields are requested.
+    """
+    if fields and resource in fields:
+        return tuple(fields[resource].split(","))
+    return None
+
+
+def _host_fields(fields):
+    host_fields = _sparse_fieldset(fields, "hosts")
+    # The id and the account identify the host, they are always returned.
+    return host_fields and ("id", "account") + host_fields
+
+
+def _build_etag(hosts_version):
+    # The same hosts are serialized differently for a different page, ordering or filter, and with different
+    # staleness timestamps for a different culling configuration.
+    culling_config = staleness_timestamps().config
+    etag_source = f"{current_identity.account_number} {flask.request.full_path} {hosts_version} {culling_config}"
+    return hashlib.sha1(etag_source.encode()).hexdigest()
+
+
+@api_operation
+@read_only_operation
+@metrics.api_request_time.time()
+def export_hosts(
+    display_name=None,
+    fqdn=None,
+    hostname_or_id=None,
+    insights_id=None,
+    staleness=None,
+    tags=None,
+    registered_with=None,
+    system_profile=None,
+    installed_package=None,
+    include=None,
+):
+    system_profile = _system_profile_filters(system_profile, installed_package)
+    fields = DEFAULT_FIELDS + tuple(include or ())
+    host_chunks = export_host_list_db(
+        display_name, fqdn, hostname_or_id, insights_id, tags, staleness, registered_with, system_profile, fields
+    )
+    lines = build_host_export_lines(host_chunks, fields)
+    return flask.Response(flask.stream_with_context(lines), mimetype="application/x-ndjson")
+
+
+def _system_profile_filters(system_profile, installed_package):
+    if not installed_package:
+        return system_profile
+
+    # An alias of the installed_packages system profile filter.
+    installed_package_filters = [f"installed_packages={package}" for package in installed_package]
+    return (system_profile or []) + installed_package_filters
+
+
+@api_operation
+@metrics.api_request_time.time()
+def delete_host_list(
+    display_name=None,
+    fqdn=None,
+    hostname_or_id=None,
+    insights_id=None,
+    tags=None,
+    staleness=None,
+    registered_with=None,
+):
+    filters = {
+        "display_name": display_name,
+        "fqdn": fqdn,
+        "hostname_or_id": hostname_or_id,
+        "insights_id": insights_id,
+        "tags": tags,
+        "staleness": staleness,
+        "registered_with": registered_with,
+    }
+    filters = {name: value for name, value in filters.items() if value}
+    if not filters:
+        flask.abort(400, "At least one filter must be provided to delete hosts.")
+
+    filters.setdefault("staleness", DEFAULT_STALENESS)
+
+    # Fail fast on invalid filters instead of in the host delete job.
+    host_list_query(current_identity.account_number, **filters)
+
+    job = create_delete_job(current_identity.account_number, filters, threadctx.request_id)
+    json_data = serialize_host_delete_job(job)
+
+    response = flask_json_response(json_data, status=status.HTTP_202_ACCEPTED)
+    response.headers["Location"] = f"{flask.request.base_url}/delete_jobs/{json_data['id']}"
+    return response
+
+
+@api_operation
+@metrics.api_request_time.time()
+def get_host_delete_job(job_id):
+    job = find_delete_job(current_identity.account_number, job_id)
+    if not job:
+        flask.abort(status.HTTP_404_NOT_FOUND)
+
+    return flask_json_response(serialize_host_delete_job(job))
 
 
 @api_operation
@@ -226,22 +466,25 @@ def delete_by_id(host_id_list):
 
 
 @api_operation
+@read_only_operation
 @metrics.api_request_time.time()
-def get_host_by_id(host_id_list, page=1, per_page=100, order_by=None, order_how=None):
+def get_host_by_id(host_id_list, page=1, per_page=100, order_by=None, order_how=None, fields=None):
     query = _get_host_list_by_id_list(current_identity.account_number, host_id_list)
 
+    etag = _build_etag(host_id_list_version(query))
+    if flask.request.if_none_match.contains_weak(etag):
+        return flask_not_modified_response(etag)
+
+    host_fields = _host_fields(fields) or DEFAULT_FIELDS
     try:
-        order_by = params_to_order_by(order_by, order_how)
+        host_list, total = paginate_host_list(query, page, per_page, order_by, order_how, host_fields)
     except ValueError as e:
         flask.abort(400, str(e))
-    else:
-        query = query.order_by(*order_by)
-    query_results = query.paginate(page, per_page, True)
-
-    logger.debug("Found hosts: %s", query_results.items)
 
-    json_data = build_paginated_host_list_response(query_results.total, page, per_page, query_results.items)
-    return flask_json_response(json_data)
+    serialized_json = build_paginated_host_list_response(total, page, per_page, host_list, host_fields)
+    response = flask_serialized_json_response(serialized_json)
+    response.set_etag(etag, weak=True)
+    return response
 
 
 def _get_host_list_by_id_list(account_number, host_id_list):
@@ -249,10 +492,19 @@ def _get_host_list_by_id_list(account_number, host_id_list):
 
 
 @api_operation
+@read_only_operation
 @metrics.api_request_time.time()
-def get_host_system_profile_by_id(host_id_list, page=1, per_page=100, order_by=None, order_how=None):
+def get_host_system_profile_by_id(host_id_list, page=1, per_page=100, order_by=None, order_how=None, fields=None):
     query = _get_host_list_by_id_list(current_identity.account_number, host_id_list)
 
+    etag = _build_etag(host_id_list_version(query))
+    if flask.request.if_none_match.contains_weak(etag):
+        return flask_not_modified_response(etag)
+
+    system_profile_fields = _sparse_fieldset(fields, "system_profile")
+    if system_profile_fields:
+        query = with_system_profile_fields(query, system_profile_fields)
+
     try:
         order_by = params_to_order_by(order_by, order_how)
     except ValueError as e:
@@ -261,15 +513,36 @@ def get_host_system_profile_by_id(host_id_list, page=1, per_page=100, order_by=N
         query = query.order_by(*order_by)
     query_results = query.paginate(page, per_page, True)
 
-    response_list = [serialize_host_system_profile(host) for host in query_results.items]
+    if system_profile_fields:
+        system_profiles = [
+            (host_id, dict(zip(system_profile_fields, values))) for host_id, *values in query_results.items
+        ]
+        package_sets = load_package_sets(system_profile for _, system_profile in system_profiles)
+        response_list = [
+            serialize_host_system_profile_fields(host_id, system_profile, package_sets)
+            for host_id, system_profile in system_profiles
+        ]
+    else:
+        package_sets = load_package_sets(host.system_profile_facts for host in query_results.items)
+        response_list = [serialize_host_system_profile(host, package_sets) for host in query_results.items]
     json_output = build_collection_response(response_list, page, per_page, query_results.total)
-    return flask_json_response(json_output)
+    response = flask_json_response(json_output)
+    response.set_etag(etag, weak=True)
+    return response
 
 
-def _emit_patch_event(serialized_host, host_id, insights_id):
-    headers = message_headers(EventType.updated, insights_id)
+def _build_update_event(host, staleness_timestamps):
+    serialized_host = serialize_host(host, staleness_timestamps, EGRESS_HOST_FIELDS)
+    headers = message_headers(EventType.updated, host.canonical_facts.get("insights_id"))
     event = build_event(EventType.updated, serialized_host)
-    current_app.event_producer.write_event(event, str(host_id), headers, Topic.events)
+    return event, str(host.id), headers
+
+
+def _emit_update_events(updated_hosts):
+    timestamps = staleness_timestamps()
+    events = [_build_update_event(host, timestamps) for host in updated_hosts]
+    for event, key, headers in events:
+        current_app.event_producer.write_event(event, key, headers, Topic.events)
 
 
 @api_operation
@@ -281,24 +554,58 @@ def patch_by_id(host_id_list, body):
         logger.exception(f"Input validation error while patching host: {host_id_list} - {body}")
         return ({"status": 400, "title": "Bad Request", "detail": str(e.messages), "type": "unknown"}, 400)
 
-    query = _get_host_list_by_id_list(current_identity.account_number, host_id_list)
-
-    hosts_to_update = query.all()
+    patched_hosts = patch_hosts(current_identity.account_number, host_id_list, validated_patch_host_data)
 
-    if not hosts_to_update:
+    if not patched_hosts:
         logger.debug("Failed to find hosts during patch operation - hosts: %s", host_id_list)
         return flask.abort(status.HTTP_404_NOT_FOUND)
 
-    for host in hosts_to_update:
-        host.patch(validated_patch_host_data)
-        serialized_host = serialize_host(host, staleness_timestamps(), EGRESS_HOST_FIELDS)
-        _emit_patch_event(serialized_host, host.id, host.canonical_facts.get("insights_id"))
-
-    db.session.commit()
+    _emit_update_events(patched_hosts)
 
     return 200
 
 
+@api_operation
+@metrics.api_request_time.time()
+def update_tags(body):
+    try:
+        validated_data = HostTagsOperationSchema(strict=True).load(body).data
+    except ValidationError as e:
+        logger.exception(f"Input validation error while updating host tags: {body}")
+        return ({"status": 400, "title": "Bad Request", "detail": str(e.messages), "type": "unknown"}, 400)
+
+    host_id_list = body.get("host_ids")
+    filters = body.get("filters")
+    if bool(host_id_list) == bool(filters):
+        flask.abort(400, "Either host_ids or filters must be provided.")
+
+    if host_id_list:
+        query = _get_host_list_by_id_list(current_identity.account_number, host_id_list)
+    else:
+        filters.setdefault("staleness", DEFAULT_STALENESS)
+        query = host_list_query(current_identity.account_number, **filters)
+
+    tags = deserialize_tags(validated_data["tags"])
+    updated_count = 0
+    for updated_hosts in update_host_tags(query, body["operation"], tags):
+        _emit_update_events(updated_hosts)
+        updated_count += len(updated_hosts)
+
+    if host_id_list and not updated_count:
+        logger.debug("Failed to find hosts during tags operation - hosts: %s", host_id_list)
+        return flask.abort(status.HTTP_404_NOT_FOUND)
+
+    return flask_json_response({"updated": updated_count})
+
+
+@api_operation
+@read_only_operation
+@metrics.api_request_time.time()
+def lookup_hosts(body):
+    host_ids = lookup_host_ids(current_identity.account_number, body["type"], body["values"])
+    return flask_json_response({"results": host_ids})
+
+
 @api_operation
 @metrics.api_request_time.time()
 def replace_facts(host_id_list, namespace, body):
@@ -350,6 +657,7 @@ def update_facts_by_namespace(operation, host_id_list, namespace, fact_dict):
 
 
 @api_operation
+@read_only_operation
 @metrics.api_request_time.time()
 def get_host_tag_count(host_id_list, page=1, per_page=100, order_by=None, order_how=None):
     query = _get_host_list_by_id_list(current_identity.account_number, host_id_list)
@@ -360,34 +668,18 @@ def get_host_tag_count(host_id_list, page=1, per_page=100, order_by=None, order_
         flask.abort(400, str(e))
     else:
         query = query.order_by(*order_by)
-    query = query.paginate(page, per_page, True)
+    query = with_tag_count(query).paginate(page, per_page, True)
 
-    counts = _count_tags(query.items)
+    # returns counts in format [{id: count}, {id: count}]
+    counts = {str(host_id): tag_count for host_id, tag_count in query.items}
 
     return _build_paginated_host_tags_response(query.total, page, per_page, counts)
 
 
-# returns counts in format [{id: count}, {id: count}]
-def _count_tags(host_list):
-    counts = {}
-
-    for host in host_list:
-        host_tag_count = 0
-        if host.tags is not None:  # fixme: Host tags should never be None, in DB neither NULL nor 'null'
-            for namespace in host.tags:
-                for tag in host.tags[namespace]:
-                    if len(host.tags[namespace][tag]) == 0:
-                        host_tag_count += 1  # for tags with no value
-                    else:
-                        host_tag_count += len(host.tags[namespace][tag])
-        counts[str(host.id)] = host_tag_count
-
-    return counts
-
-
 @api_operation
+@read_only_operation
 @metrics.api_request_time.time()
-def get_host_tags(host_id_list, page=1, per_page=100, order_by=None, order_how=None, search=None):
+def get_host_tags(host_id_list, page=1, per_page=100, order_by=None, order_how=None, search=None, fields=None):
     query = _get_host_list_by_id_list(current_identity.account_number, host_id_list)
 
     try:
@@ -397,30 +689,15 @@ def get_host_tags(host_id_list, page=1, per_page=100, order_by=None, order_how=N
     else:
         query = query.order_by(*order_by)
 
-    query = query.paginate(page, per_page, True)
+    query = query.with_entities(Host.id).paginate(page, per_page, True)
 
-    tags = _build_serialized_tags(query.items, search)
+    host_ids = [host_id for host_id, in query.items]
+    tag_fields = _sparse_fieldset(fields, "tags") or TAG_FIELDS
+    tags = get_host_tags_db(current_identity.account_number, host_ids, search, tag_fields)
 
     return _build_paginated_host_tags_response(query.total, page, per_page, tags)
 
 
-def _build_serialized_tags(host_list, search):
-    response_tags = {}
-
-    for host in host_list:
-        if search is None:
-            tags = Tag.create_tags_from_nested(host.tags)
-        else:
-            tags = Tag.filter_tags(Tag.create_tags_from_nested(host.tags), search)
-        tag_dictionaries = []
-        for tag in tags:
-            tag_dictionaries.append(tag.data())
-
-        response_tags[str(host.id)] = tag_dictionaries
-
-    return response_tags
-
-
 def _build_paginated_host_tags_response(total, page, per_page, tags_list):
     json_output = build_collection_response(tags_list, page, per_page, total)
     return flask_json_response(json_output)
@@ -0,0 +1,105 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from api.host_query_db import host_list_query
+from app import UNKNOWN_REQUEST_ID_VALUE
+from app.logging import get_logger
+from app.logging import threadctx
+from app.models import db
+from app.models import HostDeleteJob
+from app.models import HostDeleteJobStatus
+from lib.host_delete import delete_host_chunks
+
+__all__ = ("claim_delete_job", "create_delete_job", "find_delete_job", "run_delete_job")
+
+logger = get_logger(__name__)
+
+
+def create_delete_job(account_number, filters, request_id):
+    """
+    Stores a pending job, run later by the host delete job, not by the API process.
+    """
+    job = HostDeleteJob(account_number, filters, request_id)
+    db.session.add(job)
+    db.session.commit()
+    logger.info("Created host delete job %s with filters %s", job.id, filters)
+    return job
+
+
+def find_delete_job(account_number, job_id):
+    return HostDeleteJob.query.filter(
+        (HostDeleteJob.account == account_number) & (HostDeleteJob.id == job_id)
+    ).one_or_none()
+
+
+def claim_delete_job(stale_timeout):
+    """
+    Marks the oldest pending job as running and returns it. A running job without a heartbeat for the
+    stale timeout was interrupted and is claimed again, resumed. The jobs locked by the concurrent claims
+    are skipped, every job is claimed only once.
+    """
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=stale_timeout)
+    job = (
+        HostDeleteJob.query.filter(
+            (HostDeleteJob.status == HostDeleteJobStatus.pending.name)
+            | (
+                (HostDeleteJob.status == HostDeleteJobStatus.running.name)
+                & (HostDeleteJob.heartbeat_on < stale_before)
+            )
+        )
+        .order_by(HostDeleteJob.created_on)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not job:
+        db.session.commit()
+        return None
+
+    if job.status == HostDeleteJobStatus.running.name:
+        logger.warning("Resuming host delete job %s, its last heartbeat was at %s", job.id, job.heartbeat_on)
+
+    job.set_status(HostDeleteJobStatus.running)
+    job.heartbeat()
+    db.session.commit()
+    return job
+
+
+def run_delete_job(job, event_producer, interrupt=lambda: False):
+    """
+    Deletes the hosts matching the job filters by chunks, refreshing the job heartbeat after each of them.
+    The hosts deleted before an interruption are gone, a resumed job only deletes the remaining ones. An
+    interrupted job is returned to pending to be claimed again right away. The job runs with the request ID of
+    the API request that created it.
+    """
+    request_id = threadctx.request_id
+    threadctx.request_id = job.request_id or UNKNOWN_REQUEST_ID_VALUE
+    try:
+        _run_delete_job(job, event_producer, interrupt)
+    finally:
+        threadctx.request_id = request_id
+
+
+def _run_delete_job(job, event_producer, interrupt):
+    try:
+        query = host_list_query(job.account, **job.filters)
+        for deleted_hosts in delete_host_chunks(query, event_producer, interrupt=interrupt):
+            job.deleted_count += len(deleted_hosts)
+            job.heartbeat()
+            db.session.commit()
+            logger.info("Host delete job %s deleted %d hosts", job.id, len(deleted_hosts))
+    except Exception:
+        logger.exception("Host delete job %s failed", job.id)
+        db.session.rollback()
+        _set_status(job, HostDeleteJobStatus.failed)
+    else:
+        if interrupt():
+            logger.info("Host delete job %s interrupted, returned to pending", job.id)
+            _set_status(job, HostDeleteJobStatus.pending)
+        else:
+            _set_status(job, HostDeleteJobStatus.finished)
+
+
+def _set_status(job, status):
+    job.set_status(status)
+    db.session.commit()
@@ -1,28 +1,83 @@
 from collections import namedtuple
 from enum import Enum
 
+import ujson
+from flask import current_app
+from flask import g
+
+from api import metrics
 from app import inventory_config
 from app.culling import Timestamps
+from app.models import use_read_replica
+from app.serialization import DEFAULT_FIELDS
+from app.serialization import load_package_sets
 from app.serialization import serialize_host
 
 
-__all__ = ("build_paginated_host_list_response", "staleness_timestamps")
+__all__ = ("build_host_export_lines", "build_paginated_host_list_response", "staleness_timestamps")
 
 OrderBy = Enum("OrderBy", ("display_name", "id", "modified_on"))
 OrderHow = Enum("OrderHow", ("ASC", "DESC"))
 Order = namedtuple("Order", ("by", "how"))
 
 
-def build_paginated_host_list_response(total, page, per_page, host_list):
+def build_paginated_host_list_response(total, page, per_page, host_list, fields=DEFAULT_FIELDS):
+    """
+    Returns the serialized JSON of the response. The hosts are spliced in as serialized fragments,
+    mostly taken from the cache.
+    """
+    host_fragments = list(_serialize_host_fragments(list(host_list), fields))
+    return (
+        f'{{"total":{total},"count":{len(host_fragments)},"page":{page},"per_page":{per_page},'
+        f'"results":[{",".join(host_fragments)}]}}'
+    )
+
+
+def build_host_export_lines(host_chunks, fields):
+    """
+    Serializes the hosts chunk by chunk as they are consumed, each to a line of newline-delimited JSON.
+    The lines are streamed after the read only operation has returned, the package sets are nevertheless
+    loaded from the database the hosts are read from.
+    """
+    read_replica = g.get("read_replica", False)
+
+    def _export_lines():
+        use_read_replica(read_replica)
+        try:
+            for host_chunk in host_chunks:
+                for host_fragment in _serialize_host_fragments(host_chunk, fields):
+                    yield host_fragment + "\n"
+        finally:
+            use_read_replica(False)
+
+    return _export_lines()
+
+
+def _serialize_host_fragments(host_list, fields):
+    """
+    A serialized host does not change until the host is modified, its modification time is thus a part
+    of the cache key. So is the culling configuration the staleness timestamps are computed from. The
+    package sets of the hosts missing in the cache are loaded all at once.
+    """
     timestamps = staleness_timestamps()
-    json_host_list = [serialize_host(host, timestamps) for host in host_list]
-    return {
-        "total": total,
-        "count": len(json_host_list),
-        "page": page,
-        "per_page": per_page,
-        "results": json_host_list,
-    }
+    fragment_cache = current_app.host_fragment_cache
+    keys = [(str(host.id), host.modified_on, tuple(fields), timestamps.config) for host in host_list]
+    host_fragments = [fragment_cache.get(key) for key in keys]
+
+    missed_hosts = [host for host, host_fragment in zip(host_list, host_fragments) if host_fragment is None]
+    if "system_profile" in fields:
+        package_sets = load_package_sets(host.system_profile_facts for host in missed_hosts)
+    else:
+        package_sets = {}
+
+    for host, key, host_fragment in zip(host_list, keys, host_fragments):
+        if host_fragment is None:
+            metrics.host_fragment_cache_miss_count.inc()
+            host_fragment = ujson.dumps(serialize_host(host, timestamps, fields, package_sets))
+            fragment_cache.set(key, host_fragment)
+        else:
+            metrics.host_fragment_cache_hit_count.inc()
+        yield host_fragment
 
 
 def staleness_timestamps():
@@ -1,18 +1,111 @@
+from itertools import islice
+from operator import eq
+from operator import ge
+from operator import gt
+from operator import le
+from operator import lt
 from uuid import UUID
 
+from flask import abort
 from sqlalchemy import and_
+from sqlalchemy import any_
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import literal
+from sqlalchemy import literal_column
 from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+from sqlalchemy.sql.expression import bindparam
 
 from app.auth import current_identity
+from app.exceptions import ValidationException
 from app.logging import get_logger
+from app.models import db
 from app.models import Host
+from app.models import HostView
+from app.models import PACKAGE_SET_REFERENCE
+from app.models import PackageSet
+from app.models import SystemProfileSchema
+from app.serialization import DEFAULT_FIELDS
+from app.utils import SystemProfileFilter
 from app.utils import Tag
 from lib.host_repository import canonical_fact_host_query
 from lib.host_repository import find_hosts_by_staleness
-
-__all__ = ("get_host_list", "params_to_order_by")
+from lib.host_repository import find_non_culled_hosts
+from lib.host_repository import HOST_TAGS_SQL
+
+__all__ = (
+    "export_host_list",
+    "get_host_list",
+    "get_host_tags",
+    "host_id_list_version",
+    "host_list_query",
+    "host_list_version",
+    "lookup_host_ids",
+    "paginate_host_list",
+    "params_to_order_by",
+    "with_host_fields",
+    "with_system_profile_fields",
+    "with_tag_count",
+)
 
 NULL = None
+EXPORT_CHUNK_SIZE = 1000
+
+SYSTEM_PROFILE_OPERATORS = {"=": eq, ">": gt, ">=": ge, "<": lt, "<=": le}
+
+# A tag without a value counts as one tag.
+TAG_COUNT_SQL = f"""
+(SELECT coalesce(sum(greatest(jsonb_array_length(k.value), 1)), 0)
+FROM jsonb_each({HOST_TAGS_SQL}) AS ns, jsonb_each(ns.value) AS k)
+"""
+
+# Expands the host tags to one row per tag, a tag without a value has a NULL value. Namespaces
+# stored as the "null" string are returned as NULL, same as in the serialized tags.
+HOST_TAGS_EXPANSION_SQL = f"""
+SELECT hosts.id, t.namespace, t.key, t.value
+FROM hosts CROSS JOIN LATERAL (
+    SELECT nullif(nullif(ns.key, 'null'), '') AS namespace, k.key, v.value,
+        ns.ordinality AS namespace_position, k.ordinality AS key_position, v.ordinality AS value_position
+    FROM jsonb_each({HOST_TAGS_SQL}) WITH ORDINALITY AS ns
+    CROSS JOIN LATERAL jsonb_each(ns.value) WITH ORDINALITY AS k
+    CROSS JOIN LATERAL jsonb_array_elements_text(
+        CASE WHEN jsonb_array_length(k.value) = 0 THEN CAST('[null]' AS jsonb) ELSE k.value END
+    ) WITH ORDINALITY AS v
+) AS t
+WHERE hosts.account = :account AND hosts.id IN :host_ids
+"""
+
+HOST_TAGS_ORDER_SQL = "ORDER BY hosts.id, t.namespace_position, t.key_position, t.value_position"
+
+# Case-sensitive substring match on any part of the tag, same as Tag.filter_tags.
+TAG_SEARCH_SQL = """
+AND (position(:search IN t.namespace) > 0 OR position(:search IN t.key) > 0 OR position(:search IN t.value) > 0)
+"""
+
+# The columns of the hosts table needed to serialize the host fields, all other fields are canonical facts.
+HOST_FIELD_COLUMNS = {
+    "id": "id",
+    "account": "account",
+    "display_name": "display_name",
+    "ansible_host": "ansible_host",
+    "facts": "facts",
+    "reporter": "reporter",
+    "stale_timestamp": "stale_timestamp",
+    "stale_warning_timestamp": "stale_timestamp",
+    "culled_timestamp": "stale_timestamp",
+    "created": "created_on",
+    "updated": "modified_on",
+    "tags": "tags",
+    "system_profile": "system_profile_facts",
+}
+
+TAG_FIELDS = ("namespace", "key", "value")
 
 logger = get_logger(__name__)
 
@@ -29,17 +122,109 @@ def get_host_list(
     order_how,
     staleness,
     registered_with,
+    system_profile,
+):
+    query = host_list_query(
+        current_identity.account_number,
+        display_name,
+        fqdn,
+        hostname_or_id,
+        insights_id,
+        tags,
+        staleness,
+        registered_with,
+        system_profile,
+    )
+
+    return paginate_host_list(query, page, per_page, order_by, order_how)
+
+
+def paginate_host_list(query, page, per_page, order_by, order_how, fields=DEFAULT_FIELDS, total=None):
+    """
+    Returns a page of the hosts as read only views, selecting only the columns needed to serialize the
+    given fields. No Host instances are built. A total already counted, e.g. by host_list_version, is not
+    counted again.
+    """
+    order_by = params_to_order_by(order_by, order_how)
+    query = with_host_fields(query, fields).order_by(*order_by)
+    if total is None:
+        query_results = query.paginate(page, per_page, True)
+        rows, total = query_results.items, query_results.total
+    else:
+        rows = query.limit(per_page).offset((page - 1) * per_page).all()
+        # Same as paginate.
+        if not rows and page != 1:
+            abort(404)
+    host_list = [HostView.from_row(row) for row in rows]
+
+    logger.debug("Found hosts: %s", host_list)
+
+    return host_list, total
+
+
+def host_list_version(query):
+    """
+    Returns the version of the host list: the newest modification time and the number of the matching
+    hosts. It changes when a host is modified, added or removed. Computed by a single aggregate query,
+    without fetching the hosts. The number is the total of the paginated host list too.
+    """
+    return tuple(query.with_entities(func.max(Host.modified_on), func.count(Host.id)).order_by(None).one())
+
+
+def host_id_list_version(query):
+    """
+    Returns the version of the hosts selected by their ids: a hash of their (id, modified_on) pairs.
+    Computed by a single aggregate query, without fetching the hosts.
+    """
+    host_versions = func.concat(Host.id, "@", Host.modified_on)
+    host_versions_hash = func.md5(func.string_agg(host_versions, aggregate_order_by(literal(","), Host.id)))
+    return query.with_entities(host_versions_hash).order_by(None).scalar()
+
+
+def export_host_list(
+    display_name, fqdn, hostname_or_id, insights_id, tags, staleness, registered_with, system_profile, fields
+):
+    """
+    Returns an iterator of all the matching hosts as read only views, in lists of up to EXPORT_CHUNK_SIZE
+    hosts fetched from a server-side cursor. The query is executed right away, on the database selected
+    for the request, even though the hosts are consumed later while the response is streamed.
+    """
+    query = host_list_query(
+        current_identity.account_number,
+        display_name,
+        fqdn,
+        hostname_or_id,
+        insights_id,
+        tags,
+        staleness,
+        registered_with,
+        system_profile,
+    )
+    hosts = map(HostView.from_row, iter(with_host_fields(query, fields).yield_per(EXPORT_CHUNK_SIZE)))
+    return iter(lambda: list(islice(hosts, EXPORT_CHUNK_SIZE)), [])
+
+
+def host_list_query(
+    account_number,
+    display_name=None,
+    fqdn=None,
+    hostname_or_id=None,
+    insights_id=None,
+    tags=None,
+    staleness=None,
+    registered_with=None,
+    system_profile=None,
 ):
     if fqdn:
-        query = _find_hosts_by_canonical_fact("fqdn", fqdn)
+        query = _find_hosts_by_canonical_fact(account_number, "fqdn", fqdn)
     elif display_name:
-        query = _find_hosts_by_display_name(display_name)
+        query = _find_hosts_by_display_name(account_number, display_name)
     elif hostname_or_id:
-        query = _find_hosts_by_hostname_or_id(hostname_or_id)
+        query = _find_hosts_by_hostname_or_id(account_number, hostname_or_id)
     elif insights_id:
-        query = _find_hosts_by_canonical_fact("insights_id", insights_id)
+        query = _find_hosts_by_canonical_fact(account_number, "insights_id", insights_id)
     else:
-        query = _find_all_hosts()
+        query = _find_all_hosts(account_number)
 
     if tags:
         # add tag filtering to the query
@@ -51,13 +236,93 @@ def get_host_list(
     if registered_with:
         query = find_hosts_with_insights_enabled(query)
 
-    order_by = params_to_order_by(order_by, order_how)
-    query = query.order_by(*order_by)
-    query_results = query.paginate(page, per_page, True)
+    if system_profile:
+        query = _find_hosts_by_system_profile(system_profile, query)
+
+    return query
+
+
+def lookup_host_ids(account_number, fact, values):
+    """
+    Maps each of the given host ids or canonical fact values to the ids of the non-culled hosts having
+    it, a value without any hosts to an empty list. All the values are matched by a single query, the
+    canonical facts are compared by = ANY on their expression indexes.
+    """
+    if fact == "id":
+        try:
+            requested_values = {UUID(value): value for value in values}
+        except ValueError:
+            raise ValidationException("The values must be host ids.") from None
+        values_column = Host.id
+        values_param = bindparam("values", list(requested_values), type_=ARRAY(PostgresUUID(as_uuid=True)))
+    else:
+        requested_values = {value: value for value in values}
+        values_column = Host.canonical_facts[fact].astext
+        values_param = bindparam("values", list(requested_values), type_=ARRAY(String))
+
+    query = db.session.query(values_column, Host.id).filter(
+        Host.account == account_number, values_column == any_(values_param)
+    )
+    query = find_non_culled_hosts(query).order_by(Host.id)
+
+    found_host_ids = {value: [] for value in values}
+    for value, host_id in query:
+        found_host_ids[requested_values[value]].append(str(host_id))
+    return found_host_ids
+
+
+def with_host_fields(query, fields):
+    """
+    Replaces the selected hosts by only the columns needed to serialize the given host fields, the large
+    JSONB columns are not read unless needed. The id and the modification time are always selected, they
+    identify the version of the host.
+    """
+    column_names = {"id", "modified_on"} | {HOST_FIELD_COLUMNS.get(field, "canonical_facts") for field in fields}
+    return query.with_entities(*(getattr(Host, column_name) for column_name in sorted(column_names)))
+
+
+def with_system_profile_fields(query, fields):
+    """
+    Replaces the selected columns by the host id and the given system profile fields, each extracted
+    from the system profile in the database.
+    """
+    unknown_fields = [field for field in fields if field not in SystemProfileSchema._declared_fields]
+    if unknown_fields:
+        raise ValidationException(f"{', '.join(unknown_fields)}: not a system profile field")
 
-    logger.debug("Found hosts: %s", query_results.items)
+    return query.with_entities(Host.id, *(Host.system_profile_facts[field] for field in fields))
 
-    return query_results.items, query_results.total
+
+def with_tag_count(query):
+    """
+    Replaces the selected columns by the host id and the number of its tags.
+    """
+    return query.with_entities(Host.id, literal_column(TAG_COUNT_SQL, Integer))
+
+
+def get_host_tags(account_number, host_id_list, search=None, fields=TAG_FIELDS):
+    """
+    Returns the serialized tags of the given hosts, optionally only those matching the search
+    term. The tags are expanded and filtered in the database. Only the given fields of the tags are
+    serialized.
+    """
+    host_tags = {str(host_id): [] for host_id in host_id_list}
+    if not host_id_list:
+        return host_tags
+
+    sql = HOST_TAGS_EXPANSION_SQL
+    params = {"account": account_number, "host_ids": list(host_id_list)}
+    if search is not None:
+        sql += TAG_SEARCH_SQL
+        params["search"] = search
+
+    statement = text(sql + HOST_TAGS_ORDER_SQL).bindparams(bindparam("host_ids", expanding=True))
+
+    for host_id, *tag_values in db.session.execute(statement, params):
+        tag = dict(zip(TAG_FIELDS, tag_values))
+        host_tags[str(host_id)].append({field: tag[field] for field in fields})
+
+    return host_tags
 
 
 def find_hosts_with_insights_enabled(query):
@@ -96,12 +361,12 @@ def _order_how(column, order_how):
         raise ValueError('Unsupported ordering direction, use "ASC" or "DESC".')
 
 
-def _find_all_hosts():
-    return Host.query.filter(Host.account == current_identity.account_number)
+def _find_all_hosts(account_number):
+    return Host.query.filter(Host.account == account_number)
 
 
-def _find_hosts_by_canonical_fact(canonical_fact, value):
-    return canonical_fact_host_query(current_identity.account_number, canonical_fact, value)
+def _find_hosts_by_canonical_fact(account_number, canonical_fact, value):
+    return canonical_fact_host_query(account_number, canonical_fact, value)
 
 
 def _find_hosts_by_tag(string_tags, query):
@@ -114,31 +379,84 @@ def _find_hosts_by_tag(string_tags, query):
 
     tags_to_find = Tag.create_nested_from_tags(tags)
 
-    return query.filter(Host.tags.contains(tags_to_find))
+    # The jsonb_path_ops index only covers paths ending in a value, so tags without a value are matched
+    # by their key. The containment of the other tags is looked up in the index.
+    tags_with_values = {}
+    for namespace, keys in tags_to_find.items():
+        for key, values in keys.items():
+            if values:
+                tags_with_values.setdefault(namespace, {})[key] = values
+            else:
+                namespace_tags = Host.tags[Tag.deserialize_namespace(namespace)]
+                query = query.filter(namespace_tags.has_key(key))  # noqa: W601 JSONB query filter, not a dict
 
+    if tags_with_values:
+        query = query.filter(Host.tags.contains(tags_with_values))
 
-def _find_hosts_by_hostname_or_id(hostname):
+    return query
+
+
+def _find_hosts_by_system_profile(string_filters, query):
+    logger.debug("_find_hosts_by_system_profile(%s)", string_filters)
+
+    for string_filter in string_filters:
+        system_profile_filter = SystemProfileFilter.from_string(string_filter)
+        query = query.filter(_system_profile_filter(*system_profile_filter))
+
+    return query
+
+
+def _system_profile_filter(field, field_type, operator, value):
+    # Same expressions as in the system profile indexes, e.g. ((system_profile_facts ->> 'number_of_cpus')::integer).
+    element = Host.system_profile_facts[field]
+    if field_type is list:
+        # The list is either stored in the system profile or referenced as a package set.
+        # The package set hashes are an array, so that both branches of the OR can use an index.
+        package_sets = select([PackageSet.hash]).where(PackageSet.items.contains([value]))
+        return or_(
+            element.contains([value]),
+            element[PACKAGE_SET_REFERENCE].astext == any_(func.array(package_sets.as_scalar())),
+        )
+
+    if field_type is int:
+        element = element.as_integer()
+    elif field_type is bool:
+        element = element.as_boolean()
+    else:
+        element = element.astext
+    return SYSTEM_PROFILE_OPERATORS[operator](element, value)
+
+
+def _find_hosts_by_hostname_or_id(account_number, hostname):
     logger.debug("_find_hosts_by_hostname_or_id(%s)", hostname)
 
-    filter_list = [
-        Host.display_name.comparator.contains(hostname),
-        Host.canonical_facts["fqdn"].astext.contains(hostname),
-    ]
+    filter_list = [_contains(Host.display_name, hostname), _contains(Host.canonical_facts["fqdn"].astext, hostname)]
 
-    try:
-        UUID(hostname)
+    if _can_be_uuid(hostname):
         host_id = hostname
         filter_list.append(Host.id == host_id)
         logger.debug("Adding id (uuid) to the filter list")
-    except Exception:
+    else:
         # Do not filter using the id
-        logger.debug("The hostname (%s) could not be converted into a UUID", hostname, exc_info=True)
+        logger.debug("The hostname (%s) could not be converted into a UUID", hostname)
 
-    return Host.query.filter(and_(*[Host.account == current_identity.account_number, or_(*filter_list)]))
+    return Host.query.filter(and_(*[Host.account == account_number, or_(*filter_list)]))
 
 
-def _find_hosts_by_display_name(display_name):
+def _find_hosts_by_display_name(account_number, display_name):
     logger.debug("find_hosts_by_display_name(%s)", display_name)
-    return Host.query.filter(
-        and_(Host.account == current_identity.account_number, Host.display_name.comparator.contains(display_name))
-    )
+    return Host.query.filter(and_(Host.account == account_number, _contains(Host.display_name, display_name)))
+
+
+def _contains(column, value):
+    # A case-insensitive substring match, served by the column's trigram index.
+    return column.ilike(f"%{value}%")
+
+
+def _can_be_uuid(value):
+    try:
+        UUID(value)
+    except ValueError:
+        return False
+    else:
+        return True
@@ -2,6 +2,7 @@ from uuid import UUID
 
 from app.logging import get_logger
 from app.serialization import deserialize_host_xjoin as deserialize_host
+from app.utils import SystemProfileFilter
 from app.utils import Tag
 from app.xjoin import check_pagination
 from app.xjoin import graphql_query
@@ -49,6 +50,7 @@ QUERY = """query Query(
 }"""
 ORDER_BY_MAPPING = {None: "modified_on", "updated": "modified_on", "display_name": "display_name"}
 ORDER_HOW_MAPPING = {"modified_on": "DESC", "display_name": "ASC"}
+SYSTEM_PROFILE_OPERATOR_MAPPING = {"=": "eq", ">": "gt", ">=": "gte", "<": "lt", "<=": "lte"}
 
 
 def build_tag_query_dict_tuple(tags):
@@ -63,6 +65,21 @@ def build_tag_query_dict_tuple(tags):
     return query_tag_tuple
 
 
+def build_system_profile_filter_tuple(system_profile):
+    system_profile_filter_tuple = ()
+    for string_filter in system_profile:
+        system_profile_filter = SystemProfileFilter.from_string(string_filter)
+        if system_profile_filter.field_type is bool:
+            field_filter = {"is": system_profile_filter.value}
+        else:
+            field_filter = {
+                SYSTEM_PROFILE_OPERATOR_MAPPING[system_profile_filter.operator]: system_profile_filter.value
+            }
+        system_profile_filter_tuple += ({f"spf_{system_profile_filter.field}": field_filter},)
+    logger.debug("system_profile_filter_tuple: %s", system_profile_filter_tuple)
+    return system_profile_filter_tuple
+
+
 def get_host_list(
     display_name,
     fqdn,
@@ -75,6 +92,7 @@ def get_host_list(
     param_order_how,
     staleness,
     registered_with,
+    system_profile,
 ):
     limit, offset = pagination_params(page, per_page)
     xjoin_order_by, xjoin_order_how = _params_to_order(param_order_by, param_order_how)
@@ -84,7 +102,9 @@ def get_host_list(
         "offset": offset,
         "order_by": xjoin_order_by,
         "order_how": xjoin_order_how,
-        "filter": _query_filters(fqdn, display_name, hostname_or_id, insights_id, tags, staleness, registered_with),
+        "filter": _query_filters(
+            fqdn, display_name, hostname_or_id, insights_id, tags, staleness, registered_with, system_profile
+        ),
     }
     response = graphql_query(QUERY, variables)["hosts"]
 
@@ -106,7 +126,7 @@ def _params_to_order(param_order_by=None, param_order_how=None):
     return xjoin_order_by, xjoin_order_how
 
 
-def _query_filters(fqdn, display_name, hostname_or_id, insights_id, tags, staleness, registered_with):
+def _query_filters(fqdn, display_name, hostname_or_id, insights_id, tags, staleness, registered_with, system_profile):
     if fqdn:
         query_filters = ({"fqdn": {"eq": fqdn}},)
     elif display_name:
@@ -135,6 +155,8 @@ def _query_filters(fqdn, display_name, hostname_or_id, insights_id, tags, stalen
         query_filters += ({"OR": staleness_filters},)
     if registered_with:
         query_filters += ({"NOT": {"insights_id": {"eq": None}}},)
+    if system_profile:
+        query_filters += build_system_profile_filter_tuple(system_profile)
 
     logger.debug(query_filters)
     return query_filters
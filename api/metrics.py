@@ -1,4 +1,5 @@
 from prometheus_client import Counter
+from prometheus_client import Histogram
 from prometheus_client import Summary
 
 api_request_time = Summary("inventory_request_processing_seconds", "Time spent processing request")
@@ -10,3 +11,47 @@ tags_ignored_from_http_count = Counter(
 rest_post_request_count = Counter(
     "rest_post_request_count", "The number of times a REST POST request has been recieved", ["reporter"]
 )
+host_fragment_cache_hit_count = Counter(
+    "inventory_host_fragment_cache_hit_count", "The number of hosts served from the serialized host cache"
+)
+host_fragment_cache_miss_count = Counter(
+    "inventory_host_fragment_cache_miss_count", "The number of hosts serialized because they were not cached"
+)
+read_replica_fallback_count = Counter(
+    "inventory_read_replica_fallback_count",
+    "The number of read only API requests served by the primary, because the read replica lags behind",
+)
+read_replica_recent_write_count = Counter(
+    "inventory_read_replica_recent_write_count",
+    "The number of read only API requests served by the primary, because their account wrote recently",
+)
+xjoin_request_time = Summary("inventory_xjoin_request_seconds", "Time spent querying xjoin-search, with the retries")
+xjoin_request_count = Counter(
+    "inventory_xjoin_request_count", "The number of xjoin-search queries by their outcome", ["outcome"]
+)
+xjoin_fallback_count = Counter(
+    "inventory_xjoin_fallback_count",
+    "The number of bulk API requests served by the database, because xjoin-search is unavailable",
+)
+bulk_query_time = Histogram(
+    "inventory_bulk_query_seconds",
+    "Time spent on the bulk queries by their source, resource and used filters",
+    ["source", "resource", "filters"],
+)
+bulk_query_shadow_time = Histogram(
+    "inventory_bulk_query_shadow_seconds",
+    "Time spent on the shadow reads of the bulk queries by their source, resource and used filters",
+    ["source", "resource", "filters"],
+)
+bulk_query_shadow_read_count = Counter(
+    "inventory_bulk_query_shadow_read_count",
+    "The number of bulk queries run also on the other source, by whether their results matched",
+    ["resource", "outcome"],
+)
+xjoin_query_cache_hit_count = Counter(
+    "inventory_xjoin_query_cache_hit_count",
+    "The number of xjoin-search queries answered by a cached result or by an identical running query",
+)
+xjoin_query_cache_miss_count = Counter(
+    "inventory_xjoin_query_cache_miss_count", "The number of xjoin-search queries sent to xjoin-search"
+)
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from random import random
+from threading import BoundedSemaphore
+
+import flask
+
+from api.metrics import bulk_query_shadow_read_count
+from api.metrics import bulk_query_shadow_time
+from api.metrics import bulk_query_time
+from app.logging import get_logger
+from app.logging import threadctx
+from app.models import use_read_replica
+
+__all__ = ("bulk_query_filters", "ShadowReader", "timed_bulk_query")
+
+logger = get_logger(__name__)
+
+
+def bulk_query_filters(**filters):
+    """
+    Names the shape of the filters of a bulk query: the used ones, not their values, which would make too many
+    metric labels.
+    """
+    return ",".join(sorted(name for name, value in filters.items() if value)) or "none"
+
+
+def timed_bulk_query(source, resource, filters):
+    return bulk_query_time.labels(source.name, resource, filters).time()
+
+
+class ShadowReader:
+    """
+    Runs a sample of the bulk queries also on the source that did not serve them and compares the results.
+    The shadow queries run one at a time in a background thread, after the response is built. If too many of
+    them are pending, the new ones are dropped. Their time is measured apart from the served queries, and their
+    xjoin-search failures do not open the circuit of the served ones.
+    """
+
+    def __init__(self, sample_rate, max_pending):
+        self._sample_rate = sample_rate
+        self._pending = BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-read")
+
+    def sampled(self):
+        return self._sample_rate > 0 and random() < self._sample_rate
+
+    def submit(self, resource, source, filters, served_result, query):
+        """
+        Runs the query on the shadow source. Both its result and the served one are a tuple of the items, which
+        are compared in their order, and the total.
+        """
+        if not self._pending.acquire(blocking=False):
+            bulk_query_shadow_read_count.labels(resource, "dropped").inc()
+            return None
+
+        shadow_read = partial(_shadow_read, resource, source, filters, served_result, query)
+        future = self._executor.submit(_in_request_context_copy(shadow_read))
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _shadow_read(resource, source, filters, served_result, query):
+    try:
+        with bulk_query_shadow_time.labels(source.name, resource, filters).time():
+            items, total = query()
+            items = list(items)
+    except Exception:
+        logger.exception("Shadow read of %s from %s failed.", resource, source.name)
+        outcome = "error"
+    else:
+        served_items, served_total = served_result
+        if total != served_total:
+            outcome = "total_mismatch"
+        elif items != served_items:
+            outcome = "results_mismatch"
+        else:
+            outcome = "match"
+
+    if outcome.endswith("mismatch"):
+        logger.info("Shadow read of %s from %s: %s for filters %s.", resource, source.name, outcome, filters)
+    bulk_query_shadow_read_count.labels(resource, outcome).inc()
+
+
+def _in_request_context_copy(function):
+    request_context = flask._request_ctx_stack.top
+    request_context_copy = request_context.copy()
+    # Connexion keeps the identity in the request context, not in the request.
+    request_context_copy.connexion_context = request_context.connexion_context
+    read_replica = flask.g.get("read_replica", False)
+    request_id = threadctx.request_id
+
+    def _function():
+        threadctx.request_id = request_id
+        with request_context_copy:
+            use_read_replica(read_replica)
+            flask.g.shadow_read = True
+            function()
+
+    return _function
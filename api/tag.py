@@ -1,4 +1,5 @@
 import re
+from functools import partial
 
 import flask
 
@@ -6,14 +7,20 @@ from api import api_operation
 from api import build_collection_response
 from api import flask_json_response
 from api import metrics
+from api import read_only_operation
 from api.host import get_bulk_query_source
+from api.host import xjoin_fallback_source
 from api.host_query_xjoin import build_tag_query_dict_tuple
+from api.shadow_read import bulk_query_filters
+from api.shadow_read import timed_bulk_query
+from api.tag_query_db import get_tag_list as get_tag_list_db
 from app.config import BulkQuerySource
 from app.logging import get_logger
 from app.xjoin import check_pagination
 from app.xjoin import graphql_query
 from app.xjoin import pagination_params
 from app.xjoin import staleness_filter
+from app.xjoin_client import XjoinUnavailableError
 
 logger = get_logger(__name__)
 
@@ -53,6 +60,7 @@ def xjoin_enabled():
 
 
 @api_operation
+@read_only_operation
 @metrics.api_request_time.time()
 def get_tags(
     search=None,
@@ -64,9 +72,27 @@ def get_tags(
     staleness=None,
     registered_with=None,
 ):
-    if not xjoin_enabled():
-        flask.abort(503)
-
+    bulk_query_source = BulkQuerySource.xjoin if xjoin_enabled() else BulkQuerySource.db
+    filters = bulk_query_filters(search=search, tags=tags, staleness=staleness, registered_with=registered_with)
+    query_args = (search, tags, order_by, order_how, page, per_page, staleness, registered_with)
+    try:
+        with timed_bulk_query(bulk_query_source, "tags", filters):
+            tag_list, total = TAG_LIST_QUERIES[bulk_query_source](*query_args)
+    except XjoinUnavailableError:
+        bulk_query_source = xjoin_fallback_source()
+        with timed_bulk_query(bulk_query_source, "tags", filters):
+            tag_list, total = TAG_LIST_QUERIES[bulk_query_source](*query_args)
+
+    shadow_reader = flask.current_app.shadow_reader
+    if shadow_reader.sampled():
+        shadow_source = SHADOW_SOURCES[bulk_query_source]
+        shadow_query = partial(TAG_LIST_QUERIES[shadow_source], *query_args)
+        shadow_reader.submit("tags", shadow_source, filters, (tag_list, total), shadow_query)
+
+    return flask_json_response(build_collection_response(tag_list, page, per_page, total))
+
+
+def get_tag_list_xjoin(search, tags, order_by, order_how, page, per_page, staleness, registered_with):
     limit, offset = pagination_params(page, per_page)
 
     variables = {
@@ -97,4 +123,8 @@ def get_tags(
 
     check_pagination(offset, data["meta"]["total"])
 
-    return flask_json_response(build_collection_response(data["data"], page, per_page, data["meta"]["total"]))
+    return data["data"], data["meta"]["total"]
+
+
+TAG_LIST_QUERIES = {BulkQuerySource.db: get_tag_list_db, BulkQuerySource.xjoin: get_tag_list_xjoin}
+SHADOW_SOURCES = {BulkQuerySource.db: BulkQuerySource.xjoin, BulkQuerySource.xjoin: BulkQuerySource.db}
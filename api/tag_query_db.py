@@ -0,0 +1,126 @@
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import column
+from sqlalchemy import false
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy import String
+from sqlalchemy import text
+from sqlalchemy import true
+
+from api.host_query_db import host_list_query
+from app.auth import current_identity
+from app.logging import get_logger
+from app.models import AccountTag
+from app.models import db
+from app.models import Host
+from app.utils import Tag
+from lib.host_repository import staleness_filter
+
+__all__ = ("get_tag_list",)
+
+logger = get_logger(__name__)
+
+
+def get_tag_list(
+    search=None, tags=None, order_by=None, order_how=None, page=1, per_page=100, staleness=None, registered_with=None
+):
+    account_number = current_identity.account_number
+
+    if tags or registered_with:
+        # Filtering by host attributes other than staleness, the tags of the matching hosts are counted.
+        host_query = host_list_query(account_number, tags=tags, staleness=staleness, registered_with=registered_with)
+        tag_counts = _count_host_tags(host_query).subquery()
+    else:
+        tag_counts = _count_account_tags(account_number, staleness)
+
+    query = db.session.query(tag_counts).filter(tag_counts.c.count > 0)
+
+    if search:
+        query = query.filter(_search_filter(tag_counts, search))
+
+    query = query.order_by(*_order_by(tag_counts, order_by, order_how))
+    query_results = query.paginate(page, per_page, True)
+
+    logger.debug("Found tags: %s", query_results.items)
+
+    return [_serialize_tag_count(row) for row in query_results.items], query_results.total
+
+
+def _host_tag_rows():
+    return (
+        text("SELECT * FROM host_tag_rows(hosts.tags)")
+        .columns(column("namespace", String), column("key", String), column("value", String))
+        .lateral("host_tags")
+    )
+
+
+def _count_host_tags(host_query):
+    host_tags = _host_tag_rows()
+    return (
+        host_query.join(host_tags, true())
+        .with_entities(host_tags.c.namespace, host_tags.c.key, host_tags.c.value, func.count(Host.id).label("count"))
+        .group_by(host_tags.c.namespace, host_tags.c.key, host_tags.c.value)
+    )
+
+
+def _count_account_tags(account_number, staleness):
+    """
+    The account tags table counts all hosts of the account. The tags of the hosts not matching the
+    staleness are subtracted. These are the stale_warning and culled hosts by default, usually few.
+    """
+    excluded_hosts = Host.query.filter(Host.account == account_number)
+    if staleness:
+        excluded_hosts = excluded_hosts.filter(~func.coalesce(staleness_filter(staleness), false()))
+    else:
+        excluded_hosts = excluded_hosts.filter(false())
+    excluded_counts = _count_host_tags(excluded_hosts).subquery()
+
+    # A tag without a value has a null value, as in the host tag rows.
+    value = case([(AccountTag.has_value, AccountTag.value)])
+    return (
+        db.session.query(
+            AccountTag.namespace,
+            AccountTag.key,
+            value.label("value"),
+            (AccountTag.host_count - func.coalesce(excluded_counts.c.count, 0)).label("count"),
+        )
+        .outerjoin(
+            excluded_counts,
+            and_(
+                AccountTag.namespace == excluded_counts.c.namespace,
+                AccountTag.key == excluded_counts.c.key,
+                value.isnot_distinct_from(excluded_counts.c.value),
+            ),
+        )
+        .filter(AccountTag.account == account_number)
+        .subquery()
+    )
+
+
+def _search_filter(tag_counts, search):
+    namespace = func.nullif(func.nullif(tag_counts.c.namespace, "null"), "")
+    return or_(
+        namespace.contains(search, autoescape=True),
+        tag_counts.c.key.contains(search, autoescape=True),
+        tag_counts.c.value.contains(search, autoescape=True),
+    )
+
+
+def _order_by(tag_counts, order_by, order_how):
+    tag_columns = (tag_counts.c.namespace, tag_counts.c.key, tag_counts.c.value)
+    if order_by == "count":
+        ordered_columns = (tag_counts.c.count,) + tag_columns
+    else:
+        ordered_columns = tag_columns
+
+    # A tag without a value goes before the values of its key.
+    if order_how == "DESC":
+        return tuple(ordered_column.desc().nullslast() for ordered_column in ordered_columns)
+    else:
+        return tuple(ordered_column.asc().nullsfirst() for ordered_column in ordered_columns)
+
+
+def _serialize_tag_count(row):
+    tag = {"namespace": Tag.serialize_namespace(row.namespace), "key": row.key, "value": row.value}
+    return {"tag": tag, "count": row.count}
@@ -1,35 +1,29 @@
 import atexit
 from os.path import join
 
-import connexion
-from connexion.resolver import RestyResolver
 from flask import current_app
 from flask import jsonify
 from flask import request
-from prance import ResolvingParser
-from prance.util.resolver import RESOLVE_FILES
-from prometheus_flask_exporter import PrometheusMetrics
 
-from api.mgmt import monitoring_blueprint
 from app import payload_tracker
 from app.config import Config
-from app.exceptions import InventoryException
 from app.logging import configure_logging
 from app.logging import get_logger
 from app.logging import threadctx
 from app.models import db
+from app.models import REPLICA_BIND
 from app.queue.event_producer import EventProducer
 from app.queue.event_producer import Topic
 from app.queue.events import EventType
 from app.queue.metrics import event_producer_failure
 from app.queue.metrics import event_producer_success
-from app.validators import verify_uuid_format  # noqa: 401
 
 logger = get_logger(__name__)
 
 IDENTITY_HEADER = "x-rh-identity"
 REQUEST_ID_HEADER = "x-rh-insights-request-id"
 UNKNOWN_REQUEST_ID_VALUE = "-1"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
 
 SPECIFICATION_DIR = "./swagger/"
 SPECIFICATION_FILE = join(SPECIFICATION_DIR, "api.spec.yaml")
@@ -59,6 +53,24 @@ def inventory_config():
 
 
 def create_app(runtime_environment):
+    # The API modules are imported only by the API application, the jobs and the commands import this package
+    # for its models and configuration without them.
+    import connexion
+    from connexion.resolver import RestyResolver
+    from prometheus_flask_exporter import PrometheusMetrics
+
+    from api.mgmt import monitoring_blueprint
+    from api.shadow_read import ShadowReader
+    from app.exceptions import InventoryException
+    from app.fragment_cache import FragmentCache
+    from app.query_cache import QueryResultCache
+    from app.replica import create_lag_check_engine
+    from app.replica import RecentWrites
+    from app.replica import ReplicaLagMonitor
+    from app.specification import resolved_specification
+    from app.validators import verify_uuid_format  # noqa: 401
+    from app.xjoin_client import XjoinClient
+
     connexion_options = {"swagger_ui": True}
     # This feels like a hack but it is needed.  The logging configuration
     # needs to be setup before the flask app is initialized.
@@ -69,14 +81,13 @@ def create_app(runtime_environment):
 
     connexion_app = connexion.App("inventory", specification_dir="./swagger/", options=connexion_options)
 
-    # Read the swagger.yml file to configure the endpoints
-    parser = ResolvingParser(SPECIFICATION_FILE, resolve_types=RESOLVE_FILES)
-    parser.parse()
+    # Read the swagger.yml file to configure the endpoints, the same specification for all the API URLs
+    specification = resolved_specification(SPECIFICATION_FILE, app_config.specification_cache_dir)
 
     for api_url in app_config.api_urls:
         if api_url:
             connexion_app.add_api(
-                parser.specification,
+                specification,
                 arguments={"title": "RestyResolver Example"},
                 resolver=RestyResolver("api"),
                 validate_responses=True,
@@ -96,6 +107,8 @@ def create_app(runtime_environment):
     flask_app.config["SQLALCHEMY_DATABASE_URI"] = app_config.db_uri
     flask_app.config["SQLALCHEMY_POOL_SIZE"] = app_config.db_pool_size
     flask_app.config["SQLALCHEMY_POOL_TIMEOUT"] = app_config.db_pool_timeout
+    if app_config.db_replica_uri:
+        flask_app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: app_config.db_replica_uri}
 
     flask_app.config["INVENTORY_CONFIG"] = app_config
 
@@ -103,12 +116,47 @@ def create_app(runtime_environment):
 
     atexit.register(shutdown_hook, db.get_engine(flask_app).dispose, "Database")
 
+    if app_config.db_replica_uri:
+        replica_engine = db.get_engine(flask_app, bind=REPLICA_BIND)
+        atexit.register(shutdown_hook, replica_engine.dispose, "Read replica database")
+        lag_check_engine = create_lag_check_engine(app_config.db_replica_uri, app_config.db_replica_lag_check_timeout)
+        flask_app.replica_lag_monitor = ReplicaLagMonitor(
+            lag_check_engine, app_config.db_replica_max_lag, app_config.db_replica_lag_check_interval
+        )
+        atexit.register(shutdown_hook, lag_check_engine.dispose, "Read replica lag check")
+        # The lag can grow beyond the maximum until the next check, the replica replays a write by then.
+        flask_app.replica_recent_writes = RecentWrites(
+            app_config.db_replica_max_lag + app_config.db_replica_lag_check_interval
+        )
+    else:
+        flask_app.replica_lag_monitor = None
+        flask_app.replica_recent_writes = None
+
+    flask_app.host_fragment_cache = FragmentCache(app_config.host_fragment_cache_size)
+
+    # Every worker process opens its own connections, the pool is filled only by the first queries.
+    flask_app.xjoin_client = XjoinClient(app_config)
+    atexit.register(shutdown_hook, flask_app.xjoin_client.session.close, "xjoin-search client")
+    flask_app.xjoin_query_cache = QueryResultCache(app_config.xjoin_query_cache_size, app_config.xjoin_query_cache_ttl)
+
+    flask_app.shadow_reader = ShadowReader(
+        app_config.bulk_query_shadow_sample_rate, app_config.bulk_query_shadow_max_pending
+    )
+    atexit.register(shutdown_hook, flask_app.shadow_reader.shutdown, "Shadow reader")
+
     flask_app.register_blueprint(monitoring_blueprint, url_prefix=app_config.mgmt_url_path_prefix)
 
     @flask_app.before_request
     def set_request_id():
         threadctx.request_id = request.headers.get(REQUEST_ID_HEADER, UNKNOWN_REQUEST_ID_VALUE)
 
+    @flask_app.after_request
+    def record_replica_write(response):
+        # Every API operation authenticates, the identity keeps the account in the thread context.
+        if flask_app.replica_recent_writes and request.method not in SAFE_METHODS and response.status_code < 400:
+            flask_app.replica_recent_writes.record(threadctx.account_number)
+        return response
+
     if runtime_environment.event_producer_enabled:
         flask_app.event_producer = EventProducer(app_config)
         atexit.register(shutdown_hook, flask_app.event_producer.close, "EventProducer")
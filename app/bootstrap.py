@@ -0,0 +1,39 @@
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import Config
+from app.models import db
+
+__all__ = ("create_job_app", "init_config", "init_db")
+
+
+def init_config(runtime_environment):
+    """
+    Returns the configuration of a job or a command. Unlike create_app, it does not create the API application:
+    neither Connexion nor the API specification are loaded.
+    """
+    config = Config(runtime_environment)
+    config.log_configuration()
+    return config
+
+
+def init_db(config):
+    """
+    Returns a session factory bound to the inventory database. The sessions do not need an application context.
+    """
+    engine = create_engine(config.db_uri)
+    return sessionmaker(bind=engine)
+
+
+def create_job_app(config):
+    """
+    Returns a bare Flask application with only the database and the configuration, for the jobs reusing the
+    queries made through the application context, e.g. Host.query.
+    """
+    flask_app = Flask("inventory-job")
+    flask_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    flask_app.config["SQLALCHEMY_DATABASE_URI"] = config.db_uri
+    flask_app.config["INVENTORY_CONFIG"] = config
+    db.init_app(flask_app)
+    return flask_app
@@ -0,0 +1,57 @@
+from threading import Lock
+from time import monotonic
+
+from app.logging import get_logger
+
+__all__ = ("CircuitBreaker",)
+
+logger = get_logger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service. Once the failures in a row reach the threshold, the circuit opens and the
+    calls are rejected without being made. After the reset timeout, a single trial call is let through: its
+    success closes the circuit, its failure opens it again for another reset timeout.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self._name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = Lock()
+
+    def is_open(self):
+        with self._lock:
+            return self._rejects(monotonic())
+
+    def allow_request(self):
+        with self._lock:
+            now = monotonic()
+            if self._rejects(now):
+                return False
+
+            if self._opened_at is not None:
+                # The trial call. The others are rejected until it fails or the reset timeout passes again.
+                self._opened_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Circuit of %s closed.", self._name)
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self._failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Circuit of %s opened after %s failures.", self._name, self._failures)
+                self._opened_at = monotonic()
+
+    def _rejects(self, now):
+        return self._opened_at is not None and now - self._opened_at < self._reset_timeout
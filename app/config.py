@@ -21,12 +21,21 @@ class Config:
         self._db_name = os.getenv("INVENTORY_DB_NAME", "insights")
         self._db_ssl_mode = os.getenv("INVENTORY_DB_SSL_MODE", "")
         self._db_ssl_cert = os.getenv("INVENTORY_DB_SSL_CERT", "")
+        self._db_replica_host = os.getenv("INVENTORY_DB_REPLICA_HOST", "")
 
         self.db_pool_timeout = int(os.getenv("INVENTORY_DB_POOL_TIMEOUT", "5"))
         self.db_pool_size = int(os.getenv("INVENTORY_DB_POOL_SIZE", "5"))
 
         self.db_uri = self._build_db_uri(self._db_ssl_mode)
 
+        # The read replica is optional, the read only API operations use it if it is configured.
+        self.db_replica_uri = (
+            self._build_db_uri(self._db_ssl_mode, db_host=self._db_replica_host) if self._db_replica_host else None
+        )
+        self.db_replica_max_lag = int(os.getenv("INVENTORY_DB_REPLICA_MAX_LAG_SECONDS", "30"))
+        self.db_replica_lag_check_interval = int(os.getenv("INVENTORY_DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS", "10"))
+        self.db_replica_lag_check_timeout = int(os.getenv("INVENTORY_DB_REPLICA_LAG_CHECK_TIMEOUT_SECONDS", "2"))
+
         self.base_url_path = self._build_base_url_path()
         self.api_url_path_prefix = self._build_api_path()
         self.legacy_api_url_path_prefix = os.getenv("INVENTORY_LEGACY_API_URL", "")
@@ -70,9 +79,39 @@ class Config:
         self.culling_culled_offset_days = int(os.environ.get("CULLING_CULLED_OFFSET_DAYS", "14"))
 
         self.xjoin_graphql_url = os.environ.get("XJOIN_GRAPHQL_URL", "http://localhost:4000/graphql")
+        self.xjoin_pool_size = int(os.environ.get("XJOIN_POOL_SIZE", "10"))
+        self.xjoin_connect_timeout = float(os.environ.get("XJOIN_CONNECT_TIMEOUT_SECONDS", "1"))
+        self.xjoin_read_timeout = float(os.environ.get("XJOIN_READ_TIMEOUT_SECONDS", "10"))
+        self.xjoin_retries = int(os.environ.get("XJOIN_RETRIES", "2"))
+        self.xjoin_retry_backoff = float(os.environ.get("XJOIN_RETRY_BACKOFF_SECONDS", "0.1"))
+        self.xjoin_circuit_breaker_failures = int(os.environ.get("XJOIN_CIRCUIT_BREAKER_FAILURES", "5"))
+        self.xjoin_circuit_breaker_reset_timeout = float(
+            os.environ.get("XJOIN_CIRCUIT_BREAKER_RESET_TIMEOUT_SECONDS", "30")
+        )
+        self.xjoin_fallback_to_db = os.environ.get("XJOIN_FALLBACK_TO_DB", "true").lower() == "true"
+        self.xjoin_persisted_queries = os.environ.get("XJOIN_PERSISTED_QUERIES", "false").lower() == "true"
+        # The number of xjoin-search query results cached by each API process, 0 disables the cache.
+        self.xjoin_query_cache_size = int(os.environ.get("XJOIN_QUERY_CACHE_SIZE", "1000"))
+        self.xjoin_query_cache_ttl = float(os.environ.get("XJOIN_QUERY_CACHE_TTL_SECONDS", "5"))
         self.bulk_query_source = getattr(BulkQuerySource, os.environ.get("BULK_QUERY_SOURCE", "db"))
         self.bulk_query_source_beta = getattr(BulkQuerySource, os.environ.get("BULK_QUERY_SOURCE_BETA", "db"))
 
+        # The fraction of the bulk queries run also on the source that did not serve them, to compare the results.
+        self.bulk_query_shadow_sample_rate = float(os.environ.get("BULK_QUERY_SHADOW_SAMPLE_RATE", "0"))
+        self.bulk_query_shadow_max_pending = int(os.environ.get("BULK_QUERY_SHADOW_MAX_PENDING", "10"))
+
+        self.package_sets_enabled = os.environ.get("PACKAGE_SETS_ENABLED", "false").lower() == "true"
+
+        # The resolved API specification is cached in this directory, if set. The specification is loaded from it
+        # as it is, so only the application may write there.
+        self.specification_cache_dir = os.environ.get("SPECIFICATION_CACHE_DIR", "")
+
+        # A running host delete job without a heartbeat for this long is considered interrupted and resumed.
+        self.host_delete_job_stale_timeout = int(os.environ.get("HOST_DELETE_JOB_STALE_TIMEOUT_SECONDS", "300"))
+
+        # The number of serialized hosts cached by each API process, 0 disables the cache.
+        self.host_fragment_cache_size = int(os.environ.get("HOST_FRAGMENT_CACHE_SIZE", "10000"))
+
     def _build_base_url_path(self):
         app_name = os.getenv("APP_NAME", "inventory")
         path_prefix = os.getenv("PATH_PREFIX", "api")
@@ -85,15 +124,16 @@ class Config:
         api_path = f"{base_url_path}/{version}"
         return api_path
 
-    def _build_db_uri(self, ssl_mode, hide_password=False):
+    def _build_db_uri(self, ssl_mode, hide_password=False, db_host=None):
         db_user = self._db_user
         db_password = self._db_password
+        db_host = db_host or self._db_host
 
         if hide_password:
             db_user = "xxxx"
             db_password = "XXXX"
 
-        db_uri = f"postgresql://{db_user}:{db_password}@{self._db_host}/{self._db_name}"
+        db_uri = f"postgresql://{db_user}:{db_password}@{db_host}/{self._db_name}"
         if ssl_mode == self.SSL_VERIFY_FULL:
             db_uri += f"?sslmode={self._db_ssl_mode}&sslrootcert={self._db_ssl_cert}"
         return db_uri
@@ -108,6 +148,16 @@ class Config:
         self.logger.info("DB Name: %s", self._db_name)
         self.logger.info("DB Connection URI: %s", self._build_db_uri(self._db_ssl_mode, hide_password=True))
 
+        if self._db_replica_host:
+            self.logger.info("DB Replica Host: %s", self._db_replica_host)
+            self.logger.info(
+                "DB Replica Connection URI: %s",
+                self._build_db_uri(self._db_ssl_mode, hide_password=True, db_host=self._db_replica_host),
+            )
+            self.logger.info("DB Replica Max Lag: %s seconds", self.db_replica_max_lag)
+            self.logger.info("DB Replica Lag Check Interval: %s seconds", self.db_replica_lag_check_interval)
+            self.logger.info("DB Replica Lag Check Timeout: %s seconds", self.db_replica_lag_check_timeout)
+
         if self._db_ssl_mode == self.SSL_VERIFY_FULL:
             self.logger.info("Using SSL for DB connection:")
             self.logger.info("Postgresql SSL verification type: %s", self._db_ssl_mode)
@@ -116,6 +166,24 @@ class Config:
         if self._runtime_environment == RuntimeEnvironment.SERVER:
             self.logger.info("API URL Path: %s", self.api_url_path_prefix)
             self.logger.info("Management URL Path Prefix: %s", self.mgmt_url_path_prefix)
+            self.logger.info("Specification Cache Directory: %s", self.specification_cache_dir)
+            self.logger.info("Host Fragment Cache Size: %s", self.host_fragment_cache_size)
+            self.logger.info("xjoin-search URL: %s", self.xjoin_graphql_url)
+            self.logger.info(
+                "xjoin-search Timeouts: connect %s seconds, read %s seconds",
+                self.xjoin_connect_timeout,
+                self.xjoin_read_timeout,
+            )
+            self.logger.info("xjoin-search Retries: %s", self.xjoin_retries)
+            self.logger.info("xjoin-search Fallback to DB: %s", self.xjoin_fallback_to_db)
+            self.logger.info(
+                "xjoin-search Query Cache: size %s, TTL %s seconds",
+                self.xjoin_query_cache_size,
+                self.xjoin_query_cache_ttl,
+            )
+            self.logger.info("Bulk Query Shadow Sample Rate: %s", self.bulk_query_shadow_sample_rate)
+
+        self.logger.info("Package Sets Enabled: %s", self.package_sets_enabled)
 
         if self._runtime_environment == RuntimeEnvironment.SERVICE or self._runtime_environment.event_producer_enabled:
             self.logger.info("Kafka Bootstrap Servers: %s" % self.bootstrap_servers)
@@ -134,6 +202,9 @@ class Config:
             self.logger.info("Payload Tracker Service Name: %s", self.payload_tracker_service_name)
             self.logger.info("Payload Tracker Enabled: %s", self.payload_tracker_enabled)
 
+        if self._runtime_environment == RuntimeEnvironment.JOB:
+            self.logger.info("Host Delete Job Stale Timeout: %s seconds", self.host_delete_job_stale_timeout)
+
         if self._runtime_environment.metrics_pushgateway_enabled:
             self.logger.info("Metrics Pushgateway: %s", self.prometheus_pushgateway)
             self.logger.info("Kubernetes Namespace: %s", self.kubernetes_namespace)
@@ -3,7 +3,7 @@ from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
 
-__all__ = ("Conditions", "staleness_to_conditions", "Timestamps")
+__all__ = ("Conditions", "staleness_to_conditions", "staleness_to_ranges", "Timestamps")
 
 
 class _Config(namedtuple("_Config", ("stale_warning_offset_days", "culled_offset_days"))):
@@ -67,7 +67,30 @@ class Conditions(_WithConfig):
         return self.now - offset
 
 
-def staleness_to_conditions(config, staleness, timestamp_filter_func):
+# Each state's stale timestamp range ends where the previous one's starts.
+STATES_FROM_NEWEST = ("fresh", "stale", "stale_warning", "culled")
+
+
+def staleness_to_ranges(config, staleness):
+    """
+    Converts the staleness states to the minimal list of (gt, lte) stale timestamp ranges, newest
+    first. The ranges of adjacent states are merged into one, e.g. fresh, stale and stale_warning
+    become everything newer than the culled timestamp. The unknown state has no range.
+    """
     condition = Conditions.from_config(config)
-    filtered_states = (state for state in staleness if state not in ("unknown",))
-    return (timestamp_filter_func(*getattr(condition, state)()) for state in filtered_states)
+    ranges = []
+    previous_state_included = False
+    for state in STATES_FROM_NEWEST:
+        state_included = state in staleness
+        if state_included:
+            gt, lte = getattr(condition, state)()
+            if previous_state_included:
+                ranges[-1] = (gt, ranges[-1][1])
+            else:
+                ranges.append((gt, lte))
+        previous_state_included = state_included
+    return ranges
+
+
+def staleness_to_conditions(config, staleness, timestamp_filter_func):
+    return (timestamp_filter_func(gt, lte) for gt, lte in staleness_to_ranges(config, staleness))
@@ -0,0 +1,37 @@
+from collections import OrderedDict
+from threading import Lock
+
+__all__ = ("FragmentCache",)
+
+
+class FragmentCache:
+    """
+    A bounded, process-local cache of serialized JSON fragments. When full, the least recently used
+    fragment is evicted. A cache of no size stores nothing. Any object with the same get and set methods,
+    e.g. one backed by a shared store, can be used instead.
+    """
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._fragments = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+            return fragment
+
+    def set(self, key, fragment):
+        if not self._max_size:
+            return
+
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            if len(self._fragments) > self._max_size:
+                self._fragments.popitem(last=False)
+
+    def __len__(self):
+        return len(self._fragments)
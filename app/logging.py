@@ -4,8 +4,6 @@ from logging import NullHandler
 from threading import local
 
 import logstash_formatter
-import watchtower
-from boto3.session import Session
 from gunicorn import glogging
 from yaml import safe_load
 
@@ -41,6 +39,10 @@ def cloudwatch_handler():
         aws_log_group = os.getenv("AWS_LOG_GROUP", "platform")
         aws_log_stream = os.getenv("AWS_LOG_STREAM", _get_hostname())
         create_log_group = str(os.getenv("AWS_CREATE_LOG_GROUP")).lower() == "true"
+        # Only imported when configured, boto3 takes long to import.
+        import watchtower
+        from boto3.session import Session
+
         print(f"Configuring watchtower logging (log_group={aws_log_group}, stream_name={aws_log_stream})")
         boto3_session = Session(
             aws_access_key_id=aws_access_key_id,
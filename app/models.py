@@ -1,13 +1,21 @@
+import hashlib
+import json
 import uuid
 from datetime import datetime
 from datetime import timezone
+from enum import Enum
 
+from flask import g
+from flask import has_app_context
+from flask_sqlalchemy import SignallingSession
 from flask_sqlalchemy import SQLAlchemy
 from marshmallow import fields
 from marshmallow import Schema
 from marshmallow import validate
 from marshmallow import validates
 from marshmallow import ValidationError
+from sqlalchemy import DDL
+from sqlalchemy import event
 from sqlalchemy import Index
 from sqlalchemy import orm
 from sqlalchemy import text
@@ -23,12 +31,50 @@ from app.validators import verify_uuid_format
 
 logger = get_logger(__name__)
 
-db = SQLAlchemy()
+# The bind of the read replica database, used by the read only operations selecting it by use_read_replica.
+REPLICA_BIND = "replica"
+
+
+class _RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_app_context() and g.get("read_replica"):
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class _SQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=_RoutingSession, db=self, **options)
+
+
+db = _SQLAlchemy()
+
+
+def use_read_replica(enabled):
+    """
+    Routes the queries of the current application context to the read replica or back to the primary.
+    """
+    g.read_replica = enabled
+
 
 TAG_NAMESPACE_VALIDATION = validate.Length(max=255)
 TAG_KEY_VALIDATION = validate.Length(min=1, max=255)
 TAG_VALUE_VALIDATION = validate.Length(max=255)
 
+# System profile list fields stored as package sets when enabled. Such a field is then a reference to the
+# package set instead of the list: {"package_set": "<sha256 hash>"}.
+PACKAGE_SET_FIELDS = ("installed_packages", "installed_services", "enabled_services")
+PACKAGE_SET_REFERENCE = "package_set"
+
+# The hosts table is hash partitioned by account, so the queries of an account scan only its partition.
+HOST_PARTITIONS = 16
+
+HostDeleteJobStatus = Enum("HostDeleteJobStatus", ("pending", "running", "finished", "failed"))
+
 
 def _set_display_name_on_save(context):
     """
@@ -53,11 +99,55 @@ class Host(db.Model):
         Index("idxinsightsid", text("(canonical_facts ->> 'insights_id')")),
         Index("idxgincanonicalfacts", "canonical_facts"),
         Index("idxaccount", "account"),
+        Index("idxaccountstaletimestamp", "account", "stale_timestamp"),
+        Index("idxsystemprofilearch", "account", text("(system_profile_facts ->> 'arch')")),
+        Index("idxsystemprofileosrelease", "account", text("(system_profile_facts ->> 'os_release')")),
+        Index(
+            "idxsystemprofileinfrastructuretype", "account", text("(system_profile_facts ->> 'infrastructure_type')")
+        ),
+        Index("idxsystemprofilecloudprovider", "account", text("(system_profile_facts ->> 'cloud_provider')")),
+        Index(
+            "idxsystemprofilenumberofcpus",
+            "account",
+            text("(CAST(system_profile_facts ->> 'number_of_cpus' AS INTEGER))"),
+        ),
+        Index(
+            "idxsystemprofilesapsystem", "account", text("(CAST(system_profile_facts ->> 'sap_system' AS BOOLEAN))")
+        ),
         Index("hosts_subscription_manager_id_index", text("(canonical_facts ->> 'subscription_manager_id')")),
+        Index("idxfqdn", text("(canonical_facts ->> 'fqdn')")),
+        Index(
+            "idxgintrgmdisplayname",
+            "display_name",
+            postgresql_using="gin",
+            postgresql_ops={"display_name": "gin_trgm_ops"},
+        ),
+        Index("idxgintrgmfqdn", text("(canonical_facts ->> 'fqdn') gin_trgm_ops"), postgresql_using="gin"),
+        Index("idxgintags", "tags", postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"}),
+        Index(
+            "idxgininstalledpackages",
+            text("(system_profile_facts -> 'installed_packages') jsonb_path_ops"),
+            postgresql_using="gin",
+        ),
+        Index(
+            "idxgininstalledservices",
+            text("(system_profile_facts -> 'installed_services') jsonb_path_ops"),
+            postgresql_using="gin",
+        ),
+        Index(
+            "idxginenabledservices",
+            text("(system_profile_facts -> 'enabled_services') jsonb_path_ops"),
+            postgresql_using="gin",
+        ),
+        Index("idxinstalledpackagesset", text("((system_profile_facts -> 'installed_packages') ->> 'package_set')")),
+        Index("idxinstalledservicesset", text("((system_profile_facts -> 'installed_services') ->> 'package_set')")),
+        Index("idxenabledservicesset", text("((system_profile_facts -> 'enabled_services') ->> 'package_set')")),
+        {"postgresql_partition_by": "HASH (account)"},
     )
 
+    # The partition key must be a part of the primary key.
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    account = db.Column(db.String(10))
+    account = db.Column(db.String(10), primary_key=True)
     display_name = db.Column(db.String(200), default=_set_display_name_on_save)
     ansible_host = db.Column(db.String(255))
     created_on = db.Column(db.DateTime(timezone=True), default=_time_now)
@@ -130,16 +220,6 @@ class Host(db.Model):
 
         self._update_stale_timestamp(input_host.stale_timestamp, input_host.reporter)
 
-    def patch(self, patch_data):
-        logger.debug("patching host (id=%s) with data: %s", self.id, patch_data)
-
-        if not patch_data:
-            raise InventoryException(title="Bad Request", detail="Patch json document cannot be empty.")
-
-        self._update_ansible_host(patch_data.get("ansible_host"))
-
-        self.update_display_name(patch_data.get("display_name"))
-
     def _update_ansible_host(self, ansible_host):
         if ansible_host is not None:
             # Allow a user to clear out the ansible host with an empty string
@@ -238,6 +318,245 @@ class Host(db.Model):
         )
 
 
+def _create_host_partitions(table, connection, **kwargs):
+    """
+    Creates the partitions of the hosts table for db.create_all, the migrations create them for a deployed
+    database. Every partition is created with its own copy of the indexes, named after the parent ones,
+    and then attached. The parent indexes adopt these instead of creating new ones with generated names.
+    """
+    for remainder in range(HOST_PARTITIONS):
+        partition = table.tometadata(db.MetaData(), name=f"{table.name}_p{remainder}")
+        partition.dialect_options["postgresql"]["partition_by"] = None
+        for index in partition.indexes:
+            index.name = f"{index.name}_p{remainder}"
+        partition.create(connection)
+        connection.execute(
+            f"ALTER TABLE {table.name} ATTACH PARTITION {partition.name} "
+            f"FOR VALUES WITH (MODULUS {HOST_PARTITIONS}, REMAINDER {remainder})"
+        )
+
+
+# The trigram indexes need the pg_trgm extension, a part of the PostgreSQL contrib modules.
+event.listen(Host.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+event.listen(Host.__table__, "after_create", _create_host_partitions)
+
+
+class HostView:
+    """
+    A read only host for the API responses, built from the selected columns or from the xjoin results.
+    Unlike a Host it is neither validated nor tracked by the session. The attributes that were not
+    selected are None.
+    """
+
+    __slots__ = (
+        "id",
+        "account",
+        "display_name",
+        "ansible_host",
+        "created_on",
+        "modified_on",
+        "facts",
+        "tags",
+        "canonical_facts",
+        "system_profile_facts",
+        "stale_timestamp",
+        "reporter",
+    )
+
+    def __init__(self, **attributes):
+        for name in self.__slots__:
+            setattr(self, name, attributes.get(name))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(**row._asdict())
+
+    def __repr__(self):
+        return (
+            f"<HostView id='{self.id}' account='{self.account}' display_name='{self.display_name}' "
+            f"canonical_facts={self.canonical_facts}>"
+        )
+
+
+class HostDeleteJob(db.Model):
+    __tablename__ = "host_delete_jobs"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    account = db.Column(db.String(10), nullable=False)
+    filters = db.Column(JSONB, nullable=False)
+    status = db.Column(db.String(10), nullable=False)
+    deleted_count = db.Column(db.Integer, nullable=False)
+    created_on = db.Column(db.DateTime(timezone=True), default=_time_now, nullable=False)
+    modified_on = db.Column(db.DateTime(timezone=True), default=_time_now, onupdate=_time_now, nullable=False)
+    # Refreshed by the running job after every deleted chunk. A running job without a recent heartbeat was
+    # interrupted, e.g. by a killed process, and is resumed.
+    heartbeat_on = db.Column(db.DateTime(timezone=True))
+    # Of the API request that created the job, the delete events of the job carry it.
+    request_id = db.Column(db.String)
+
+    def __init__(self, account, filters, request_id=None):
+        self.account = account
+        self.filters = filters
+        self.request_id = request_id
+        self.status = HostDeleteJobStatus.pending.name
+        self.deleted_count = 0
+
+    def set_status(self, status):
+        logger.debug("Host delete job (id=%s) status changed to %s", self.id, status.name)
+        self.status = status.name
+
+    def heartbeat(self):
+        self.heartbeat_on = _time_now()
+
+    def __repr__(self):
+        return f"<HostDeleteJob id='{self.id}' account='{self.account}' status='{self.status}'>"
+
+
+class PackageSet(db.Model):
+    """
+    A content-addressed list of a host system profile, e.g. the installed packages. Hosts with the same
+    list share one package set, their system profile field only references it by its hash, see
+    PACKAGE_SET_FIELDS.
+    """
+
+    __tablename__ = "package_sets"
+    __table_args__ = (
+        Index("idxginpackagesetitems", "items", postgresql_using="gin", postgresql_ops={"items": "jsonb_path_ops"}),
+    )
+
+    hash = db.Column(db.String(64), primary_key=True)
+    items = db.Column(JSONB, nullable=False)
+
+    @staticmethod
+    def hash_items(items):
+        serialized_items = json.dumps(items, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(serialized_items.encode()).hexdigest()
+
+    @staticmethod
+    def reference(hash_):
+        return {PACKAGE_SET_REFERENCE: hash_}
+
+    @staticmethod
+    def referenced_hash(value):
+        if isinstance(value, dict):
+            return value.get(PACKAGE_SET_REFERENCE)
+        else:
+            return None
+
+    def __repr__(self):
+        return f"<PackageSet hash='{self.hash}' items={len(self.items)}>"
+
+
+class AccountTag(db.Model):
+    """
+    Number of hosts of an account with the given tag. Namespaces are stored as in the host tags. A tag
+    without a value has an empty value and has_value false, so it differs from a tag with an empty string
+    value. Maintained by triggers on the hosts table, see ACCOUNT_TAGS_TRIGGERS.
+    """
+
+    __tablename__ = "account_tags"
+    __table_args__ = (Index("idx_account_tags_host_count", "account", "host_count"),)
+
+    account = db.Column(db.String(10), primary_key=True)
+    namespace = db.Column(db.String, primary_key=True)
+    key = db.Column(db.String, primary_key=True)
+    value = db.Column(db.String, primary_key=True)
+    has_value = db.Column(db.Boolean, primary_key=True)
+    host_count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<AccountTag account='{self.account}' namespace='{self.namespace}' key='{self.key}' "
+            f"value='{self.value}' has_value={self.has_value} host_count={self.host_count}>"
+        )
+
+
+# Expands host tags to one (namespace, key, value) row per tag, a tag without a value has a null value.
+HOST_TAG_ROWS_FUNCTION = """
+CREATE OR REPLACE FUNCTION host_tag_rows(tags jsonb)
+RETURNS TABLE (namespace varchar, key varchar, value varchar)
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT DISTINCT ns.key, k.key, v.value
+    FROM jsonb_each(CASE WHEN jsonb_typeof(tags) = 'object' THEN tags ELSE '{}' END) AS ns
+    CROSS JOIN LATERAL jsonb_each(CASE WHEN jsonb_typeof(ns.value) = 'object' THEN ns.value ELSE '{}' END) AS k
+    CROSS JOIN LATERAL jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(k.value) = 'array' AND jsonb_array_length(k.value) > 0 THEN k.value ELSE '[null]' END
+    ) AS v
+$$;
+"""
+
+# Adds the tags of the new hosts and subtracts the tags of the old ones. Rows are upserted in a fixed
+# order, so concurrent transactions lock them in the same order. The emptied rows are deleted only if
+# any were changed.
+_ACCOUNT_TAGS_CHANGE = """
+        INSERT INTO account_tags (account, namespace, key, value, has_value, host_count)
+        SELECT h.account, t.namespace, t.key, coalesce(t.value, ''), t.value IS NOT NULL, sum(h.change)
+        FROM ({changed_hosts}) AS h CROSS JOIN LATERAL host_tag_rows(h.tags) AS t
+        GROUP BY h.account, t.namespace, t.key, t.value
+        HAVING sum(h.change) <> 0
+        ORDER BY h.account, t.namespace, t.key, t.value
+        ON CONFLICT (account, namespace, key, value, has_value)
+        DO UPDATE SET host_count = account_tags.host_count + excluded.host_count;
+
+        GET DIAGNOSTICS changed_tags = ROW_COUNT;
+        IF changed_tags > 0 THEN
+            DELETE FROM account_tags
+            WHERE host_count <= 0 AND account IN (SELECT h.account FROM ({changed_hosts}) AS h);
+        END IF;
+"""
+_NEW_HOSTS = "SELECT account, tags, 1 AS change FROM new_hosts"
+_OLD_HOSTS = "SELECT account, tags, -1 AS change FROM old_hosts"
+# Most updates, e.g. the check-ins, do not change the tags. Only the hosts with changed tags are counted,
+# the others do not touch the account tags at all.
+_UPDATED_TAGS_HOSTS = """
+            SELECT account, tags, sum(change) AS change
+            FROM (
+                SELECT id, account, tags, 1 AS change FROM new_hosts
+                UNION ALL
+                SELECT id, account, tags, -1 AS change FROM old_hosts
+            ) AS u
+            GROUP BY id, account, tags
+            HAVING sum(change) <> 0
+"""
+
+UPDATE_ACCOUNT_TAGS_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION update_account_tags() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    changed_tags integer;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {_ACCOUNT_TAGS_CHANGE.format(changed_hosts=_NEW_HOSTS)}
+    ELSIF TG_OP = 'DELETE' THEN
+        {_ACCOUNT_TAGS_CHANGE.format(changed_hosts=_OLD_HOSTS)}
+    ELSE
+        {_ACCOUNT_TAGS_CHANGE.format(changed_hosts=_UPDATED_TAGS_HOSTS)}
+    END IF;
+    RETURN NULL;
+END
+$$;
+"""
+
+# Statement level triggers, so a bulk change of hosts updates every account tag only once.
+ACCOUNT_TAGS_TRIGGERS = """
+CREATE TRIGGER hosts_account_tags_insert AFTER INSERT ON hosts
+REFERENCING NEW TABLE AS new_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+
+CREATE TRIGGER hosts_account_tags_update AFTER UPDATE ON hosts
+REFERENCING OLD TABLE AS old_hosts NEW TABLE AS new_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+
+CREATE TRIGGER hosts_account_tags_delete AFTER DELETE ON hosts
+REFERENCING OLD TABLE AS old_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+"""
+
+# The migrations create these for a deployed database, this is for db.create_all.
+event.listen(
+    db.metadata, "after_create", DDL(HOST_TAG_ROWS_FUNCTION + UPDATE_ACCOUNT_TAGS_FUNCTION + ACCOUNT_TAGS_TRIGGERS)
+)
+
+
 class DiskDeviceSchema(Schema):
     device = fields.Str(validate=validate.Length(max=2048))
     label = fields.Str(validate=validate.Length(max=1024))
@@ -322,6 +641,10 @@ class TagsSchema(Schema):
     value = fields.Str(required=False, allow_none=True, validate=TAG_VALUE_VALIDATION)
 
 
+class HostTagsOperationSchema(Schema):
+    tags = fields.List(fields.Nested(TagsSchema), required=True, validate=validate.Length(min=1))
+
+
 class BaseHostSchema(Schema):
     display_name = fields.Str(validate=validate.Length(min=1, max=200))
     ansible_host = fields.Str(validate=validate.Length(min=0, max=255))
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from time import monotonic
+
+__all__ = ("QueryResultCache",)
+
+
+class QueryResultCache:
+    """
+    A bounded, process-local cache of query results, each kept for a few seconds. When full, the least
+    recently used result is evicted. A query running already is not run again: the concurrent identical
+    queries wait for its result or its error. A cache of no size stores nothing, but still shares the running
+    queries. The results are shared by the callers and must not be modified.
+    """
+
+    def __init__(self, max_size, ttl):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._results = OrderedDict()
+        self._running = {}
+        self._lock = Lock()
+
+    def get(self, key, query):
+        """
+        Returns the cached result of the query and whether it was cached, or running already.
+        """
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                expires_at, result = cached
+                if monotonic() < expires_at:
+                    self._results.move_to_end(key)
+                    return result, True
+                del self._results[key]
+
+            running = self._running.get(key)
+            if running is None:
+                future = self._running[key] = Future()
+
+        if running is not None:
+            return running.result(), True
+
+        return self._run(key, query, future), False
+
+    def _run(self, key, query, future):
+        try:
+            result = query()
+        except BaseException as exception:
+            with self._lock:
+                del self._running[key]
+            future.set_exception(exception)
+            raise
+
+        with self._lock:
+            del self._running[key]
+            self._set(key, result)
+        future.set_result(result)
+        return result
+
+    def _set(self, key, result):
+        if not self._max_size:
+            return
+
+        self._results[key] = (monotonic() + self._ttl, result)
+        self._results.move_to_end(key)
+        if len(self._results) > self._max_size:
+            self._results.popitem(last=False)
+
+    def __len__(self):
+        return len(self._results)
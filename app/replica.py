@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logging import get_logger
+
+__all__ = ("RecentWrites", "ReplicaLagMonitor", "create_lag_check_engine")
+
+logger = get_logger(__name__)
+
+# No lag on a replica that replayed everything it received, or on a server that is not a replica at all. A
+# replica that does not stream from the primary receives nothing, it has no known lag then. The WAL receiver
+# status is visible only to the members of pg_read_all_stats, for the others only the receiver must be running.
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE coalesce(status, 'streaming') = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+def create_lag_check_engine(db_uri, timeout):
+    """
+    The lag check has a connection of its own, so it does not wait for the request connections. Both
+    connecting and the check itself give up after the timeout.
+    """
+    connect_args = {"connect_timeout": timeout, "options": f"-c statement_timeout={timeout * 1000}"}
+    return create_engine(db_uri, pool_size=1, max_overflow=0, connect_args=connect_args)
+
+
+class ReplicaLagMonitor:
+    """
+    Tells whether the read replica can be read from: it is reachable and lags behind the primary by no more
+    than the maximum lag. The lag is checked again only once the check interval passes, the requests in
+    between get the last result. So do the requests coming while a check is running in another thread.
+    """
+
+    def __init__(self, engine, max_lag, check_interval):
+        self._engine = engine
+        self._max_lag = max_lag
+        self._check_interval = check_interval
+        self._checked_at = None
+        self._usable = False
+        self._lock = Lock()
+
+    def usable(self):
+        if self._check_due() and self._lock.acquire(blocking=False):
+            try:
+                if self._check_due():
+                    self._usable = self._check()
+                    self._checked_at = monotonic()
+            finally:
+                self._lock.release()
+        return self._usable
+
+    def _check_due(self):
+        return self._checked_at is None or monotonic() - self._checked_at >= self._check_interval
+
+    def _check(self):
+        try:
+            with self._engine.connect() as connection:
+                lag = connection.execute(REPLICA_LAG_SQL).scalar()
+        except SQLAlchemyError:
+            logger.exception("Read replica lag check failed, reading from the primary.")
+            return False
+
+        if lag is None:
+            logger.warning("Read replica is not streaming or has not replayed anything, reading from the primary.")
+            return False
+
+        if lag > self._max_lag:
+            logger.warning("Read replica lag %s exceeds %s seconds, reading from the primary.", lag, self._max_lag)
+            return False
+
+        return True
+
+
+class RecentWrites:
+    """
+    Remembers the accounts that wrote to the primary through this process recently, so their reads do not
+    go to a replica that has not replayed the write yet. A write is recent for the given window.
+    """
+
+    def __init__(self, window):
+        self._window = window
+        self._written_at = OrderedDict()
+        self._lock = Lock()
+
+    def record(self, account):
+        now = monotonic()
+        with self._lock:
+            self._written_at[account] = now
+            self._written_at.move_to_end(account)
+            # The oldest writes come first, only the ones still within the window are kept.
+            while self._written_at and now - next(iter(self._written_at.values())) >= self._window:
+                self._written_at.popitem(last=False)
+
+    def recent(self, account):
+        with self._lock:
+            written_at = self._written_at.get(account)
+        return written_at is not None and monotonic() - written_at < self._window
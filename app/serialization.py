@@ -5,13 +5,27 @@ from marshmallow import ValidationError
 
 from app.exceptions import InputFormatException
 from app.exceptions import ValidationException
+from app.logging import get_logger
 from app.models import Host as Host
+from app.models import HostView
 from app.models import HttpHostSchema
 from app.models import MqHostSchema
+from app.models import PackageSet
 from app.utils import Tag
 
 
-__all__ = ("deserialize_host", "serialize_host", "serialize_host_system_profile", "serialize_canonical_facts")
+__all__ = (
+    "deserialize_host",
+    "deserialize_tags",
+    "load_package_sets",
+    "serialize_host",
+    "serialize_host_delete_job",
+    "serialize_host_system_profile",
+    "serialize_host_system_profile_fields",
+    "serialize_canonical_facts",
+)
+
+logger = get_logger(__name__)
 
 
 _CANONICAL_FACTS_FIELDS = (
@@ -26,7 +40,9 @@ _CANONICAL_FACTS_FIELDS = (
     "external_id",
 )
 
-DEFAULT_FIELDS = (
+_STALENESS_FIELDS = ("stale_timestamp", "stale_warning_timestamp", "culled_timestamp")
+
+DEFAULT_FIELDS = _CANONICAL_FACTS_FIELDS + (
     "id",
     "account",
     "display_name",
@@ -72,7 +88,8 @@ def deserialize_host_mq(raw_data):
 
 
 def deserialize_host_xjoin(data):
-    host = Host(
+    return HostView(
+        id=data["id"],
         canonical_facts=data["canonical_facts"],
         display_name=data["display_name"],
         ansible_host=data["ansible_host"],
@@ -82,15 +99,18 @@ def deserialize_host_xjoin(data):
         system_profile_facts={},  # Not a part of host list output
         stale_timestamp=_deserialize_datetime(data["stale_timestamp"]),
         reporter=data["reporter"],
+        created_on=_deserialize_datetime(data["created_on"]),
+        modified_on=_deserialize_datetime(data["modified_on"]),
     )
-    for field in ("created_on", "modified_on"):
-        setattr(host, field, _deserialize_datetime(data[field]))
-    host.id = data["id"]
-    return host
 
 
-def serialize_host(host, staleness_timestamps, fields=DEFAULT_FIELDS):
-    if host.stale_timestamp:
+def serialize_host(host, staleness_timestamps, fields=DEFAULT_FIELDS, package_sets=None):
+    """
+    Only the attributes of the host needed for the given fields are read, so that a host with some of
+    its columns not loaded can be serialized to a sparse fieldset. The package sets referenced by the
+    system profile are looked up in package_sets, if loaded beforehand by load_package_sets.
+    """
+    if any(field in fields for field in _STALENESS_FIELDS) and host.stale_timestamp:
         stale_timestamp = staleness_timestamps.stale_timestamp(host.stale_timestamp)
         stale_warning_timestamp = staleness_timestamps.stale_warning_timestamp(host.stale_timestamp)
         culled_timestamp = staleness_timestamps.culled_timestamp(host.stale_timestamp)
@@ -99,7 +119,10 @@ def serialize_host(host, staleness_timestamps, fields=DEFAULT_FIELDS):
         stale_warning_timestamp = None
         culled_timestamp = None
 
-    serialized_host = {**serialize_canonical_facts(host.canonical_facts)}
+    serialized_host = {}
+    if any(field in fields for field in _CANONICAL_FACTS_FIELDS):
+        canonical_facts = serialize_canonical_facts(host.canonical_facts)
+        serialized_host.update((field, value) for field, value in canonical_facts.items() if field in fields)
 
     if "id" in fields:
         serialized_host["id"] = _serialize_uuid(host.id)
@@ -128,13 +151,53 @@ def serialize_host(host, staleness_timestamps, fields=DEFAULT_FIELDS):
     if "tags" in fields:
         serialized_host["tags"] = _serialize_tags(host.tags)
     if "system_profile" in fields:
-        serialized_host["system_profile"] = host.system_profile_facts or {}
+        serialized_host["system_profile"] = _serialize_system_profile(host.system_profile_facts, package_sets)
 
     return serialized_host
 
 
-def serialize_host_system_profile(host):
-    return {"id": _serialize_uuid(host.id), "system_profile": host.system_profile_facts or {}}
+def serialize_host_system_profile(host, package_sets=None):
+    return {
+        "id": _serialize_uuid(host.id),
+        "system_profile": _serialize_system_profile(host.system_profile_facts, package_sets),
+    }
+
+
+def serialize_host_system_profile_fields(host_id, system_profile_values, package_sets=None):
+    """
+    Serializes a host system profile selected field by field, the fields missing in the profile are
+    left out.
+    """
+    system_profile = {field: value for field, value in system_profile_values.items() if value is not None}
+    return {"id": _serialize_uuid(host_id), "system_profile": _serialize_system_profile(system_profile, package_sets)}
+
+
+def load_package_sets(system_profiles):
+    """
+    Returns the items of the package sets referenced by the system profiles, by their hashes. They are
+    all fetched by a single query, not one by one for every serialized host.
+    """
+    hashes = {
+        hash_
+        for system_profile in system_profiles
+        for hash_ in map(PackageSet.referenced_hash, (system_profile or {}).values())
+        if hash_
+    }
+    if not hashes:
+        return {}
+
+    return dict(PackageSet.query.with_entities(PackageSet.hash, PackageSet.items).filter(PackageSet.hash.in_(hashes)))
+
+
+def serialize_host_delete_job(job):
+    return {
+        "id": _serialize_uuid(job.id),
+        "status": job.status,
+        "filters": job.filters,
+        "deleted": job.deleted_count,
+        "created": _serialize_datetime(job.created_on),
+        "updated": _serialize_datetime(job.modified_on),
+    }
 
 
 def _deserialize_canonical_facts(data):
@@ -180,6 +243,13 @@ def _serialize_uuid(u):
     return str(u)
 
 
+def deserialize_tags(tags):
+    """
+    Converts structured or nested tags to the nested form stored in the database.
+    """
+    return _deserialize_tags(tags)
+
+
 def _deserialize_tags(tags):
     if isinstance(tags, list):
         return _deserialize_tags_list(tags)
@@ -243,5 +313,23 @@ def _deserialize_tags_dict(tags):
     return deserialized_tags
 
 
+def _serialize_system_profile(system_profile_facts, package_sets=None):
+    if package_sets is None:
+        package_sets = load_package_sets((system_profile_facts,))
+    return {key: _resolve_package_set(value, package_sets) for key, value in (system_profile_facts or {}).items()}
+
+
+def _resolve_package_set(value, package_sets):
+    hash_ = PackageSet.referenced_hash(value)
+    if not hash_:
+        return value
+
+    if hash_ not in package_sets:
+        logger.warning("Referenced package set %s does not exist", hash_)
+        return []
+
+    return package_sets[hash_]
+
+
 def _serialize_tags(tags):
     return [tag.data() for tag in Tag.create_tags_from_nested(tags)]
@@ -0,0 +1,68 @@
+import json
+import os
+from glob import glob
+from hashlib import sha256
+from os.path import join
+from tempfile import NamedTemporaryFile
+
+import prance
+from prance import ResolvingParser
+from prance.util.resolver import RESOLVE_FILES
+
+from app.logging import get_logger
+
+__all__ = ("resolved_specification",)
+
+logger = get_logger(__name__)
+
+
+def resolved_specification(specification_file, cache_dir=None):
+    """
+    Returns the API specification with its references to the other files resolved. The resolution and the
+    validation take seconds, so the resolved specification is stored in the cache directory under the hash of
+    the specification files. The following starts of the same version only load it.
+    """
+    if not cache_dir:
+        return _resolve(specification_file)
+
+    cache_file = join(cache_dir, f"api.spec.{_specification_digest(specification_file)}.json")
+    try:
+        with open(cache_file) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        logger.warning("Cached specification %s could not be loaded, resolving it again.", cache_file, exc_info=True)
+
+    specification = _resolve(specification_file)
+    _store(cache_file, specification)
+    return specification
+
+
+def _resolve(specification_file):
+    # The parser parses the specification once created.
+    parser = ResolvingParser(specification_file, resolve_types=RESOLVE_FILES)
+    return parser.specification
+
+
+def _specification_digest(specification_file):
+    # Any of the files in the directory can be referenced. A different parser version can resolve differently.
+    digest = sha256(prance.__version__.encode())
+    specification_dir = os.path.dirname(specification_file)
+    for file_name in sorted(glob(join(specification_dir, "*.yaml"))):
+        with open(file_name, "rb") as file:
+            digest.update(os.path.basename(file_name).encode())
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _store(cache_file, specification):
+    try:
+        # Written to a temporary file first, the processes starting at the same time never read a partial one.
+        with NamedTemporaryFile("w", dir=os.path.dirname(cache_file), suffix=".tmp", delete=False) as file:
+            json.dump(specification, file)
+        # Readable by any user, e.g. the one running the pods if cached when building the image.
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, cache_file)
+    except OSError:
+        logger.warning("Resolved specification could not be cached in %s.", cache_file, exc_info=True)
@@ -1,9 +1,14 @@
 import json
 import re
 import urllib
+from collections import namedtuple
+
+from marshmallow import fields
+from marshmallow import ValidationError
 
 from app.exceptions import ValidationException
 from app.logging import get_logger
+from app.models import SystemProfileSchema
 
 logger = get_logger(__name__)
 
@@ -371,3 +376,46 @@ class Tag:
                     for value in nested_tags[namespace][key]:
                         tags.append(Tag(Tag.serialize_namespace(namespace), key, value))
         return tags
+
+
+"""
+System profile filtering: parsing of the field=value filter strings
+"""
+
+
+class SystemProfileFilter(namedtuple("SystemProfileFilter", ("field", "field_type", "operator", "value"))):
+    """
+    A filter on a scalar system profile field. String and boolean fields are compared for equality,
+    integer fields can be also compared by >, >=, < and <=. A string list field, e.g. the installed
+    packages, matches if it contains the value.
+    """
+
+    FIELD_TYPES = {fields.Int: int, fields.Bool: bool, fields.Str: str}
+    EQUALITY_OPERATORS = ("=",)
+    COMPARISON_OPERATORS = (">=", "<=", "=", ">", "<")
+
+    @classmethod
+    def from_string(cls, string_filter):
+        match = re.match(r"(?P<field>[a-z_]+)(?P<operator>>=|<=|=|>|<)(?P<value>.+)$", string_filter)
+        if not match:
+            raise ValidationException(f"{string_filter} is not a valid system profile filter")
+
+        field, operator, value = match.group("field", "operator", "value")
+        schema_field = SystemProfileSchema._declared_fields.get(field)
+        if isinstance(schema_field, fields.List) and isinstance(schema_field.container, fields.Str):
+            schema_field, field_type = schema_field.container, list
+        else:
+            field_type = cls.FIELD_TYPES.get(type(schema_field))
+        if not field_type:
+            raise ValidationException(f"{field} is not a filterable system profile field")
+
+        operators = cls.COMPARISON_OPERATORS if field_type is int else cls.EQUALITY_OPERATORS
+        if operator not in operators:
+            raise ValidationException(f"{field} can be only compared by {', '.join(operators)}")
+
+        try:
+            deserialized_value = schema_field.deserialize(value)
+        except ValidationError as e:
+            raise ValidationException(f"{field}: {' '.join(e.messages)}")
+
+        return cls(field, field_type, operator, deserialized_value)
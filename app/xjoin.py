@@ -1,15 +1,22 @@
+from functools import partial
+from json import dumps
 from logging import getLogger
 
+from dateutil.parser import isoparse
 from flask import abort
 from flask import current_app
+from flask import g
 from flask import request
-from requests import post
 
+from api.metrics import xjoin_query_cache_hit_count
+from api.metrics import xjoin_query_cache_miss_count
 from app import IDENTITY_HEADER
 from app import inventory_config
 from app import REQUEST_ID_HEADER
 from app import UNKNOWN_REQUEST_ID_VALUE
+from app.auth import current_identity
 from app.culling import staleness_to_conditions
+from app.xjoin_client import query_hash
 
 __all__ = ("graphql_query", "pagination_params", "staleness_filter", "string_contains", "url")
 
@@ -22,17 +29,32 @@ def check_pagination(offset, total):
 
 
 def graphql_query(query_string, variables):
+    # A shadow read compares xjoin-search with the database, a cached result would compare an older one.
+    if g.get("shadow_read", False):
+        return _graphql_query(query_string, variables)
+
+    # The identical queries of the same account, e.g. from several tabs of the UI, share the result.
+    cache_key = (current_identity.account_number, query_hash(query_string), _variables_cache_key(variables))
+    data, cached = current_app.xjoin_query_cache.get(cache_key, partial(_graphql_query, query_string, variables))
+    if cached:
+        xjoin_query_cache_hit_count.inc()
+    else:
+        xjoin_query_cache_miss_count.inc()
+    return data
+
+
+def _graphql_query(query_string, variables):
     url_ = url()
-    logger.info("QUERY: URL %s; query %s, variables %s", url_, query_string, variables)
-    payload = {"query": query_string, "variables": variables}
+    logger.debug("QUERY: URL %s; variables %s", url_, variables)
 
-    response = post(url_, json=payload, headers=_forwarded_headers())
+    # An unavailable xjoin-search is left to the caller, which can fall back to the database.
+    shadow = g.get("shadow_read", False)
+    response = current_app.xjoin_client.post(url_, query_string, variables, _forwarded_headers(), shadow=shadow)
     status = response.status_code
     if status != 200:
         logger.error("xjoin-search returned status: %s", status)
         abort(500, "Error, request could not be completed")
 
-    logger.debug("QUERY: response %s", response.text)
     response_body = response.json()
     return response_body["data"]
 
@@ -70,3 +92,25 @@ def _stale_timestamp_filter(gt=None, lte=None):
     if lte:
         filter_["lte"] = lte.isoformat()
     return {"stale_timestamp": filter_}
+
+
+def _variables_cache_key(variables):
+    """
+    The staleness boundaries move with the current time, to the microsecond. In the key, they are bucketed by
+    the cache TTL, so the queries made within it can share the result. The variables sent are left exact.
+    """
+    ttl = inventory_config().xjoin_query_cache_ttl
+    return dumps(_bucket_staleness(variables, ttl) if ttl else variables, sort_keys=True)
+
+
+def _bucket_staleness(value, ttl):
+    if isinstance(value, dict):
+        return {
+            key: {operator: isoparse(timestamp).timestamp() // ttl for operator, timestamp in item.items()}
+            if key == "stale_timestamp"
+            else _bucket_staleness(item, ttl)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_bucket_staleness(item, ttl) for item in value]
+    return value
@@ -0,0 +1,125 @@
+from functools import lru_cache
+from hashlib import sha256
+from logging import getLogger
+from random import uniform
+from time import sleep
+
+from requests import ConnectionError
+from requests import Session
+from requests import Timeout
+from requests.adapters import HTTPAdapter
+
+from api.metrics import xjoin_request_count
+from api.metrics import xjoin_request_time
+from app.circuit_breaker import CircuitBreaker
+
+__all__ = ("query_hash", "XjoinClient", "XjoinUnavailableError")
+
+logger = getLogger("graphql")
+
+# The statuses of an unavailable server, worth another try.
+RETRIED_STATUSES = (502, 503, 504)
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+
+class XjoinUnavailableError(Exception):
+    pass
+
+
+class XjoinClient:
+    """
+    Queries xjoin-search over a pool of kept alive connections shared by all requests of the process. The
+    queries only read, so a query failing on a connection error, a timeout or an unavailable server is retried
+    after a random delay. Once the queries keep failing, the circuit breaker rejects them without waiting.
+
+    With persisted queries, only the hash of a query is sent. The full query is sent only if xjoin-search does
+    not know the hash yet.
+
+    The shadow reads have a circuit breaker of their own, so their failures do not reject the served queries.
+    """
+
+    def __init__(self, config):
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.xjoin_pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.circuit_breaker = CircuitBreaker(
+            "xjoin-search", config.xjoin_circuit_breaker_failures, config.xjoin_circuit_breaker_reset_timeout
+        )
+        self.shadow_circuit_breaker = CircuitBreaker(
+            "xjoin-search shadow reads",
+            config.xjoin_circuit_breaker_failures,
+            config.xjoin_circuit_breaker_reset_timeout,
+        )
+        self._timeout = (config.xjoin_connect_timeout, config.xjoin_read_timeout)
+        self._retries = config.xjoin_retries
+        self._retry_backoff = config.xjoin_retry_backoff
+        self._persisted_queries = config.xjoin_persisted_queries
+
+    def post(self, url_, query_string, variables, headers, shadow=False):
+        circuit_breaker = self.shadow_circuit_breaker if shadow else self.circuit_breaker
+        if not circuit_breaker.allow_request():
+            xjoin_request_count.labels(outcome="rejected").inc()
+            raise XjoinUnavailableError("The circuit is open.")
+
+        with xjoin_request_time.time():
+            try:
+                response = self._post(url_, query_string, variables, headers)
+            except (ConnectionError, Timeout) as exception:
+                logger.error("xjoin-search request failed: %s", exception)
+                circuit_breaker.record_failure()
+                xjoin_request_count.labels(outcome="timeout" if isinstance(exception, Timeout) else "error").inc()
+                raise XjoinUnavailableError(str(exception)) from exception
+
+        if response.status_code >= 500:
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.record_success()
+        xjoin_request_count.labels(outcome="success" if response.status_code == 200 else "error").inc()
+        return response
+
+    def _post(self, url_, query_string, variables, headers):
+        if self._persisted_queries:
+            response = self._post_with_retries(url_, _persisted_query_payload(query_string, variables), headers)
+            if not _persisted_query_not_found(response):
+                return response
+
+            # Registers the query under its hash for the following requests.
+            payload = _persisted_query_payload(query_string, variables)
+            payload["query"] = query_string
+        else:
+            payload = {"query": query_string, "variables": variables}
+
+        return self._post_with_retries(url_, payload, headers)
+
+    def _post_with_retries(self, url_, payload, headers):
+        for attempt in range(self._retries + 1):
+            last_attempt = attempt == self._retries
+            try:
+                response = self.session.post(url_, json=payload, headers=headers, timeout=self._timeout)
+            except (ConnectionError, Timeout):
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRIED_STATUSES or last_attempt:
+                    return response
+
+            # Full jitter: the retries of the concurrent requests are spread instead of coming at once.
+            sleep(uniform(0, self._retry_backoff * 2 ** attempt))
+
+
+@lru_cache()
+def query_hash(query_string):
+    return sha256(query_string.encode()).hexdigest()
+
+
+def _persisted_query_payload(query_string, variables):
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query_string)}}
+    return {"extensions": extensions, "variables": variables}
+
+
+def _persisted_query_not_found(response):
+    if response.status_code != 200:
+        return False
+    errors = response.json().get("errors") or ()
+    return any(error.get("message") == PERSISTED_QUERY_NOT_FOUND for error in errors)
@@ -1,5 +1,12 @@
+from os import getenv
+
 from prometheus_client import multiprocess
 
+# A gthread worker serves up to the number of its threads at once, waiting for xjoin-search or the database
+# without blocking the others.
+worker_class = "gthread"
+threads = int(getenv("GUNICORN_THREADS", "1"))
+
 
 def child_exit(server, worker):
     multiprocess.mark_process_dead(worker.pid)
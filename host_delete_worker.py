@@ -0,0 +1,93 @@
+import sys
+from functools import partial
+
+from prometheus_client import CollectorRegistry
+from prometheus_client import push_to_gateway
+
+from api.host_delete_job import claim_delete_job
+from api.host_delete_job import run_delete_job
+from app import UNKNOWN_REQUEST_ID_VALUE
+from app.bootstrap import create_job_app
+from app.bootstrap import init_config
+from app.environment import RuntimeEnvironment
+from app.logging import configure_logging
+from app.logging import get_logger
+from app.logging import threadctx
+from app.models import db
+from app.queue.event_producer import EventProducer
+from app.queue.metrics import event_producer_failure
+from app.queue.metrics import event_producer_success
+from app.queue.metrics import event_serialization_time
+from lib.handlers import register_shutdown
+from lib.handlers import ShutdownHandler
+from lib.metrics import delete_host_count
+from lib.metrics import delete_host_processing_time
+
+__all__ = ("main", "run")
+
+PROMETHEUS_JOB = "inventory-host-delete-worker"
+LOGGER_NAME = "host_delete_worker"
+COLLECTED_METRICS = (
+    delete_host_count,
+    delete_host_processing_time,
+    event_producer_failure,
+    event_producer_success,
+    event_serialization_time,
+)
+RUNTIME_ENVIRONMENT = RuntimeEnvironment.JOB
+
+
+def _prometheus_job(namespace):
+    return f"{PROMETHEUS_JOB}-{namespace}" if namespace else PROMETHEUS_JOB
+
+
+def _excepthook(logger, type, value, traceback):
+    logger.exception("Host delete worker failed", exc_info=value)
+
+
+def run(config, logger, event_producer, shutdown_handler):
+    """
+    Runs the pending host delete jobs, and the interrupted ones, until there are none left. Multiple workers
+    can run at once, each job is claimed by only one of them.
+    """
+    while not shutdown_handler.shut_down():
+        job = claim_delete_job(config.host_delete_job_stale_timeout)
+        if not job:
+            logger.info("No host delete jobs to run.")
+            return
+
+        logger.info("Running host delete job %s", job.id)
+        run_delete_job(job, event_producer, shutdown_handler.shut_down)
+
+
+def main(logger):
+    config = init_config(RUNTIME_ENVIRONMENT)
+
+    registry = CollectorRegistry()
+    for metric in COLLECTED_METRICS:
+        registry.register(metric)
+    job = _prometheus_job(config.kubernetes_namespace)
+    prometheus_shutdown = partial(push_to_gateway, config.prometheus_pushgateway, job, registry)
+    register_shutdown(prometheus_shutdown, "Pushing metrics")
+
+    application = create_job_app(config)
+    register_shutdown(db.get_engine(application).dispose, "Closing database")
+
+    event_producer = EventProducer(config)
+    register_shutdown(event_producer.close, "Closing producer")
+
+    shutdown_handler = ShutdownHandler()
+    shutdown_handler.register()
+
+    with application.app_context():
+        run(config, logger, event_producer, shutdown_handler)
+
+
+if __name__ == "__main__":
+    configure_logging()
+
+    logger = get_logger(LOGGER_NAME)
+    sys.excepthook = partial(_excepthook, logger)
+
+    threadctx.request_id = UNKNOWN_REQUEST_ID_VALUE
+    main(logger)
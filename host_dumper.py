@@ -2,14 +2,18 @@
 import argparse
 import pprint
 
-from app import create_app
-from app import inventory_config
+from app.bootstrap import init_config
+from app.bootstrap import init_db
 from app.culling import Timestamps
 from app.environment import RuntimeEnvironment
+from app.logging import configure_logging
 from app.models import Host
 from app.serialization import serialize_host
+from lib.db import session_guard
 
-application = create_app(RuntimeEnvironment.COMMAND)
+configure_logging()
+config = init_config(RuntimeEnvironment.COMMAND)
+Session = init_db(config)
 
 parser = argparse.ArgumentParser(
     description="Util that dumps a host from the hosts table.  The db configuration is read from the environment.  "
@@ -23,28 +27,25 @@ group.add_argument("--account_number", help="dump all hosts associated with acco
 parser.add_argument("--no-pp", help="enable pretty printing", action="store_true")
 args = parser.parse_args()
 
-with application.app_context():
-    # query_results = Host.query.filter().all()
-    # print(query_results)
+with session_guard(Session()) as session:
+    query = session.query(Host)
     if args.id:
         host_id_list = [args.id]
         print("looking up host using id")
-        query_results = Host.query.filter(Host.id.in_(host_id_list)).all()
+        query_results = query.filter(Host.id.in_(host_id_list)).all()
     elif args.hostname:
         print("looking up host using display_name, fqdn")
-        query_results = Host.query.filter(
+        query_results = query.filter(
             Host.display_name.comparator.contains(args.hostname)
             | Host.canonical_facts["fqdn"].astext.contains(args.hostname)
         ).all()
     elif args.insights_id:
         print("looking up host using insights_id")
-        query_results = Host.query.filter(
-            Host.canonical_facts.comparator.contains({"insights_id": args.insights_id})
-        ).all()
+        query_results = query.filter(Host.canonical_facts.comparator.contains({"insights_id": args.insights_id})).all()
     elif args.account_number:
-        query_results = Host.query.filter(Host.account == args.account_number).all()
+        query_results = query.filter(Host.account == args.account_number).all()
 
-    staleness_timestamps = Timestamps.from_config(inventory_config())
+    staleness_timestamps = Timestamps.from_config(config)
     json_host_list = [serialize_host(host, staleness_timestamps) for host in query_results]
 
     if args.no_pp:
@@ -3,11 +3,10 @@ from functools import partial
 
 from prometheus_client import CollectorRegistry
 from prometheus_client import push_to_gateway
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
 from app import UNKNOWN_REQUEST_ID_VALUE
-from app.config import Config
+from app.bootstrap import init_config
+from app.bootstrap import init_db
 from app.culling import Conditions
 from app.environment import RuntimeEnvironment
 from app.logging import configure_logging
@@ -22,6 +21,7 @@ from lib.db import session_guard
 from lib.handlers import register_shutdown
 from lib.handlers import ShutdownHandler
 from lib.host_delete import delete_hosts
+from lib.host_repository import delete_orphaned_package_sets
 from lib.host_repository import stale_timestamp_filter
 from lib.metrics import delete_host_count
 from lib.metrics import delete_host_processing_time
@@ -42,17 +42,6 @@ COLLECTED_METRICS = (
 RUNTIME_ENVIRONMENT = RuntimeEnvironment.JOB
 
 
-def _init_config():
-    config = Config(RUNTIME_ENVIRONMENT)
-    config.log_configuration()
-    return config
-
-
-def _init_db(config):
-    engine = create_engine(config.db_uri)
-    return sessionmaker(bind=engine)
-
-
 def _prometheus_job(namespace):
     return f"{PROMETHEUS_JOB}-{namespace}" if namespace else PROMETHEUS_JOB
 
@@ -75,9 +64,13 @@ def run(config, logger, session, event_producer, shutdown_handler):
         else:
             logger.info("Host %s already deleted. Delete event not emitted.", host_id)
 
+    # The package sets of the deleted hosts, or of the hosts whose packages changed, are not referenced anymore.
+    deleted_package_sets = delete_orphaned_package_sets(session, interrupt=shutdown_handler.shut_down)
+    logger.info("Deleted %d orphaned package sets.", deleted_package_sets)
+
 
 def main(logger):
-    config = _init_config()
+    config = init_config(RUNTIME_ENVIRONMENT)
 
     registry = CollectorRegistry()
     for metric in COLLECTED_METRICS:
@@ -86,7 +79,7 @@ def main(logger):
     prometheus_shutdown = partial(push_to_gateway, config.prometheus_pushgateway, job, registry)
     register_shutdown(prometheus_shutdown, "Pushing metrics")
 
-    Session = _init_db(config)
+    Session = init_db(config)
     session = Session()
     register_shutdown(session.get_bind().dispose, "Closing database")
 
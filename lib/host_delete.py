@@ -1,3 +1,4 @@
+from sqlalchemy import tuple_
 from sqlalchemy.orm.base import instance_state
 
 from app.models import Host
@@ -8,7 +9,7 @@ from app.queue.events import message_headers
 from lib.metrics import delete_host_count
 from lib.metrics import delete_host_processing_time
 
-__all__ = ("delete_hosts",)
+__all__ = ("delete_host_chunks", "delete_hosts")
 CHUNK_SIZE = 1000
 
 
@@ -34,8 +35,66 @@ def delete_hosts(select_query, event_producer, interrupt=lambda: False):
                 return
 
 
+def delete_host_chunks(select_query, event_producer, chunk_size=CHUNK_SIZE, interrupt=lambda: False):
+    """
+    Deletes the selected hosts by chunks, each with a single DELETE statement. The delete events
+    of a chunk are written after it is committed. Yields the deleted rows of every chunk that
+    deleted any. Hosts already deleted by a different process, or changed to no longer match the
+    query, are not returned by the DELETE and get no event. Stops once nothing is selected.
+    """
+    while True:
+        with delete_host_processing_time.time():
+            selected, deleted_hosts = _delete_host_chunk(select_query, chunk_size)
+
+        if not selected:
+            return
+
+        if deleted_hosts:
+            delete_host_count.inc(len(deleted_hosts))
+            _emit_delete_events(deleted_hosts, event_producer)
+
+            yield deleted_hosts
+
+        if interrupt():
+            return
+
+
+def _delete_host_chunk(select_query, chunk_size):
+    """
+    Returns whether any hosts were selected and the deleted ones. The selected hosts can be deleted, or
+    changed, by a different process before the DELETE. The DELETE filters them again, so it deletes only
+    those still matching the query.
+    """
+    # The hosts are deleted by their full primary key, so only the partitions of their accounts are scanned.
+    chunk = select_query.with_entities(Host.id, Host.account).order_by(None).limit(chunk_size)
+    host_keys = [tuple(host_key) for host_key in chunk]
+    if not host_keys:
+        return False, []
+
+    host_table = Host.__table__
+    statement = host_table.delete().where(tuple_(host_table.c.id, host_table.c.account).in_(host_keys))
+    if select_query.whereclause is not None:
+        statement = statement.where(select_query.whereclause)
+    statement = statement.returning(host_table.c.id, host_table.c.account, host_table.c.canonical_facts)
+    deleted_hosts = select_query.session.execute(statement).fetchall()
+    select_query.session.commit()
+    return True, deleted_hosts
+
+
+def _emit_delete_events(deleted_hosts, event_producer):
+    events = [_build_delete_event(host) for host in deleted_hosts]
+    for event, key, headers in events:
+        event_producer.write_event(event, key, headers, Topic.events)
+
+
+def _build_delete_event(host):
+    event = build_event(EventType.delete, host)
+    headers = message_headers(EventType.delete, host.canonical_facts.get("insights_id"))
+    return event, str(host.id), headers
+
+
 def _delete_host(session, host):
-    delete_query = session.query(Host).filter(Host.id == host.id)
+    delete_query = session.query(Host).filter((Host.id == host.id) & (Host.account == host.account))
     delete_query.delete(synchronize_session="fetch")
     delete_query.session.commit()
 
@@ -1,29 +1,50 @@
 from enum import Enum
 
 from sqlalchemy import and_
+from sqlalchemy import cast
+from sqlalchemy import exists
+from sqlalchemy import func
 from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import text
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql.expression import bindparam
 
 from app import inventory_config
 from app.culling import staleness_to_conditions
+from app.exceptions import InventoryException
 from app.logging import get_logger
 from app.models import db
 from app.models import Host
+from app.models import PACKAGE_SET_FIELDS
+from app.models import PACKAGE_SET_REFERENCE
+from app.models import PackageSet
 from app.serialization import DEFAULT_FIELDS
 from app.serialization import serialize_host
 from lib import metrics
 from lib.db import session_guard
+from lib.host_delete import CHUNK_SIZE
 
 __all__ = (
     "add_host",
     "canonical_fact_host_query",
     "canonical_facts_host_query",
     "create_new_host",
+    "delete_orphaned_package_sets",
     "find_existing_host",
     "find_host_by_canonical_facts",
     "find_hosts_by_staleness",
     "find_non_culled_hosts",
+    "non_culled_filter",
+    "patch_hosts",
     "stale_timestamp_filter",
+    "staleness_filter",
+    "store_package_sets",
     "update_existing_host",
+    "update_host_tags",
 )
 
 AddHostResult = Enum("AddHostResult", ("created", "updated"))
@@ -37,6 +58,61 @@ ELEVATED_CANONICAL_FACT_FIELDS = ("insights_id", "subscription_manager_id")
 ALL_STALENESS_STATES = ("fresh", "stale", "stale_warning", "unknown")
 NULL = None
 
+# Host tags can be NULL or 'null' in the database, these are handled as no tags.
+HOST_TAGS_SQL = "CASE WHEN jsonb_typeof(hosts.tags) = 'object' THEN hosts.tags ELSE CAST('{}' AS jsonb) END"
+
+# Adds the values missing in the host tags, keeping the existing ones in their order.
+_APPLY_TAGS_SQL = f"""
+({HOST_TAGS_SQL} || coalesce((
+    SELECT jsonb_object_agg(
+        ns.key,
+        coalesce({HOST_TAGS_SQL} -> ns.key, CAST('{{}}' AS jsonb)) || coalesce((
+            SELECT jsonb_object_agg(
+                k.key,
+                coalesce({HOST_TAGS_SQL} -> ns.key -> k.key, CAST('[]' AS jsonb)) || coalesce((
+                    SELECT jsonb_agg(v.value)
+                    FROM jsonb_array_elements(k.value) AS v
+                    WHERE NOT coalesce({HOST_TAGS_SQL} -> ns.key -> k.key, CAST('[]' AS jsonb))
+                        @> jsonb_build_array(v.value)
+                ), CAST('[]' AS jsonb))
+            )
+            FROM jsonb_each(ns.value) AS k
+        ), CAST('{{}}' AS jsonb))
+    )
+    FROM jsonb_each(CAST(:tags AS jsonb)) AS ns
+), CAST('{{}}' AS jsonb)))
+"""
+
+# Removes the given values, or the whole key if no values are given. Keys and namespaces left
+# empty by the removal are dropped.
+_REMOVE_TAGS_SQL = f"""
+(coalesce((
+    SELECT jsonb_object_agg(ns.key, ns.value)
+    FROM (
+        SELECT ns.key, CASE WHEN CAST(:tags AS jsonb) ? ns.key THEN coalesce((
+            SELECT jsonb_object_agg(k.key, k.value)
+            FROM (
+                SELECT k.key, CASE
+                    WHEN NOT CAST(:tags AS jsonb) -> ns.key ? k.key THEN k.value
+                    WHEN jsonb_array_length(CAST(:tags AS jsonb) -> ns.key -> k.key) = 0 THEN CAST('[]' AS jsonb)
+                    ELSE coalesce((
+                        SELECT jsonb_agg(v.value)
+                        FROM jsonb_array_elements(k.value) AS v
+                        WHERE NOT CAST(:tags AS jsonb) -> ns.key -> k.key @> jsonb_build_array(v.value)
+                    ), CAST('[]' AS jsonb))
+                END AS value, CAST(:tags AS jsonb) -> ns.key ? k.key AS changed
+                FROM jsonb_each(ns.value) AS k
+            ) AS k
+            WHERE NOT (k.changed AND k.value = CAST('[]' AS jsonb))
+        ), CAST('{{}}' AS jsonb)) ELSE ns.value END AS value, CAST(:tags AS jsonb) ? ns.key AS changed
+        FROM jsonb_each({HOST_TAGS_SQL}) AS ns
+    ) AS ns
+    WHERE NOT (ns.changed AND ns.value = CAST('{{}}' AS jsonb))
+), CAST('{{}}' AS jsonb)))
+"""
+
+_TAG_OPERATIONS_SQL = {"apply": _APPLY_TAGS_SQL, "remove": _REMOVE_TAGS_SQL}
+
 logger = get_logger(__name__)
 
 
@@ -125,18 +201,26 @@ def find_host_by_canonical_facts(account_number, canonical_facts):
     return host
 
 
-def find_hosts_by_staleness(staleness, query):
-    logger.debug("find_hosts_by_staleness(%s)", staleness)
+def staleness_filter(staleness):
     config = inventory_config()
     staleness_conditions = tuple(staleness_to_conditions(config, staleness, stale_timestamp_filter))
     if "unknown" in staleness:
         staleness_conditions += (Host.stale_timestamp == NULL,)
 
-    return query.filter(or_(*staleness_conditions))
+    return or_(*staleness_conditions)
+
+
+def non_culled_filter():
+    return staleness_filter(ALL_STALENESS_STATES)
+
+
+def find_hosts_by_staleness(staleness, query):
+    logger.debug("find_hosts_by_staleness(%s)", staleness)
+    return query.filter(staleness_filter(staleness))
 
 
 def find_non_culled_hosts(query):
-    return find_hosts_by_staleness(ALL_STALENESS_STATES, query)
+    return query.filter(non_culled_filter())
 
 
 @metrics.new_host_commit_processing_time.time()
@@ -144,6 +228,8 @@ def create_new_host(input_host, staleness_offset, fields):
     logger.debug("Creating a new host")
 
     input_host.save()
+    if inventory_config().package_sets_enabled:
+        store_package_sets(input_host)
     db.session.commit()
 
     metrics.create_host_count.inc()
@@ -160,6 +246,8 @@ def update_existing_host(existing_host, input_host, staleness_offset, update_sys
     logger.debug(f"existing host = {existing_host}")
 
     existing_host.update(input_host, update_system_profile)
+    if update_system_profile and inventory_config().package_sets_enabled:
+        store_package_sets(existing_host)
     db.session.commit()
 
     metrics.update_host_count.inc()
@@ -170,6 +258,142 @@ def update_existing_host(existing_host, input_host, staleness_offset, update_sys
     return output_host, existing_host.id, insights_id, AddHostResult.updated
 
 
+def store_package_sets(host):
+    """
+    Replaces the package set lists in the host system profile by references to package sets. A package
+    set is inserted only if it does not exist yet, a referenced one is never rewritten. It is then locked
+    until the host is committed, so that delete_orphaned_package_sets does not delete it in the meantime.
+    A package set deleted right before it got locked is inserted again.
+    """
+    system_profile = dict(host.system_profile_facts or {})
+    for field in PACKAGE_SET_FIELDS:
+        items = system_profile.get(field)
+        if not isinstance(items, list):
+            continue
+
+        hash_ = PackageSet.hash_items(items)
+        insert_statement = insert(PackageSet.__table__).values(hash=hash_, items=items).on_conflict_do_nothing()
+        lock_statement = (
+            select([PackageSet.hash]).where(PackageSet.hash == hash_).with_for_update(read=True, key_share=True)
+        )
+        while True:
+            db.session.execute(insert_statement)
+            if db.session.execute(lock_statement).first():
+                break
+        system_profile[field] = PackageSet.reference(hash_)
+
+    host.system_profile_facts = system_profile
+
+
+def delete_orphaned_package_sets(session, chunk_size=CHUNK_SIZE, interrupt=lambda: False):
+    """
+    Deletes the package sets no host references, by chunks, and returns their count. The references are
+    looked up through the package set expression indexes. A chunk is locked first, skipping the package
+    sets locked by the hosts being stored, and the references are checked once more before deleting it.
+    """
+    unreferenced = ~or_(
+        *(
+            exists().where(Host.system_profile_facts[field][PACKAGE_SET_REFERENCE].astext == PackageSet.hash)
+            for field in PACKAGE_SET_FIELDS
+        )
+    )
+    deleted_count = 0
+    while True:
+        chunk = (
+            session.query(PackageSet.hash)
+            .filter(unreferenced)
+            .limit(chunk_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not chunk:
+            break
+
+        hashes = [hash_ for hash_, in chunk]
+        statement = PackageSet.__table__.delete().where(PackageSet.hash.in_(hashes) & unreferenced)
+        deleted_count += session.execute(statement).rowcount
+        session.commit()
+
+        if interrupt():
+            break
+
+    return deleted_count
+
+
+def patch_hosts(account_number, host_id_list, patch_data):
+    """
+    Patches the non-culled hosts of the account in a single UPDATE statement. Returns the
+    updated rows with all their columns, so they can be serialized without another query.
+    """
+    host_table = Host.__table__
+    statement = (
+        host_table.update()
+        .where((Host.account == account_number) & Host.id.in_(host_id_list) & non_culled_filter())
+        .values(_patch_values(patch_data))
+        .returning(*host_table.columns)
+    )
+
+    patched_hosts = db.session.execute(statement).fetchall()
+    db.session.commit()
+
+    logger.debug("Patched hosts: %s", [host.id for host in patched_hosts])
+    return patched_hosts
+
+
+def _patch_values(patch_data):
+    if not patch_data:
+        raise InventoryException(title="Bad Request", detail="Patch json document cannot be empty.")
+
+    values = {}
+
+    if patch_data.get("ansible_host") is not None:
+        # Allow a user to clear out the ansible host with an empty string
+        values["ansible_host"] = patch_data["ansible_host"]
+
+    if patch_data.get("display_name"):
+        values["display_name"] = patch_data["display_name"]
+    else:
+        # Same fallback as on save: a host without a display_name gets its fqdn or id
+        values["display_name"] = func.coalesce(
+            func.nullif(Host.display_name, ""), Host.canonical_facts["fqdn"].astext, cast(Host.id, String)
+        )
+
+    return values
+
+
+def update_host_tags(select_query, operation, tags, chunk_size=CHUNK_SIZE):
+    """
+    Applies or removes the nested tags on the selected hosts. The hosts are updated by chunks,
+    each with a single UPDATE statement computing the new tags in the database. Yields the
+    updated rows of every chunk with all their columns, after the chunk is committed.
+    """
+    host_table = Host.__table__
+    new_tags = text(_TAG_OPERATIONS_SQL[operation]).bindparams(bindparam("tags", tags, type_=JSONB))
+    key_query = select_query.with_entities(Host.id, Host.account).order_by(Host.id)
+
+    last_id = None
+    while True:
+        chunk_query = key_query.filter(Host.id > last_id) if last_id else key_query
+        host_keys = [tuple(host_key) for host_key in chunk_query.limit(chunk_size)]
+        if not host_keys:
+            return
+
+        # Updated by the full primary key, so only the partitions of the hosts' accounts are scanned.
+        statement = (
+            host_table.update()
+            .where(tuple_(host_table.c.id, host_table.c.account).in_(host_keys))
+            .values(tags=new_tags)
+            .returning(*host_table.columns)
+        )
+        updated_hosts = db.session.execute(statement).fetchall()
+        db.session.commit()
+
+        logger.debug("Updated tags of hosts: %s", [host.id for host in updated_hosts])
+        yield updated_hosts
+
+        last_id, _ = host_keys[-1]
+
+
 def stale_timestamp_filter(gt=None, lte=None):
     filter_ = ()
     if gt:
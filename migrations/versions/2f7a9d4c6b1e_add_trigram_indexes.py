@@ -0,0 +1,26 @@
+"""add_trigram_indexes
+
+Revision ID: 2f7a9d4c6b1e
+Revises: 9c3d5e7f1a2b
+Create Date: 2020-04-24 10:18:42.905137
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "2f7a9d4c6b1e"
+down_revision = "9c3d5e7f1a2b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX idxgintrgmdisplayname ON hosts USING gin (display_name gin_trgm_ops)")
+    op.execute("CREATE INDEX idxgintrgmfqdn ON hosts USING gin ((canonical_facts ->> 'fqdn') gin_trgm_ops)")
+
+
+def downgrade():
+    op.drop_index("idxgintrgmfqdn", table_name="hosts")
+    op.drop_index("idxgintrgmdisplayname", table_name="hosts")
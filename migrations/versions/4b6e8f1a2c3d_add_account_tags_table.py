@@ -0,0 +1,113 @@
+"""add_account_tags_table
+
+Revision ID: 4b6e8f1a2c3d
+Revises: 8a1c2f3d4e5b
+Create Date: 2020-04-20 09:42:17.203816
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "4b6e8f1a2c3d"
+down_revision = "8a1c2f3d4e5b"
+branch_labels = None
+depends_on = None
+
+
+HOST_TAG_ROWS_FUNCTION = """
+CREATE OR REPLACE FUNCTION host_tag_rows(tags jsonb)
+RETURNS TABLE (namespace varchar, key varchar, value varchar)
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT DISTINCT ns.key, k.key, coalesce(v.value, '')
+    FROM jsonb_each(CASE WHEN jsonb_typeof(tags) = 'object' THEN tags ELSE '{}' END) AS ns
+    CROSS JOIN LATERAL jsonb_each(CASE WHEN jsonb_typeof(ns.value) = 'object' THEN ns.value ELSE '{}' END) AS k
+    CROSS JOIN LATERAL jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(k.value) = 'array' AND jsonb_array_length(k.value) > 0 THEN k.value ELSE '[null]' END
+    ) AS v
+$$;
+"""
+
+ACCOUNT_TAGS_CHANGE = """
+        INSERT INTO account_tags (account, namespace, key, value, host_count)
+        SELECT h.account, t.namespace, t.key, t.value, sum(h.change)
+        FROM ({changed_hosts}) AS h CROSS JOIN LATERAL host_tag_rows(h.tags) AS t
+        GROUP BY h.account, t.namespace, t.key, t.value
+        HAVING sum(h.change) <> 0
+        ORDER BY h.account, t.namespace, t.key, t.value
+        ON CONFLICT (account, namespace, key, value)
+        DO UPDATE SET host_count = account_tags.host_count + excluded.host_count;
+
+        DELETE FROM account_tags
+        WHERE host_count <= 0 AND account IN (SELECT h.account FROM ({changed_hosts}) AS h);
+"""
+NEW_HOSTS = "SELECT account, tags, 1 AS change FROM new_hosts"
+OLD_HOSTS = "SELECT account, tags, -1 AS change FROM old_hosts"
+
+UPDATE_ACCOUNT_TAGS_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION update_account_tags() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {ACCOUNT_TAGS_CHANGE.format(changed_hosts=NEW_HOSTS)}
+    ELSIF TG_OP = 'DELETE' THEN
+        {ACCOUNT_TAGS_CHANGE.format(changed_hosts=OLD_HOSTS)}
+    ELSE
+        {ACCOUNT_TAGS_CHANGE.format(changed_hosts=f"{NEW_HOSTS} UNION ALL {OLD_HOSTS}")}
+    END IF;
+    RETURN NULL;
+END
+$$;
+"""
+
+ACCOUNT_TAGS_TRIGGERS = """
+CREATE TRIGGER hosts_account_tags_insert AFTER INSERT ON hosts
+REFERENCING NEW TABLE AS new_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+
+CREATE TRIGGER hosts_account_tags_update AFTER UPDATE ON hosts
+REFERENCING OLD TABLE AS old_hosts NEW TABLE AS new_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+
+CREATE TRIGGER hosts_account_tags_delete AFTER DELETE ON hosts
+REFERENCING OLD TABLE AS old_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+"""
+
+FILL_IN_ACCOUNT_TAGS = """
+INSERT INTO account_tags (account, namespace, key, value, host_count)
+SELECT h.account, t.namespace, t.key, t.value, count(*)
+FROM hosts AS h CROSS JOIN LATERAL host_tag_rows(h.tags) AS t
+GROUP BY h.account, t.namespace, t.key, t.value
+"""
+
+
+def upgrade():
+    op.create_table(
+        "account_tags",
+        sa.Column("account", sa.String(length=10), nullable=False),
+        sa.Column("namespace", sa.String(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("value", sa.String(), nullable=False),
+        sa.Column("host_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("account", "namespace", "key", "value"),
+    )
+    op.create_index("idx_account_tags_host_count", "account_tags", ["account", "host_count"])
+
+    op.execute(HOST_TAG_ROWS_FUNCTION)
+    op.execute(UPDATE_ACCOUNT_TAGS_FUNCTION)
+
+    # The hosts are locked, so no change is missed between the fill in and the triggers.
+    op.execute("LOCK TABLE hosts IN SHARE MODE")
+    op.execute(FILL_IN_ACCOUNT_TAGS)
+    op.execute(ACCOUNT_TAGS_TRIGGERS)
+
+
+def downgrade():
+    for trigger in ("hosts_account_tags_insert", "hosts_account_tags_update", "hosts_account_tags_delete"):
+        op.execute(f"DROP TRIGGER {trigger} ON hosts")
+    op.execute("DROP FUNCTION update_account_tags()")
+    op.execute("DROP FUNCTION host_tag_rows(jsonb)")
+
+    op.drop_index("idx_account_tags_host_count", table_name="account_tags")
+    op.drop_table("account_tags")
@@ -0,0 +1,23 @@
+"""add_account_stale_timestamp_index
+
+Revision ID: 6e2b8c0d4f7a
+Revises: 2f7a9d4c6b1e
+Create Date: 2020-04-27 13:31:09.472861
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "6e2b8c0d4f7a"
+down_revision = "2f7a9d4c6b1e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("idxaccountstaletimestamp", "hosts", ["account", "stale_timestamp"])
+
+
+def downgrade():
+    op.drop_index("idxaccountstaletimestamp", table_name="hosts")
@@ -0,0 +1,35 @@
+"""add_host_delete_jobs_table
+
+Revision ID: 8a1c2f3d4e5b
+Revises: 33e0aca8516f
+Create Date: 2020-04-14 11:20:31.518733
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "8a1c2f3d4e5b"
+down_revision = "33e0aca8516f"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "host_delete_jobs",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("account", sa.String(length=10), nullable=False),
+        sa.Column("filters", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("status", sa.String(length=10), nullable=False),
+        sa.Column("deleted_count", sa.Integer(), nullable=False),
+        sa.Column("created_on", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("modified_on", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("host_delete_jobs")
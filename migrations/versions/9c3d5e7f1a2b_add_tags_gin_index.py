@@ -0,0 +1,23 @@
+"""add_tags_gin_index
+
+Revision ID: 9c3d5e7f1a2b
+Revises: 4b6e8f1a2c3d
+Create Date: 2020-04-22 14:03:51.640219
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "9c3d5e7f1a2b"
+down_revision = "4b6e8f1a2c3d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("idxgintags", "hosts", ["tags"], postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"})
+
+
+def downgrade():
+    op.drop_index("idxgintags", table_name="hosts")
@@ -0,0 +1,36 @@
+"""add_system_profile_indexes
+
+Revision ID: a4d1e6f3b8c2
+Revises: 6e2b8c0d4f7a
+Create Date: 2020-04-29 15:46:27.381502
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "a4d1e6f3b8c2"
+down_revision = "6e2b8c0d4f7a"
+branch_labels = None
+depends_on = None
+
+
+SYSTEM_PROFILE_INDEXES = (
+    ("idxsystemprofilearch", "(system_profile_facts ->> 'arch')"),
+    ("idxsystemprofileosrelease", "(system_profile_facts ->> 'os_release')"),
+    ("idxsystemprofileinfrastructuretype", "(system_profile_facts ->> 'infrastructure_type')"),
+    ("idxsystemprofilecloudprovider", "(system_profile_facts ->> 'cloud_provider')"),
+    ("idxsystemprofilenumberofcpus", "(CAST(system_profile_facts ->> 'number_of_cpus' AS INTEGER))"),
+    ("idxsystemprofilesapsystem", "(CAST(system_profile_facts ->> 'sap_system' AS BOOLEAN))"),
+)
+
+
+def upgrade():
+    for index_name, expression in SYSTEM_PROFILE_INDEXES:
+        op.create_index(index_name, "hosts", ["account", sa.text(expression)])
+
+
+def downgrade():
+    for index_name, _ in SYSTEM_PROFILE_INDEXES:
+        op.drop_index(index_name, table_name="hosts")
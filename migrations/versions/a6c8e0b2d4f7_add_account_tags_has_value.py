@@ -0,0 +1,142 @@
+"""add_account_tags_has_value
+
+Revision ID: a6c8e0b2d4f7
+Revises: d2c4e6a8b0f1
+Create Date: 2020-05-19 13:05:44.816390
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "a6c8e0b2d4f7"
+down_revision = "d2c4e6a8b0f1"
+branch_labels = None
+depends_on = None
+
+
+HOST_TAG_ROWS_FUNCTION = """
+CREATE OR REPLACE FUNCTION host_tag_rows(tags jsonb)
+RETURNS TABLE (namespace varchar, key varchar, value varchar)
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT DISTINCT ns.key, k.key, {value}
+    FROM jsonb_each(CASE WHEN jsonb_typeof(tags) = 'object' THEN tags ELSE '{{}}' END) AS ns
+    CROSS JOIN LATERAL jsonb_each(CASE WHEN jsonb_typeof(ns.value) = 'object' THEN ns.value ELSE '{{}}' END) AS k
+    CROSS JOIN LATERAL jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(k.value) = 'array' AND jsonb_array_length(k.value) > 0 THEN k.value ELSE '[null]' END
+    ) AS v
+$$;
+"""
+
+ACCOUNT_TAGS_CHANGE = """
+        INSERT INTO account_tags (account, namespace, key, value, has_value, host_count)
+        SELECT h.account, t.namespace, t.key, coalesce(t.value, ''), t.value IS NOT NULL, sum(h.change)
+        FROM ({changed_hosts}) AS h CROSS JOIN LATERAL host_tag_rows(h.tags) AS t
+        GROUP BY h.account, t.namespace, t.key, t.value
+        HAVING sum(h.change) <> 0
+        ORDER BY h.account, t.namespace, t.key, t.value
+        ON CONFLICT (account, namespace, key, value, has_value)
+        DO UPDATE SET host_count = account_tags.host_count + excluded.host_count;
+
+        GET DIAGNOSTICS changed_tags = ROW_COUNT;
+        IF changed_tags > 0 THEN
+            DELETE FROM account_tags
+            WHERE host_count <= 0 AND account IN (SELECT h.account FROM ({changed_hosts}) AS h);
+        END IF;
+"""
+PREVIOUS_ACCOUNT_TAGS_CHANGE = """
+        INSERT INTO account_tags (account, namespace, key, value, host_count)
+        SELECT h.account, t.namespace, t.key, t.value, sum(h.change)
+        FROM ({changed_hosts}) AS h CROSS JOIN LATERAL host_tag_rows(h.tags) AS t
+        GROUP BY h.account, t.namespace, t.key, t.value
+        HAVING sum(h.change) <> 0
+        ORDER BY h.account, t.namespace, t.key, t.value
+        ON CONFLICT (account, namespace, key, value)
+        DO UPDATE SET host_count = account_tags.host_count + excluded.host_count;
+
+        DELETE FROM account_tags
+        WHERE host_count <= 0 AND account IN (SELECT h.account FROM ({changed_hosts}) AS h);
+"""
+NEW_HOSTS = "SELECT account, tags, 1 AS change FROM new_hosts"
+OLD_HOSTS = "SELECT account, tags, -1 AS change FROM old_hosts"
+UPDATED_TAGS_HOSTS = """
+            SELECT account, tags, sum(change) AS change
+            FROM (
+                SELECT id, account, tags, 1 AS change FROM new_hosts
+                UNION ALL
+                SELECT id, account, tags, -1 AS change FROM old_hosts
+            ) AS u
+            GROUP BY id, account, tags
+            HAVING sum(change) <> 0
+"""
+
+UPDATE_ACCOUNT_TAGS_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION update_account_tags() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    changed_tags integer;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {ACCOUNT_TAGS_CHANGE.format(changed_hosts=NEW_HOSTS)}
+    ELSIF TG_OP = 'DELETE' THEN
+        {ACCOUNT_TAGS_CHANGE.format(changed_hosts=OLD_HOSTS)}
+    ELSE
+        {ACCOUNT_TAGS_CHANGE.format(changed_hosts=UPDATED_TAGS_HOSTS)}
+    END IF;
+    RETURN NULL;
+END
+$$;
+"""
+PREVIOUS_UPDATE_ACCOUNT_TAGS_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION update_account_tags() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {PREVIOUS_ACCOUNT_TAGS_CHANGE.format(changed_hosts=NEW_HOSTS)}
+    ELSIF TG_OP = 'DELETE' THEN
+        {PREVIOUS_ACCOUNT_TAGS_CHANGE.format(changed_hosts=OLD_HOSTS)}
+    ELSE
+        {PREVIOUS_ACCOUNT_TAGS_CHANGE.format(changed_hosts=f"{NEW_HOSTS} UNION ALL {OLD_HOSTS}")}
+    END IF;
+    RETURN NULL;
+END
+$$;
+"""
+
+FILL_IN_ACCOUNT_TAGS = """
+INSERT INTO account_tags (account, namespace, key, value, has_value, host_count)
+SELECT h.account, t.namespace, t.key, coalesce(t.value, ''), t.value IS NOT NULL, count(*)
+FROM hosts AS h CROSS JOIN LATERAL host_tag_rows(h.tags) AS t
+GROUP BY h.account, t.namespace, t.key, t.value
+"""
+PREVIOUS_FILL_IN_ACCOUNT_TAGS = """
+INSERT INTO account_tags (account, namespace, key, value, host_count)
+SELECT h.account, t.namespace, t.key, t.value, count(*)
+FROM hosts AS h CROSS JOIN LATERAL host_tag_rows(h.tags) AS t
+GROUP BY h.account, t.namespace, t.key, t.value
+"""
+
+
+def upgrade():
+    # The tags without a value and the tags with an empty string value share rows, they are counted again.
+    # The hosts are locked, so no change is missed meanwhile.
+    op.execute("LOCK TABLE hosts IN SHARE MODE")
+    op.execute("DELETE FROM account_tags")
+    op.add_column("account_tags", sa.Column("has_value", sa.Boolean(), nullable=False))
+    op.drop_constraint("account_tags_pkey", "account_tags", type_="primary")
+    op.create_primary_key("account_tags_pkey", "account_tags", ["account", "namespace", "key", "value", "has_value"])
+
+    op.execute(HOST_TAG_ROWS_FUNCTION.format(value="v.value"))
+    op.execute(UPDATE_ACCOUNT_TAGS_FUNCTION)
+    op.execute(FILL_IN_ACCOUNT_TAGS)
+
+
+def downgrade():
+    op.execute("LOCK TABLE hosts IN SHARE MODE")
+    op.execute("DELETE FROM account_tags")
+    op.drop_constraint("account_tags_pkey", "account_tags", type_="primary")
+    op.drop_column("account_tags", "has_value")
+    op.create_primary_key("account_tags_pkey", "account_tags", ["account", "namespace", "key", "value"])
+
+    op.execute(HOST_TAG_ROWS_FUNCTION.format(value="coalesce(v.value, '')"))
+    op.execute(PREVIOUS_UPDATE_ACCOUNT_TAGS_FUNCTION)
+    op.execute(PREVIOUS_FILL_IN_ACCOUNT_TAGS)
@@ -0,0 +1,24 @@
+"""add_host_delete_job_request_id
+
+Revision ID: b5d9f3e7a1c4
+Revises: a6c8e0b2d4f7
+Create Date: 2020-05-20 10:12:31.508217
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b5d9f3e7a1c4"
+down_revision = "a6c8e0b2d4f7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("host_delete_jobs", sa.Column("request_id", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("host_delete_jobs", "request_id")
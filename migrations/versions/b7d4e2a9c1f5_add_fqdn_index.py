@@ -0,0 +1,38 @@
+"""add_fqdn_index
+
+Revision ID: b7d4e2a9c1f5
+Revises: f3a8d6b2c9e4
+Create Date: 2020-05-14 10:12:38.562019
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b7d4e2a9c1f5"
+down_revision = "f3a8d6b2c9e4"
+branch_labels = None
+depends_on = None
+
+
+HOST_PARTITIONS = 16
+
+FQDN_INDEX_DEFINITION = "((canonical_facts ->> 'fqdn'))"
+
+
+def upgrade():
+    # An index cannot be created concurrently on a partitioned table. It is created on the parent only, invalid
+    # until the partition indexes, each created concurrently, are attached.
+    op.execute(f"CREATE INDEX idxfqdn ON ONLY hosts {FQDN_INDEX_DEFINITION}")
+    with op.get_context().autocommit_block():
+        for remainder in range(HOST_PARTITIONS):
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idxfqdn_p{remainder} "
+                f"ON hosts_p{remainder} {FQDN_INDEX_DEFINITION}"
+            )
+    for remainder in range(HOST_PARTITIONS):
+        op.execute(f"ALTER INDEX idxfqdn ATTACH PARTITION idxfqdn_p{remainder}")
+
+
+def downgrade():
+    op.execute("DROP INDEX idxfqdn")
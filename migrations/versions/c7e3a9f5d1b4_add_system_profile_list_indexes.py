@@ -0,0 +1,34 @@
+"""add_system_profile_list_indexes
+
+Revision ID: c7e3a9f5d1b4
+Revises: a4d1e6f3b8c2
+Create Date: 2020-05-04 10:52:36.118924
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "c7e3a9f5d1b4"
+down_revision = "a4d1e6f3b8c2"
+branch_labels = None
+depends_on = None
+
+
+SYSTEM_PROFILE_LIST_INDEXES = (
+    ("idxgininstalledpackages", "installed_packages"),
+    ("idxgininstalledservices", "installed_services"),
+    ("idxginenabledservices", "enabled_services"),
+)
+
+
+def upgrade():
+    for index_name, field in SYSTEM_PROFILE_LIST_INDEXES:
+        expression = sa.text(f"(system_profile_facts -> '{field}') jsonb_path_ops")
+        op.create_index(index_name, "hosts", [expression], postgresql_using="gin")
+
+
+def downgrade():
+    for index_name, _ in SYSTEM_PROFILE_LIST_INDEXES:
+        op.drop_index(index_name, table_name="hosts")
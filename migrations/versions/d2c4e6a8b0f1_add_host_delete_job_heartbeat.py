@@ -0,0 +1,24 @@
+"""add_host_delete_job_heartbeat
+
+Revision ID: d2c4e6a8b0f1
+Revises: b7d4e2a9c1f5
+Create Date: 2020-05-18 09:41:07.274613
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "d2c4e6a8b0f1"
+down_revision = "b7d4e2a9c1f5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("host_delete_jobs", sa.Column("heartbeat_on", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column("host_delete_jobs", "heartbeat_on")
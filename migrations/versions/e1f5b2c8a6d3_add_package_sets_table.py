@@ -0,0 +1,51 @@
+"""add_package_sets_table
+
+Revision ID: e1f5b2c8a6d3
+Revises: c7e3a9f5d1b4
+Create Date: 2020-05-06 16:08:14.730259
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "e1f5b2c8a6d3"
+down_revision = "c7e3a9f5d1b4"
+branch_labels = None
+depends_on = None
+
+
+PACKAGE_SET_REFERENCE_INDEXES = (
+    ("idxinstalledpackagesset", "installed_packages"),
+    ("idxinstalledservicesset", "installed_services"),
+    ("idxenabledservicesset", "enabled_services"),
+)
+
+
+def upgrade():
+    op.create_table(
+        "package_sets",
+        sa.Column("hash", sa.String(length=64), nullable=False),
+        sa.Column("items", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+    op.create_index(
+        "idxginpackagesetitems",
+        "package_sets",
+        ["items"],
+        postgresql_using="gin",
+        postgresql_ops={"items": "jsonb_path_ops"},
+    )
+
+    for index_name, field in PACKAGE_SET_REFERENCE_INDEXES:
+        op.create_index(index_name, "hosts", [sa.text(f"((system_profile_facts -> '{field}') ->> 'package_set')")])
+
+
+def downgrade():
+    for index_name, _ in PACKAGE_SET_REFERENCE_INDEXES:
+        op.drop_index(index_name, table_name="hosts")
+
+    op.drop_index("idxginpackagesetitems", table_name="package_sets")
+    op.drop_table("package_sets")
@@ -0,0 +1,222 @@
+"""partition_hosts_by_account
+
+Revision ID: f3a8d6b2c9e4
+Revises: e1f5b2c8a6d3
+Create Date: 2020-05-11 14:26:53.118402
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "f3a8d6b2c9e4"
+down_revision = "e1f5b2c8a6d3"
+branch_labels = None
+depends_on = None
+
+
+HOST_PARTITIONS = 16
+
+# The hosts are copied by ranges of their ids, so every batch is committed on its own and reads the old table
+# by its primary key. Random ids spread evenly over the ranges.
+COPY_BATCH_ID_PREFIXES = tuple(f"{prefix:02x}" for prefix in range(256))
+
+HOST_COLUMNS = (
+    "id",
+    "account",
+    "display_name",
+    "ansible_host",
+    "created_on",
+    "modified_on",
+    "facts",
+    "tags",
+    "canonical_facts",
+    "system_profile_facts",
+    "stale_timestamp",
+    "reporter",
+)
+
+# Every index is declared on each partition as <name>_p<remainder> and then on the partitioned table, which
+# adopts the partition ones.
+HOST_INDEXES = (
+    ("idxaccount", "(account)"),
+    ("idxinsightsid", "((canonical_facts ->> 'insights_id'))"),
+    ("idxgincanonicalfacts", "USING gin (canonical_facts jsonb_path_ops)"),
+    ("hosts_modified_on_id", "(modified_on DESC, id DESC)"),
+    ("hosts_subscription_manager_id_index", "((canonical_facts ->> 'subscription_manager_id'))"),
+    ("idxgintags", "USING gin (tags jsonb_path_ops)"),
+    ("idxgintrgmdisplayname", "USING gin (display_name gin_trgm_ops)"),
+    ("idxgintrgmfqdn", "USING gin ((canonical_facts ->> 'fqdn') gin_trgm_ops)"),
+    ("idxaccountstaletimestamp", "(account, stale_timestamp)"),
+    ("idxsystemprofilearch", "(account, (system_profile_facts ->> 'arch'))"),
+    ("idxsystemprofileosrelease", "(account, (system_profile_facts ->> 'os_release'))"),
+    ("idxsystemprofileinfrastructuretype", "(account, (system_profile_facts ->> 'infrastructure_type'))"),
+    ("idxsystemprofilecloudprovider", "(account, (system_profile_facts ->> 'cloud_provider'))"),
+    ("idxsystemprofilenumberofcpus", "(account, (CAST(system_profile_facts ->> 'number_of_cpus' AS INTEGER)))"),
+    ("idxsystemprofilesapsystem", "(account, (CAST(system_profile_facts ->> 'sap_system' AS BOOLEAN)))"),
+    ("idxgininstalledpackages", "USING gin ((system_profile_facts -> 'installed_packages') jsonb_path_ops)"),
+    ("idxgininstalledservices", "USING gin ((system_profile_facts -> 'installed_services') jsonb_path_ops)"),
+    ("idxginenabledservices", "USING gin ((system_profile_facts -> 'enabled_services') jsonb_path_ops)"),
+    ("idxinstalledpackagesset", "(((system_profile_facts -> 'installed_packages') ->> 'package_set'))"),
+    ("idxinstalledservicesset", "(((system_profile_facts -> 'installed_services') ->> 'package_set'))"),
+    ("idxenabledservicesset", "(((system_profile_facts -> 'enabled_services') ->> 'package_set'))"),
+)
+
+# The keys of the hosts deleted while they are copied, see DELETE_COPIED_DELETED_HOSTS.
+CREATE_DELETED_HOSTS_TABLE = "CREATE TABLE hosts_copy_deleted (id uuid NOT NULL, account varchar(10))"
+
+# Until the tables are swapped, every change of the old table is repeated on the partitioned one. An updated
+# host is deleted and inserted again, because its new account can belong to a different partition.
+COPY_HOST_CHANGE_FUNCTION = f"""
+CREATE FUNCTION copy_host_change() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM hosts_partitioned WHERE id = OLD.id AND account = OLD.account;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO hosts_copy_deleted VALUES (OLD.id, OLD.account);
+    ELSIF TG_OP = 'UPDATE' AND (OLD.id, OLD.account) IS DISTINCT FROM (NEW.id, NEW.account) THEN
+        INSERT INTO hosts_copy_deleted VALUES (OLD.id, OLD.account);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO hosts_partitioned SELECT NEW.*
+        ON CONFLICT (id, account)
+        DO UPDATE SET ({", ".join(HOST_COLUMNS)}) = ({", ".join(f"excluded.{column}" for column in HOST_COLUMNS)});
+    END IF;
+    RETURN NULL;
+END
+$$;
+"""
+
+COPY_HOST_CHANGE_TRIGGER = """
+CREATE TRIGGER hosts_copy_change AFTER INSERT OR UPDATE OR DELETE ON hosts
+FOR EACH ROW EXECUTE PROCEDURE copy_host_change();
+"""
+
+# A host already copied by a batch is not overwritten, the copy of its change is newer.
+COPY_HOSTS = """
+INSERT INTO hosts_partitioned
+SELECT * FROM hosts WHERE {condition}
+ON CONFLICT (id, account) DO NOTHING
+"""
+
+# A batch can copy a host deleted after the batch started, the trigger found nothing to delete then. Only the
+# recorded deleted hosts are checked, so the locked swap takes time by the changes, not by the hosts.
+DELETE_COPIED_DELETED_HOSTS = """
+DELETE FROM hosts_partitioned AS p
+USING hosts_copy_deleted AS d
+WHERE p.id = d.id AND p.account = d.account
+AND NOT EXISTS (SELECT 1 FROM hosts AS h WHERE h.id = d.id AND h.account IS NOT DISTINCT FROM d.account)
+"""
+
+# The publications of the table or of its partitions, Debezium streams the host changes to xjoin from one.
+TABLE_PUBLICATIONS = """
+SELECT DISTINCT p.pubname, p.puballtables
+FROM pg_publication AS p
+LEFT JOIN pg_publication_rel AS r ON r.prpubid = p.oid
+WHERE p.puballtables
+OR r.prrelid = '{table}'::regclass
+OR r.prrelid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = '{table}'::regclass)
+"""
+
+ACCOUNT_TAGS_TRIGGERS = """
+CREATE TRIGGER hosts_account_tags_insert AFTER INSERT ON hosts
+REFERENCING NEW TABLE AS new_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+
+CREATE TRIGGER hosts_account_tags_update AFTER UPDATE ON hosts
+REFERENCING OLD TABLE AS old_hosts NEW TABLE AS new_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+
+CREATE TRIGGER hosts_account_tags_delete AFTER DELETE ON hosts
+REFERENCING OLD TABLE AS old_hosts
+FOR EACH STATEMENT EXECUTE PROCEDURE update_account_tags();
+"""
+
+
+def _partitions():
+    return tuple(f"hosts_p{remainder}" for remainder in range(HOST_PARTITIONS))
+
+
+def _copy_batch_conditions():
+    bounds = [f"{prefix}000000-0000-0000-0000-000000000000" for prefix in COPY_BATCH_ID_PREFIXES[1:]]
+    yield f"id < '{bounds[0]}'"
+    for low, high in zip(bounds, bounds[1:]):
+        yield f"id >= '{low}' AND id < '{high}'"
+    yield f"id >= '{bounds[-1]}'"
+
+
+def _swap_tables(old_name, new_name, new_index_suffix, partitions=()):
+    publications = op.get_bind().execute(TABLE_PUBLICATIONS.format(table=old_name)).fetchall()
+    op.execute(f"DROP TABLE {old_name}")
+    op.execute(f"ALTER TABLE {new_name} RENAME TO {old_name}")
+    op.execute(f"ALTER TABLE {old_name} RENAME CONSTRAINT {new_name}_pkey TO {old_name}_pkey")
+    for index_name, _ in HOST_INDEXES:
+        op.execute(f"ALTER INDEX {index_name}{new_index_suffix} RENAME TO {index_name}")
+    op.execute(ACCOUNT_TAGS_TRIGGERS)
+
+    # Debezium needs the whole old rows of the changed hosts, see 5544cd265053. The rows are stored in the
+    # partitions, which do not take the replica identity over from the partitioned table.
+    for table in (old_name, *partitions):
+        op.execute(f"ALTER TABLE {table} REPLICA IDENTITY FULL")
+    _publish(old_name, partitions, publications)
+
+
+def _publish(table, partitions, publications):
+    """
+    Adds the new table to the publications of the dropped one. Since PostgreSQL 13 a partitioned table is
+    published as a whole and its changes are published under its own name, as before. Until then only the
+    partitions can be published, each under its own name, the Debezium connector has to include and route
+    them.
+    """
+    via_partition_root = partitions and op.get_bind().dialect.server_version_info >= (13,)
+    published_tables = partitions if partitions and not via_partition_root else (table,)
+    for name, all_tables in publications:
+        if not all_tables:
+            op.execute(f"ALTER PUBLICATION {name} ADD TABLE {', '.join(published_tables)}")
+        if via_partition_root:
+            op.execute(f"ALTER PUBLICATION {name} SET (publish_via_partition_root = true)")
+
+
+def upgrade():
+    # The partition key must be a part of the primary key.
+    op.execute(
+        "CREATE TABLE hosts_partitioned (LIKE hosts INCLUDING DEFAULTS, PRIMARY KEY (id, account)) "
+        "PARTITION BY HASH (account)"
+    )
+    for remainder, partition in enumerate(_partitions()):
+        op.execute(
+            f"CREATE TABLE {partition} PARTITION OF hosts_partitioned "
+            f"FOR VALUES WITH (MODULUS {HOST_PARTITIONS}, REMAINDER {remainder})"
+        )
+        for index_name, definition in HOST_INDEXES:
+            op.execute(f"CREATE INDEX {index_name}_p{remainder} ON {partition} {definition}")
+    for index_name, definition in HOST_INDEXES:
+        op.execute(f"CREATE INDEX {index_name}_partitioned ON hosts_partitioned {definition}")
+
+    op.execute(CREATE_DELETED_HOSTS_TABLE)
+    op.execute(COPY_HOST_CHANGE_FUNCTION)
+    op.execute(COPY_HOST_CHANGE_TRIGGER)
+
+    # The hosts stay readable and writable while they are copied.
+    with op.get_context().autocommit_block():
+        for condition in _copy_batch_conditions():
+            op.execute(COPY_HOSTS.format(condition=condition))
+
+    # Only the swap itself blocks the hosts.
+    op.execute("LOCK TABLE hosts IN ACCESS EXCLUSIVE MODE")
+    op.execute(DELETE_COPIED_DELETED_HOSTS)
+    _swap_tables("hosts", "hosts_partitioned", "_partitioned", _partitions())
+    op.execute("DROP FUNCTION copy_host_change()")
+    op.execute("DROP TABLE hosts_copy_deleted")
+
+
+def downgrade():
+    # Copied at once with the hosts blocked, a downgrade is not expected to run online.
+    op.execute("LOCK TABLE hosts IN ACCESS EXCLUSIVE MODE")
+    op.execute("CREATE TABLE hosts_unpartitioned (LIKE hosts INCLUDING DEFAULTS, PRIMARY KEY (id))")
+    op.execute("ALTER TABLE hosts_unpartitioned ALTER COLUMN account DROP NOT NULL")
+    op.execute("INSERT INTO hosts_unpartitioned SELECT * FROM hosts")
+    for index_name, definition in HOST_INDEXES:
+        op.execute(f"CREATE INDEX {index_name}_unpartitioned ON hosts_unpartitioned {definition}")
+    _swap_tables("hosts", "hosts_unpartitioned", "_unpartitioned")
@@ -18,6 +18,14 @@ def api_create_or_update_host(flask_client):
     return _api_create_or_update_host
 
 
+@pytest.fixture(scope="function")
+def api_post(flask_client):
+    def _api_post(url, host_data, query_parameters=None, extra_headers=None):
+        return do_request(flask_client.post, url, host_data, query_parameters, extra_headers)
+
+    return _api_post
+
+
 @pytest.fixture(scope="function")
 def api_patch(flask_client):
     def _api_patch(url, host_data, query_parameters=None, extra_headers=None):
@@ -51,6 +59,16 @@ def api_delete_host(flask_client):
     return _api_delete_host
 
 
+@pytest.fixture(scope="function")
+def api_delete_host_list(flask_client):
+    def _api_delete_host_list(query_parameters=None, extra_headers=None):
+        return do_request(
+            flask_client.delete, HOST_URL, query_parameters=query_parameters, extra_headers=extra_headers
+        )
+
+    return _api_delete_host_list
+
+
 @pytest.fixture(scope="function")
 def disable_rest_api_post(inventory_config):
     inventory_config.rest_post_enabled = False
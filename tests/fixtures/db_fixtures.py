@@ -1,4 +1,7 @@
+from unittest.mock import Mock
+
 import pytest
+from sqlalchemy import event
 from sqlalchemy_utils import create_database
 from sqlalchemy_utils import database_exists
 from sqlalchemy_utils import drop_database
@@ -7,6 +10,8 @@ from app import db
 from app.config import Config
 from app.config import RuntimeEnvironment
 from app.models import Host
+from app.models import REPLICA_BIND
+from app.replica import RecentWrites
 from tests.helpers.db_utils import minimal_db_host
 from tests.helpers.test_utils import set_environment
 
@@ -31,7 +36,7 @@ def database(database_name):
 @pytest.fixture(scope="function")
 def db_get_host(flask_app):
     def _db_get_host(host_id):
-        return Host.query.get(host_id)
+        return Host.query.filter(Host.id == host_id).one_or_none()
 
     return _db_get_host
 
@@ -92,3 +97,30 @@ def db_create_host_in_unknown_state(db_create_host):
     host.stale_timestamp = None
     host.reporter = None
     return db_create_host(host)
+
+
+@pytest.fixture(scope="function")
+def db_read_replica(flask_app, monkeypatch):
+    """
+    Configures the test database as the read replica too. Returns the statements executed on the replica
+    and the mocked replica lag monitor.
+    """
+    monkeypatch.setitem(
+        flask_app.config, "SQLALCHEMY_BINDS", {REPLICA_BIND: flask_app.config["INVENTORY_CONFIG"].db_uri}
+    )
+    replica_lag_monitor = Mock(**{"usable.return_value": True})
+    monkeypatch.setattr(flask_app, "replica_lag_monitor", replica_lag_monitor)
+    monkeypatch.setattr(flask_app, "replica_recent_writes", RecentWrites(60))
+
+    statements = []
+
+    def _record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    replica_engine = db.get_engine(flask_app, bind=REPLICA_BIND)
+    event.listen(replica_engine, "before_cursor_execute", _record_statement)
+
+    yield statements, replica_lag_monitor
+
+    event.remove(replica_engine, "before_cursor_execute", _record_statement)
+    db.session.remove()
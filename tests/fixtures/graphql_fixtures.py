@@ -4,11 +4,14 @@ from datetime import timezone
 
 import pytest
 
+from api.shadow_read import ShadowReader
 from app.config import BulkQuerySource
+from app.query_cache import QueryResultCache
 from tests.helpers.graphql_utils import EMPTY_HOSTS_RESPONSE
 from tests.helpers.graphql_utils import TAGS_EMPTY_RESPONSE
 from tests.helpers.graphql_utils import XJOIN_HOSTS_RESPONSE
 from tests.helpers.graphql_utils import XJOIN_TAGS_RESPONSE
+from tests.helpers.xjoin_stand_in import XjoinStandIn
 
 
 @pytest.fixture(scope="function")
@@ -40,10 +43,21 @@ def graphql_tag_query_with_response(graphql_query):
 
 
 @pytest.fixture(scope="function")
-def patch_xjoin_post(mocker, query_source_xjoin):
+def xjoin_query_cache(flask_app, inventory_config):
+    original_query_cache = flask_app.xjoin_query_cache
+    flask_app.xjoin_query_cache = QueryResultCache(
+        inventory_config.xjoin_query_cache_size, inventory_config.xjoin_query_cache_ttl
+    )
+    yield flask_app.xjoin_query_cache
+    flask_app.xjoin_query_cache = original_query_cache
+
+
+@pytest.fixture(scope="function")
+def patch_xjoin_post(mocker, flask_app, query_source_xjoin, xjoin_query_cache):
     def _patch_xjoin_post(response, status=200):
-        return mocker.patch(
-            "app.xjoin.post",
+        return mocker.patch.object(
+            flask_app.xjoin_client.session,
+            "post",
             **{
                 "return_value.text": json.dumps(response),
                 "return_value.json.return_value": response,
@@ -54,6 +68,14 @@ def patch_xjoin_post(mocker, query_source_xjoin):
     return _patch_xjoin_post
 
 
+@pytest.fixture(scope="function")
+def xjoin_circuit_breaker(flask_app):
+    circuit_breaker = flask_app.xjoin_client.circuit_breaker
+    yield circuit_breaker
+    circuit_breaker.record_success()
+    flask_app.xjoin_client.shadow_circuit_breaker.record_success()
+
+
 @pytest.fixture(scope="function")
 def query_source_xjoin(inventory_config):
     inventory_config.bulk_query_source = BulkQuerySource.xjoin
@@ -84,3 +106,21 @@ def culling_datetime_mock(mocker):
     date = datetime(2019, 12, 16, 10, 10, 6, 754201, tzinfo=timezone.utc)
     mock = mocker.patch("app.culling.datetime", **{"now.return_value": date})
     return mock.now.return_value
+
+
+@pytest.fixture(scope="function")
+def xjoin_stand_in(flask_app, inventory_config, xjoin_query_cache):
+    session = flask_app.xjoin_client.session
+    stand_in = XjoinStandIn()
+    session.mount(inventory_config.xjoin_graphql_url, stand_in)
+    yield stand_in
+    del session.adapters[inventory_config.xjoin_graphql_url]
+
+
+@pytest.fixture(scope="function")
+def shadow_reader(flask_app):
+    original_shadow_reader = flask_app.shadow_reader
+    flask_app.shadow_reader = ShadowReader(1, 10)
+    yield flask_app.shadow_reader
+    flask_app.shadow_reader.shutdown()
+    flask_app.shadow_reader = original_shadow_reader
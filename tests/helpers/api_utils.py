@@ -312,6 +312,10 @@ def build_host_tags_url(host_list_or_id, query=None):
     return _build_url(path="/tags", host_list_or_id=host_list_or_id, query=query)
 
 
+def build_tags_operation_url():
+    return _build_url(path="/tags")
+
+
 def build_tags_count_url(host_list_or_id, query=None):
     return _build_url(path="/tags/count", host_list_or_id=host_list_or_id, query=query)
 
@@ -320,6 +324,10 @@ def build_tags_url(query=None):
     return _build_url(base_url=TAGS_URL, query=query)
 
 
+def build_delete_job_url(job_id):
+    return _build_url(path=f"/delete_jobs/{job_id}")
+
+
 def build_system_profile_url(host_list_or_id, query=None):
     return _build_url(path="/system_profile", host_list_or_id=host_list_or_id, query=query)
 
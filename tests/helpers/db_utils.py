@@ -1,3 +1,4 @@
+import re
 from datetime import timedelta
 from random import randint
 
@@ -18,6 +19,40 @@ DB_FACTS = {DB_FACTS_NAMESPACE: {"key1": "value1"}}
 DB_NEW_FACTS = {"newfact1": "newvalue1", "newfact2": "newvalue2"}
 
 
+def explain(query, enable_seqscan=False):
+    """
+    Returns the query plan of the ORM query. The tables are vacuumed and analyzed first and the
+    sequential scan is disabled by default, so the planner uses an index even on a small test table
+    if it can.
+    """
+    dialect = db.session.bind.dialect
+    statement = query.statement.compile(dialect=dialect)
+    params = {}
+    for name, value in statement.params.items():
+        bind_processor = statement.binds[name].type.bind_processor(dialect)
+        params[name] = bind_processor(value) if bind_processor else value
+
+    db.session.commit()
+    with db.engine.connect() as autocommit_connection:
+        for table in statement.statement.froms:
+            autocommit_connection.execution_options(isolation_level="AUTOCOMMIT").execute(
+                f"VACUUM ANALYZE {table.name}"
+            )
+
+    connection = db.session.connection()
+    connection.execute(f"SET LOCAL enable_seqscan = {'on' if enable_seqscan else 'off'}")
+    plan = connection.execute(f"EXPLAIN {statement}", params).fetchall()
+    db.session.rollback()
+    return "\n".join(row[0] for row in plan)
+
+
+def scanned_partitions(plan):
+    """
+    Returns the names of the hosts table partitions scanned by the query plan.
+    """
+    return set(re.findall(r" on (hosts_p\d+)", plan))
+
+
 def clean_tables():
     def _clean_tables():
         try:
@@ -69,7 +104,7 @@ def db_host(**values):
 
 
 def update_host_in_db(host_id, **data_to_update):
-    host = Host.query.get(host_id)
+    host = Host.query.filter(Host.id == host_id).one()
 
     for attribute, new_value in data_to_update.items():
         setattr(host, attribute, new_value)
@@ -98,5 +98,8 @@ def assert_called_with_headers(mocker, post, request_id):
     identity = get_valid_auth_header().get("x-rh-identity").decode()
 
     post.assert_called_once_with(
-        mocker.ANY, json=mocker.ANY, headers={"x-rh-identity": identity, "x-rh-insights-request-id": request_id}
+        mocker.ANY,
+        json=mocker.ANY,
+        headers={"x-rh-identity": identity, "x-rh-insights-request-id": request_id},
+        timeout=mocker.ANY,
     )
@@ -0,0 +1,106 @@
+from json import dumps
+from json import loads
+
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from app import IDENTITY_HEADER
+from app.auth.identity import from_auth_header
+from app.models import Host
+
+ORDER_HOW_DEFAULTS = {"modified_on": "DESC", "display_name": "ASC"}
+
+
+class XjoinStandIn(BaseAdapter):
+    """
+    A local stand-in for xjoin-search, mounted on the xjoin-search client session. It answers the hosts and the
+    hostTags queries from the inventory database, without the network. The pagination and the ordering are
+    applied, the filters are not: the answers match the database ones only for the unfiltered queries of the
+    fresh hosts. The hidden hosts are left out of the answers, to make them differ.
+    """
+
+    def __init__(self, hidden_host_ids=()):
+        super().__init__()
+        self.hidden_host_ids = set(hidden_host_ids)
+        self.queries = []
+
+    def send(self, request, **kwargs):
+        payload = loads(request.body)
+        self.queries.append(payload)
+
+        account = from_auth_header(request.headers[IDENTITY_HEADER]).account_number
+        if "hostTags" in payload["query"]:
+            hosts = self._visible_hosts(Host.query.filter(Host.account == account))
+            data = {"hostTags": _host_tags(hosts, payload["variables"])}
+        else:
+            hosts = self._visible_hosts(_ordered_host_query(account, payload["variables"]))
+            data = {"hosts": _hosts(hosts, payload["variables"])}
+
+        return _response(request, {"data": data})
+
+    def close(self):
+        pass
+
+    def _visible_hosts(self, query):
+        return [host for host in query if host.id not in self.hidden_host_ids]
+
+
+def _ordered_host_query(account, variables):
+    order_by = variables.get("order_by") or "modified_on"
+    order_how = variables.get("order_how") or ORDER_HOW_DEFAULTS[order_by]
+    column = getattr(Host, order_by)
+    ordering = (column.asc() if order_how == "ASC" else column.desc(),)
+    # The same tie breakers as the database query.
+    if order_by != "modified_on":
+        ordering += (Host.modified_on.desc(),)
+    ordering += (Host.id.desc(),)
+    return Host.query.filter(Host.account == account).order_by(*ordering)
+
+
+def _hosts(hosts, variables):
+    page = _page(hosts, variables)
+    return {"meta": {"total": len(hosts)}, "data": [_serialize_host(host) for host in page]}
+
+
+def _host_tags(hosts, variables):
+    counts = {}
+    for host in hosts:
+        for namespace, keys in (host.tags or {}).items():
+            for key, values in keys.items():
+                for value in values or (None,):
+                    tag = (namespace, key, value)
+                    counts[tag] = counts.get(tag, 0) + 1
+
+    tags = sorted(counts.items(), key=lambda item: tuple(part or "" for part in item[0]))
+    data = [{"tag": {"namespace": tag[0], "key": tag[1], "value": tag[2]}, "count": count} for tag, count in tags]
+    return {"meta": {"count": len(data), "total": len(data)}, "data": _page(data, variables)}
+
+
+def _page(items, variables):
+    offset = variables.get("offset") or 0
+    return items[offset : offset + variables["limit"]]  # noqa: E203
+
+
+def _serialize_host(host):
+    return {
+        "id": str(host.id),
+        "account": host.account,
+        "display_name": host.display_name,
+        "ansible_host": host.ansible_host,
+        "created_on": host.created_on.isoformat(),
+        "modified_on": host.modified_on.isoformat(),
+        "canonical_facts": host.canonical_facts,
+        "facts": host.facts,
+        "stale_timestamp": host.stale_timestamp.isoformat(),
+        "reporter": host.reporter,
+    }
+
+
+def _response(request, body):
+    response = Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = dumps(body).encode()
+    response.request = request
+    response.url = request.url
+    return response
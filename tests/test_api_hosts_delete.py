@@ -1,8 +1,27 @@
+import json
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest import mock
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import Delete
+
+from app import UNKNOWN_REQUEST_ID_VALUE
+from app.logging import threadctx
+from app.models import db
 from app.models import Host
+from app.models import HostDeleteJob
+from app.models import HostDeleteJobStatus
+from host_delete_worker import run as host_delete_worker_run
+from lib.host_delete import delete_host_chunks
 from lib.host_delete import delete_hosts
 from tests.helpers.api_utils import assert_response_status
+from tests.helpers.api_utils import build_delete_job_url
 from tests.helpers.db_utils import db_host
 from tests.helpers.mq_utils import assert_delete_event_is_valid
+from tests.helpers.test_utils import ACCOUNT
 from tests.helpers.test_utils import generate_uuid
 
 
@@ -155,6 +174,250 @@ def test_delete_when_some_hosts_is_deleted(event_producer_mock, db_create_multip
     assert host_id_list[1] == event_producer_mock.key
 
 
+def test_delete_host_list_by_filter(
+    event_datetime_mock,
+    event_producer_mock,
+    db_create_multiple_hosts,
+    db_get_hosts,
+    api_delete_host_list,
+    inventory_config,
+    mocker,
+):
+    write_event = mocker.spy(event_producer_mock, "write_event")
+
+    hosts = db_create_multiple_hosts(how_many=2, extra_data={"display_name": "delete-me"})
+    kept_host = db_host(display_name="keep-me")
+    db_create_multiple_hosts(hosts=[kept_host])
+    deleted_ids = sorted(str(host.id) for host in hosts)
+
+    response_status, response_data = api_delete_host_list(query_parameters={"display_name": "delete-me"})
+
+    assert_response_status(response_status, expected_status=202)
+    assert response_data["status"] == "pending"
+    assert response_data["filters"]["display_name"] == "delete-me"
+
+    # The API process only stores the job, the host delete worker runs it.
+    assert db_get_hosts(deleted_ids).count() == 2
+    write_event.assert_not_called()
+
+    run_host_delete_worker(inventory_config, event_producer_mock)
+
+    assert not db_get_hosts(deleted_ids).count()
+    assert db_get_hosts([kept_host.id]).count() == 1
+
+    assert write_event.call_count == 2
+    assert sorted(call[0][1] for call in write_event.call_args_list) == deleted_ids
+    for call in write_event.call_args_list:
+        event = json.loads(call[0][0])
+        assert event["type"] == "delete"
+        assert event["id"] in deleted_ids
+
+
+def test_delete_host_list_events_carry_request_id(
+    event_producer_mock, db_create_multiple_hosts, api_delete_host_list, inventory_config, mocker
+):
+    write_event = mocker.spy(event_producer_mock, "write_event")
+    db_create_multiple_hosts(how_many=2, extra_data={"display_name": "delete-me"})
+    request_id = generate_uuid()
+
+    response_status, response_data = api_delete_host_list(
+        query_parameters={"display_name": "delete-me"}, extra_headers={"x-rh-insights-request-id": request_id}
+    )
+    assert_response_status(response_status, expected_status=202)
+
+    run_host_delete_worker(inventory_config, event_producer_mock)
+
+    assert write_event.call_count == 2
+    for call in write_event.call_args_list:
+        assert json.loads(call[0][0])["request_id"] == request_id
+        assert call[0][2]["request_id"] == request_id
+    assert threadctx.request_id == UNKNOWN_REQUEST_ID_VALUE
+
+
+def test_delete_host_list_job_status(
+    event_producer_mock, db_create_multiple_hosts, api_delete_host_list, api_get, inventory_config, mocker
+):
+    mocker.patch("api.host_delete_job.delete_host_chunks", wraps=_delete_host_chunks_by_one)
+
+    db_create_multiple_hosts(how_many=3, extra_data={"display_name": "delete-me"})
+
+    response_status, response_data = api_delete_host_list(query_parameters={"display_name": "delete-me"})
+    assert_response_status(response_status, expected_status=202)
+    job_url = build_delete_job_url(response_data["id"])
+
+    run_host_delete_worker(inventory_config, event_producer_mock)
+
+    response_status, response_data = api_get(job_url)
+
+    assert_response_status(response_status, expected_status=200)
+    assert response_data["status"] == "finished"
+    assert response_data["deleted"] == 3
+    assert response_data["filters"]["staleness"] == ["fresh", "stale", "unknown"]
+
+
+def test_delete_host_list_without_filters(db_create_host, db_get_host, api_delete_host_list):
+    host = db_create_host()
+
+    response_status, response_data = api_delete_host_list()
+
+    assert_response_status(response_status, expected_status=400)
+    assert not HostDeleteJob.query.count()
+    assert db_get_host(host.id)
+
+
+def test_delete_host_list_with_invalid_tag(api_delete_host_list):
+    too_long = "a" * 256
+    response_status, response_data = api_delete_host_list(query_parameters={"tags": f"{too_long}/key=val"})
+
+    assert_response_status(response_status, expected_status=400)
+    assert not HostDeleteJob.query.count()
+
+
+def test_get_non_existent_delete_job(api_get):
+    response_status, response_data = api_get(build_delete_job_url(generate_uuid()))
+
+    assert_response_status(response_status, expected_status=404)
+
+
+def test_get_delete_job_of_different_account(api_delete_host_list, api_get, mocker):
+    response_status, response_data = api_delete_host_list(query_parameters={"display_name": "delete-me"})
+    assert_response_status(response_status, expected_status=202)
+
+    mocker.patch("api.host.current_identity", account_number="some-other-account")
+    response_status, response_data = api_get(build_delete_job_url(response_data["id"]))
+
+    assert_response_status(response_status, expected_status=404)
+
+
+def test_stale_running_delete_job_is_resumed(
+    event_producer_mock, db_create_multiple_hosts, db_get_hosts, inventory_config
+):
+    hosts = db_create_multiple_hosts(how_many=2, extra_data={"display_name": "delete-me"})
+    host_ids = [host.id for host in hosts]
+    job = db_delete_job(
+        inventory_config,
+        status=HostDeleteJobStatus.running,
+        heartbeat_age=inventory_config.host_delete_job_stale_timeout + 1,
+    )
+
+    run_host_delete_worker(inventory_config, event_producer_mock)
+
+    assert not db_get_hosts(host_ids).count()
+    assert job.status == HostDeleteJobStatus.finished.name
+    assert job.deleted_count == 2
+
+
+def test_running_delete_job_with_heartbeat_is_not_claimed(
+    event_producer_mock, db_create_multiple_hosts, db_get_hosts, inventory_config
+):
+    hosts = db_create_multiple_hosts(how_many=2, extra_data={"display_name": "delete-me"})
+    job = db_delete_job(inventory_config, status=HostDeleteJobStatus.running, heartbeat_age=1)
+
+    run_host_delete_worker(inventory_config, event_producer_mock)
+
+    assert db_get_hosts([host.id for host in hosts]).count() == 2
+    assert job.status == HostDeleteJobStatus.running.name
+
+
+def test_interrupted_delete_job_is_returned_to_pending(
+    event_producer_mock, db_create_multiple_hosts, db_get_hosts, inventory_config, mocker
+):
+    mocker.patch("api.host_delete_job.delete_host_chunks", wraps=_delete_host_chunks_by_one)
+
+    hosts = db_create_multiple_hosts(how_many=3, extra_data={"display_name": "delete-me"})
+    host_ids = [host.id for host in hosts]
+    job = db_delete_job(inventory_config)
+
+    # Not shut down before claiming the job, shut down after its first chunk.
+    run_host_delete_worker(inventory_config, event_producer_mock, shut_down=(False, True, True, True))
+
+    assert db_get_hosts(host_ids).count() == 2
+    assert job.status == HostDeleteJobStatus.pending.name
+    assert job.deleted_count == 1
+    assert job.heartbeat_on
+
+
+def test_delete_job_continues_after_chunk_deleted_concurrently(
+    event_producer_mock, db_create_multiple_hosts, db_get_hosts, inventory_config, mocker
+):
+    mocker.patch("api.host_delete_job.delete_host_chunks", wraps=_delete_host_chunks_by_one)
+    write_event = mocker.spy(event_producer_mock, "write_event")
+
+    hosts = db_create_multiple_hosts(how_many=3, extra_data={"display_name": "delete-me"})
+    host_ids = [host.id for host in hosts]
+    job = db_delete_job(inventory_config)
+    # E.g. the reaper deletes the hosts of the first chunk after they are selected.
+    patch_before_first_chunk_delete(mocker, lambda host_table, host_ids: host_table.delete().where(host_ids))
+
+    run_host_delete_worker(inventory_config, event_producer_mock)
+
+    assert not db_get_hosts(host_ids).count()
+    assert job.status == HostDeleteJobStatus.finished.name
+    assert job.deleted_count == 2
+    assert write_event.call_count == 2
+
+
+def test_delete_job_keeps_host_changed_concurrently(
+    event_producer_mock, db_create_multiple_hosts, db_get_hosts, inventory_config, mocker
+):
+    mocker.patch("api.host_delete_job.delete_host_chunks", wraps=_delete_host_chunks_by_one)
+
+    hosts = db_create_multiple_hosts(how_many=3, extra_data={"display_name": "delete-me"})
+    host_ids = [host.id for host in hosts]
+    job = db_delete_job(inventory_config)
+    changed_host_ids = patch_before_first_chunk_delete(
+        mocker, lambda host_table, host_ids: host_table.update().where(host_ids).values(display_name="keep-me")
+    )
+
+    run_host_delete_worker(inventory_config, event_producer_mock)
+
+    assert [host.id for host in db_get_hosts(host_ids)] == changed_host_ids
+    assert job.status == HostDeleteJobStatus.finished.name
+    assert job.deleted_count == 2
+
+
+def patch_before_first_chunk_delete(mocker, concurrent_statement):
+    """
+    Runs the concurrent statement on the hosts of the first chunk, after they are selected but before they
+    are deleted. Returns the ids of those hosts.
+    """
+    original_execute = Session.execute
+    chunk_host_ids = []
+
+    def _execute(session, statement, *args, **kwargs):
+        if isinstance(statement, Delete) and not chunk_host_ids:
+            chunk_host_ids.extend(value for value in statement.compile().params.values() if isinstance(value, UUID))
+            host_table = Host.__table__
+            original_execute(session, concurrent_statement(host_table, host_table.c.id.in_(chunk_host_ids)))
+        return original_execute(session, statement, *args, **kwargs)
+
+    mocker.patch.object(Session, "execute", autospec=True, side_effect=_execute)
+    return chunk_host_ids
+
+
+def run_host_delete_worker(inventory_config, event_producer, shut_down=None):
+    shutdown_handler = mock.Mock(**{"shut_down.return_value": False})
+    if shut_down:
+        shutdown_handler.shut_down.side_effect = shut_down
+
+    threadctx.request_id = UNKNOWN_REQUEST_ID_VALUE
+    host_delete_worker_run(inventory_config, mock.Mock(), event_producer, shutdown_handler)
+
+
+def db_delete_job(inventory_config, status=HostDeleteJobStatus.pending, heartbeat_age=None):
+    job = HostDeleteJob(ACCOUNT, {"display_name": "delete-me", "staleness": ["fresh"]})
+    job.set_status(status)
+    if heartbeat_age is not None:
+        job.heartbeat_on = datetime.now(timezone.utc) - timedelta(seconds=heartbeat_age)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def _delete_host_chunks_by_one(select_query, event_producer, interrupt=lambda: False):
+    return delete_host_chunks(select_query, event_producer, chunk_size=1, interrupt=interrupt)
+
+
 class DeleteHostsMock:
     @classmethod
     def create_mock(cls, hosts_ids_to_delete):
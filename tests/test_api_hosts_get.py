@@ -1,11 +1,19 @@
 import copy
+import json
 import uuid
 from itertools import chain
 
 import pytest
+from sqlalchemy import event
 
+from api.host_query_db import host_list_query
+from app import db
+from app.models import Host
+from app.models import PackageSet
+from app.serialization import serialize_host
 from app.utils import HostWrapper
 from lib.host_repository import canonical_fact_host_query
+from lib.host_repository import canonical_facts_host_query
 from tests.helpers.api_utils import api_base_pagination_test
 from tests.helpers.api_utils import api_pagination_invalid_parameters_test
 from tests.helpers.api_utils import api_pagination_test
@@ -18,16 +26,22 @@ from tests.helpers.api_utils import build_host_id_list_for_url
 from tests.helpers.api_utils import build_hosts_url
 from tests.helpers.api_utils import build_order_query_parameters
 from tests.helpers.api_utils import build_system_profile_url
+from tests.helpers.api_utils import get_required_headers
 from tests.helpers.api_utils import HOST_URL
 from tests.helpers.api_utils import quote
 from tests.helpers.api_utils import quote_everything
 from tests.helpers.api_utils import UUID_1
 from tests.helpers.api_utils import UUID_2
 from tests.helpers.api_utils import UUID_3
+from tests.helpers.db_utils import db_host
+from tests.helpers.db_utils import explain
+from tests.helpers.db_utils import minimal_db_host
+from tests.helpers.db_utils import scanned_partitions
 from tests.helpers.db_utils import serialize_db_host
 from tests.helpers.db_utils import update_host_in_db
 from tests.helpers.test_utils import ACCOUNT
 from tests.helpers.test_utils import generate_uuid
+from tests.helpers.test_utils import get_staleness_timestamps
 from tests.helpers.test_utils import minimal_host
 from tests.helpers.test_utils import now
 
@@ -103,6 +117,19 @@ def test_query_using_display_name_substring(mq_create_three_specific_hosts, api_
     api_pagination_test(api_get, subtests, url, expected_total=len(created_hosts))
 
 
+def test_query_using_display_name_is_case_insensitive(mq_create_three_specific_hosts, api_get, subtests):
+    created_hosts = mq_create_three_specific_hosts
+    expected_host_list = build_expected_host_list(created_hosts)
+
+    url = build_hosts_url(query=f"?display_name={created_hosts[0].display_name[:4].upper()}")
+    response_status, response_data = api_get(url)
+
+    assert response_status == 200
+    assert expected_host_list == response_data["results"]
+
+    api_pagination_test(api_get, subtests, url, expected_total=len(created_hosts))
+
+
 def test_query_existent_hosts(mq_create_three_specific_hosts, api_get, subtests):
     created_hosts = mq_create_three_specific_hosts
     host_lists = [created_hosts[0:1], created_hosts[1:3], created_hosts]
@@ -202,6 +229,18 @@ def test_query_using_fqdn_as_hostname(mq_create_three_specific_hosts, api_get, s
     api_pagination_test(api_get, subtests, url, expected_total=1)
 
 
+def test_query_using_hostname_is_case_insensitive(mq_create_three_specific_hosts, api_get, subtests):
+    created_hosts = mq_create_three_specific_hosts
+
+    url = build_hosts_url(query=f"?hostname_or_id={created_hosts[2].display_name.upper()}")
+    response_status, response_data = api_get(url)
+
+    assert response_status == 200
+    assert len(response_data["results"]) == 1
+
+    api_pagination_test(api_get, subtests, url, expected_total=1)
+
+
 def test_query_using_id(mq_create_three_specific_hosts, api_get, subtests):
     created_hosts = mq_create_three_specific_hosts
 
@@ -857,3 +896,669 @@ def test_get_hosts_only_insights(mq_create_three_specific_hosts, mq_create_or_up
 
     assert expected_ids == result_ids
     assert non_expected_id not in expected_ids
+
+
+@pytest.mark.parametrize(
+    "tags", (["ns1/key1=val1"], ["ns1/key1=val1", "SPECIAL/tag=ToFind"], ["ns1/key1=val1", "ns1/key2"])
+)
+def test_get_host_by_tag_uses_index(tags, db_create_multiple_hosts):
+    other_hosts = [minimal_db_host(tags={"ns1": {"key1": [f"val{i}"]}, "ns2": {"key2": []}}) for i in range(2, 200)]
+    db_create_multiple_hosts(hosts=[*other_hosts, db_host()])
+
+    query = host_list_query(ACCOUNT, tags=tags)
+
+    assert "idxgintags" in explain(query)
+
+
+@pytest.mark.parametrize(
+    "filter_name,index_names",
+    (("display_name", ("idxgintrgmdisplayname",)), ("hostname_or_id", ("idxgintrgmdisplayname", "idxgintrgmfqdn"))),
+)
+def test_get_host_by_substring_uses_trigram_index(filter_name, index_names, db_create_multiple_hosts):
+    # All the hosts are in one account and so in one partition. The trigram index beats its account index only
+    # if the account has enough hosts and the searched substring is rare among them, as random names make it.
+    names = [uuid.uuid4().hex for _ in range(2000)]
+    hosts = [minimal_db_host(display_name=name, canonical_facts={"fqdn": f"{name}.example.com"}) for name in names]
+    db_create_multiple_hosts(hosts=hosts)
+
+    query = host_list_query(ACCOUNT, **{filter_name: names[0][:5].upper()})
+
+    plan = explain(query)
+    for index_name in index_names:
+        assert index_name in plan
+
+
+def _system_profile_hosts():
+    return [
+        minimal_db_host(
+            system_profile_facts={
+                "arch": "x86_64",
+                "os_release": "8.1",
+                "number_of_cpus": 32,
+                "installed_packages": ["openssl-1.1.1c-2.el8.x86_64", "bash-4.4.19-10.el8.x86_64"],
+                "enabled_services": ["sshd"],
+            }
+        ),
+        minimal_db_host(
+            system_profile_facts={
+                "arch": "x86_64",
+                "os_release": "7.8",
+                "number_of_cpus": 4,
+                "installed_packages": ["openssl-1.0.2k-19.el7.x86_64", "bash-4.2.46-34.el7.x86_64"],
+            }
+        ),
+        minimal_db_host(system_profile_facts={"arch": "ppc64le", "os_release": "8.1", "sap_system": True}),
+        minimal_db_host(system_profile_facts={}),
+    ]
+
+
+@pytest.mark.parametrize(
+    "system_profile,expected_indexes",
+    (
+        (("arch=x86_64",), (0, 1)),
+        (("arch=x86_64", "os_release=8.1"), (0,)),
+        (("number_of_cpus>16",), (0,)),
+        (("number_of_cpus>=4",), (0, 1)),
+        (("number_of_cpus<=4",), (1,)),
+        (("number_of_cpus<32",), (1,)),
+        (("sap_system=true",), (2,)),
+        (("cloud_provider=aws",), ()),
+        (("installed_packages=openssl-1.0.2k-19.el7.x86_64",), (1,)),
+        (("installed_packages=openssl",), ()),
+        (("enabled_services=sshd", "arch=x86_64"), (0,)),
+    ),
+)
+def test_query_by_system_profile(system_profile, expected_indexes, db_create_multiple_hosts, api_get):
+    created_hosts = db_create_multiple_hosts(hosts=_system_profile_hosts())
+    url = build_hosts_url(query="?" + "&".join(f"system_profile={quote(value)}" for value in system_profile))
+
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert_host_ids_in_response(response_data, [created_hosts[index] for index in expected_indexes])
+
+
+@pytest.mark.parametrize(
+    "system_profile",
+    ("arch", "arch>x86_64", "sap_system<1", "number_of_cpus=many", "network_interfaces=eth0", "unknown_field=1"),
+)
+def test_query_by_invalid_system_profile(system_profile, api_get):
+    url = build_hosts_url(query=f"?system_profile={quote(system_profile)}")
+
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 400)
+
+
+@pytest.mark.parametrize(
+    "system_profile,index_name",
+    (
+        ("arch=x86_64", "idxsystemprofilearch"),
+        ("os_release=8.1", "idxsystemprofileosrelease"),
+        ("number_of_cpus>16", "idxsystemprofilenumberofcpus"),
+        ("sap_system=true", "idxsystemprofilesapsystem"),
+    ),
+)
+def test_query_by_system_profile_uses_index(system_profile, index_name, db_create_multiple_hosts):
+    db_create_multiple_hosts(hosts=_system_profile_hosts())
+
+    query = host_list_query(ACCOUNT, system_profile=[system_profile])
+
+    assert index_name in explain(query)
+
+
+@pytest.mark.parametrize(
+    "field,index_name",
+    (
+        ("installed_packages", "idxgininstalledpackages"),
+        ("installed_services", "idxgininstalledservices"),
+        ("enabled_services", "idxginenabledservices"),
+    ),
+)
+def test_query_by_system_profile_list_uses_index(field, index_name, db_create_multiple_hosts):
+    other_hosts = [minimal_db_host(system_profile_facts={field: [f"item-{i}", "common"]}) for i in range(200)]
+    db_create_multiple_hosts(hosts=other_hosts)
+
+    query = host_list_query(ACCOUNT, system_profile=[f"{field}=item-1"])
+
+    assert index_name in explain(query)
+
+
+@pytest.mark.parametrize(
+    "installed_package,expected_indexes",
+    (
+        (("openssl-1.1.1c-2.el8.x86_64",), (0,)),
+        (("openssl-1.1.1c-2.el8.x86_64", "bash-4.4.19-10.el8.x86_64"), (0,)),
+        (("openssl-1.1.1c-2.el8.x86_64", "bash-4.2.46-34.el7.x86_64"), ()),
+    ),
+)
+def test_query_by_installed_package(installed_package, expected_indexes, db_create_multiple_hosts, api_get):
+    created_hosts = db_create_multiple_hosts(hosts=_system_profile_hosts())
+    url = build_hosts_url(query="?" + "&".join(f"installed_package={quote(value)}" for value in installed_package))
+
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert_host_ids_in_response(response_data, [created_hosts[index] for index in expected_indexes])
+
+
+def _package_set_hosts(db_create_multiple_hosts):
+    installed_packages = ["openssl-1.0.2k-19.el7.x86_64", "bash-4.2.46-34.el7.x86_64"]
+    package_set = PackageSet(hash=PackageSet.hash_items(installed_packages), items=installed_packages)
+    db.session.add(package_set)
+
+    system_profile = {"arch": "x86_64", "installed_packages": PackageSet.reference(package_set.hash)}
+    hosts = [minimal_db_host(system_profile_facts=system_profile) for _ in range(2)]
+    return db_create_multiple_hosts(hosts=hosts + _system_profile_hosts()), installed_packages
+
+
+def test_get_system_profile_resolves_package_set(db_create_multiple_hosts, api_get):
+    created_hosts, installed_packages = _package_set_hosts(db_create_multiple_hosts)
+    url = build_system_profile_url(host_list_or_id=created_hosts[0:2])
+
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert [result["system_profile"] for result in response_data["results"]] == [
+        {"arch": "x86_64", "installed_packages": installed_packages}
+    ] * 2
+
+
+def _package_sets(*package_lists):
+    package_sets = [PackageSet(hash=PackageSet.hash_items(items), items=items) for items in package_lists]
+    db.session.add_all(package_sets)
+    return [PackageSet.reference(package_set.hash) for package_set in package_sets]
+
+
+def test_get_system_profile_loads_package_sets_at_once(db_read_replica, db_create_multiple_hosts, api_get):
+    replica_statements, _ = db_read_replica
+    installed_packages = (["openssl-1.0.2k-19.el7.x86_64"], ["bash-4.2.46-34.el7.x86_64"])
+    references = _package_sets(*installed_packages, ["sshd"])
+    system_profiles = [
+        {"installed_packages": references[0]},
+        {"installed_packages": references[1], "enabled_services": references[2]},
+        {"installed_packages": references[0]},
+        {"arch": "x86_64"},
+    ]
+    created_hosts = db_create_multiple_hosts(
+        hosts=[minimal_db_host(system_profile_facts=system_profile) for system_profile in system_profiles]
+    )
+    url = build_system_profile_url(host_list_or_id=created_hosts, query="?order_by=updated&order_how=ASC")
+
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert [result["system_profile"] for result in response_data["results"]] == [
+        {"installed_packages": installed_packages[0]},
+        {"installed_packages": installed_packages[1], "enabled_services": ["sshd"]},
+        {"installed_packages": installed_packages[0]},
+        {"arch": "x86_64"},
+    ]
+    assert len([statement for statement in replica_statements if "FROM package_sets" in statement]) == 1
+
+
+@pytest.mark.parametrize(
+    "installed_package,expected_indexes",
+    (("openssl-1.0.2k-19.el7.x86_64", (0, 1, 3)), ("bash-4.2.46-34.el7.x86_64", (0, 1, 3)), ("openssl", ())),
+)
+def test_query_by_installed_package_in_package_set(
+    installed_package, expected_indexes, db_create_multiple_hosts, api_get
+):
+    created_hosts, _ = _package_set_hosts(db_create_multiple_hosts)
+    url = build_hosts_url(query=f"?installed_package={quote(installed_package)}")
+
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert_host_ids_in_response(response_data, [created_hosts[index] for index in expected_indexes])
+
+
+@pytest.mark.parametrize(
+    "filters",
+    (
+        {},
+        {"display_name": "test-display-name"},
+        {"fqdn": "test-fqdn"},
+        {"hostname_or_id": "test-fqdn"},
+        {"hostname_or_id": UUID_1},
+        {"insights_id": UUID_1},
+        {"tags": ["ns1/key1=val1", "SPECIAL/tag"]},
+        {"staleness": ["fresh", "stale"]},
+        {"registered_with": "insights"},
+        {"system_profile": ["arch=x86_64", "number_of_cpus>4"]},
+        {"system_profile": ["installed_packages=bash"]},
+    ),
+)
+def test_host_list_query_scans_account_partition(filters, db_create_multiple_hosts):
+    db_create_multiple_hosts(hosts=[db_host(), db_host(account="000502")])
+
+    query = host_list_query(ACCOUNT, **filters)
+
+    assert len(scanned_partitions(explain(query))) == 1
+
+
+@pytest.mark.parametrize(
+    "query",
+    (
+        lambda: canonical_fact_host_query(ACCOUNT, "insights_id", UUID_1),
+        lambda: canonical_facts_host_query(ACCOUNT, {"insights_id": UUID_1, "fqdn": "test-fqdn"}),
+    ),
+)
+def test_canonical_facts_query_scans_account_partition(query, db_create_multiple_hosts):
+    db_create_multiple_hosts(hosts=[db_host(), db_host(account="000502")])
+
+    assert len(scanned_partitions(explain(query()))) == 1
+
+
+def test_get_host_list_reads_from_read_replica(db_read_replica, db_create_host, api_get):
+    replica_statements, _ = db_read_replica
+    created_host = db_create_host()
+
+    response_status, response_data = api_get(HOST_URL)
+
+    assert_response_status(response_status, 200)
+    assert_host_ids_in_response(response_data, [created_host])
+    assert any("FROM hosts" in statement for statement in replica_statements)
+
+
+def test_get_host_list_falls_back_to_primary(db_read_replica, db_create_host, api_get):
+    replica_statements, replica_lag_monitor = db_read_replica
+    replica_lag_monitor.usable.return_value = False
+    created_host = db_create_host()
+
+    response_status, response_data = api_get(HOST_URL)
+
+    assert_response_status(response_status, 200)
+    assert_host_ids_in_response(response_data, [created_host])
+    assert not replica_statements
+
+
+def test_get_host_by_id_after_write_reads_from_primary(
+    event_producer_mock, db_read_replica, db_create_host, api_patch, api_get
+):
+    replica_statements, _ = db_read_replica
+    created_host = db_create_host()
+    url = build_hosts_url(host_list_or_id=created_host.id)
+
+    response_status, response_data = api_patch(url, {"display_name": "patched"})
+    assert_response_status(response_status, 200)
+
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"][0]["display_name"] == "patched"
+    assert not replica_statements
+
+
+def test_get_host_list_after_write_of_other_account_reads_from_replica(
+    flask_app, db_read_replica, db_create_host, api_get
+):
+    replica_statements, _ = db_read_replica
+    created_host = db_create_host()
+    flask_app.replica_recent_writes.record("000502")
+
+    response_status, response_data = api_get(HOST_URL)
+
+    assert_response_status(response_status, 200)
+    assert_host_ids_in_response(response_data, [created_host])
+    assert any("FROM hosts" in statement for statement in replica_statements)
+
+
+def _export_hosts(flask_client, query=None):
+    url = build_hosts_url(host_list_or_id="export", query=query)
+    response = flask_client.get(url, headers=get_required_headers())
+    return response, [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def test_export_hosts(db_create_multiple_hosts, flask_client, monkeypatch):
+    monkeypatch.setattr("api.host_query_db.EXPORT_CHUNK_SIZE", 2)
+    created_hosts = db_create_multiple_hosts(how_many=5)
+    db_create_multiple_hosts(hosts=[minimal_db_host(account="000502")])
+
+    response, exported_hosts = _export_hosts(flask_client)
+
+    assert_response_status(response.status_code, 200)
+    assert response.mimetype == "application/x-ndjson"
+    assert sorted(host["id"] for host in exported_hosts) == sorted(str(host.id) for host in created_hosts)
+    for exported_host in exported_hosts:
+        assert "tags" not in exported_host
+        assert "system_profile" not in exported_host
+
+
+def test_export_hosts_with_included_fields(db_create_host, flask_client):
+    created_host = db_create_host(db_host(system_profile_facts={"arch": "x86_64"}))
+
+    response, exported_hosts = _export_hosts(flask_client, "?include=tags&include=system_profile")
+
+    assert_response_status(response.status_code, 200)
+    assert len(exported_hosts) == 1
+    assert exported_hosts[0]["id"] == str(created_host.id)
+    assert exported_hosts[0]["system_profile"] == {"arch": "x86_64"}
+    assert {"namespace": "SPECIAL", "key": "tag", "value": "ToFind"} in exported_hosts[0]["tags"]
+
+
+def test_export_hosts_filtered(db_create_multiple_hosts, flask_client):
+    created_hosts = db_create_multiple_hosts(
+        hosts=[minimal_db_host(display_name="exported"), minimal_db_host(display_name="other")]
+    )
+
+    response, exported_hosts = _export_hosts(flask_client, "?display_name=export")
+
+    assert_response_status(response.status_code, 200)
+    assert [host["id"] for host in exported_hosts] == [str(created_hosts[0].id)]
+
+
+def test_export_hosts_loads_package_sets_by_chunks(
+    db_read_replica, db_create_multiple_hosts, flask_client, monkeypatch
+):
+    monkeypatch.setattr("api.host_query_db.EXPORT_CHUNK_SIZE", 2)
+    replica_statements, _ = db_read_replica
+    installed_packages = ["openssl-1.0.2k-19.el7.x86_64"]
+    (reference,) = _package_sets(installed_packages)
+    db_create_multiple_hosts(
+        hosts=[minimal_db_host(system_profile_facts={"installed_packages": reference}) for _ in range(3)]
+    )
+
+    response, exported_hosts = _export_hosts(flask_client, "?include=system_profile")
+
+    assert_response_status(response.status_code, 200)
+    assert [host["system_profile"] for host in exported_hosts] == [{"installed_packages": installed_packages}] * 3
+    # The package sets are read from the replica even though the hosts are streamed after the operation returned.
+    assert len([statement for statement in replica_statements if "FROM package_sets" in statement]) == 2
+
+
+def test_export_hosts_reads_from_read_replica(db_read_replica, db_create_host, flask_client):
+    replica_statements, _ = db_read_replica
+    created_host = db_create_host()
+
+    response, exported_hosts = _export_hosts(flask_client)
+
+    assert_response_status(response.status_code, 200)
+    assert [host["id"] for host in exported_hosts] == [str(created_host.id)]
+    assert any("FROM hosts" in statement for statement in replica_statements)
+
+
+def _get_conditionally(flask_client, url, etag=None):
+    headers = get_required_headers()
+    if etag:
+        headers["If-None-Match"] = etag
+    return flask_client.get(url, headers=headers)
+
+
+@pytest.mark.parametrize("build_url", (lambda host: HOST_URL, lambda host: build_hosts_url(host_list_or_id=host.id)))
+def test_get_hosts_not_modified(db_create_host, flask_client, build_url):
+    created_host = db_create_host()
+    url = build_url(created_host)
+
+    response = _get_conditionally(flask_client, url)
+    assert_response_status(response.status_code, 200)
+    assert response.headers["ETag"].startswith('W/"')
+
+    not_modified_response = _get_conditionally(flask_client, url, response.headers["ETag"])
+    assert_response_status(not_modified_response.status_code, 304)
+    assert not_modified_response.headers["ETag"] == response.headers["ETag"]
+    assert not not_modified_response.data
+
+
+@pytest.mark.parametrize("build_url", (lambda host: HOST_URL, lambda host: build_hosts_url(host_list_or_id=host.id)))
+def test_get_hosts_modified(db_create_host, flask_client, build_url):
+    created_host = db_create_host()
+    url = build_url(created_host)
+
+    etag = _get_conditionally(flask_client, url).headers["ETag"]
+    update_host_in_db(created_host.id, display_name="modified")
+
+    response = _get_conditionally(flask_client, url, etag)
+    assert_response_status(response.status_code, 200)
+    assert response.headers["ETag"] != etag
+
+
+def test_get_host_list_added_host_changes_etag(db_create_host, flask_client):
+    db_create_host()
+    etag = _get_conditionally(flask_client, HOST_URL).headers["ETag"]
+    db_create_host()
+
+    response = _get_conditionally(flask_client, HOST_URL, etag)
+    assert_response_status(response.status_code, 200)
+    assert response.headers["ETag"] != etag
+
+
+def test_get_host_list_etag_depends_on_query(db_create_host, flask_client):
+    db_create_host()
+    etag = _get_conditionally(flask_client, HOST_URL).headers["ETag"]
+
+    response = _get_conditionally(flask_client, f"{HOST_URL}?per_page=1", etag)
+    assert_response_status(response.status_code, 200)
+
+
+def test_get_host_list_etag_depends_on_culling_config(db_create_host, flask_client, inventory_config, monkeypatch):
+    db_create_host()
+    etag = _get_conditionally(flask_client, HOST_URL).headers["ETag"]
+    monkeypatch.setattr(
+        inventory_config, "culling_culled_offset_days", inventory_config.culling_culled_offset_days + 1
+    )
+
+    response = _get_conditionally(flask_client, HOST_URL, etag)
+    assert_response_status(response.status_code, 200)
+    assert response.headers["ETag"] != etag
+
+
+def test_get_host_list_counts_hosts_once(db_read_replica, db_create_multiple_hosts, api_get):
+    replica_statements, _ = db_read_replica
+    db_create_multiple_hosts(how_many=3)
+
+    response_status, response_data = api_get(build_hosts_url(query="?per_page=2"))
+
+    assert_response_status(response_status, 200)
+    assert response_data["total"] == 3
+    assert len(response_data["results"]) == 2
+    # The version, with the total, and the page. No separate count query.
+    assert len([statement for statement in replica_statements if "FROM hosts" in statement]) == 2
+
+
+def test_get_system_profile_not_modified(db_create_host, flask_client):
+    created_host = db_create_host()
+    url = build_system_profile_url(host_list_or_id=created_host.id)
+
+    etag = _get_conditionally(flask_client, url).headers["ETag"]
+
+    response = _get_conditionally(flask_client, url, etag)
+    assert_response_status(response.status_code, 304)
+
+
+def test_get_host_list_sparse_fieldset(db_read_replica, db_create_host, api_get):
+    replica_statements, _ = db_read_replica
+    created_host = db_create_host()
+
+    response_status, response_data = api_get(build_hosts_url(query="?fields[hosts]=display_name,fqdn"))
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"] == [
+        {
+            "id": str(created_host.id),
+            "account": created_host.account,
+            "display_name": created_host.display_name,
+            "fqdn": created_host.canonical_facts.get("fqdn"),
+        }
+    ]
+    host_statement = next(statement for statement in replica_statements if "LIMIT" in statement)
+    assert "system_profile_facts" not in host_statement
+    assert "hosts.tags" not in host_statement
+
+
+def test_get_host_by_id_sparse_fieldset(db_create_host, api_get):
+    created_host = db_create_host()
+
+    url = build_hosts_url(host_list_or_id=created_host.id, query="?fields[hosts]=updated")
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"] == [
+        {"id": str(created_host.id), "account": created_host.account, "updated": created_host.modified_on.isoformat()}
+    ]
+
+
+@pytest.mark.parametrize("fields", ("unknown", "display_name,", "system_profile"))
+def test_get_host_list_invalid_sparse_fieldset(api_get, fields):
+    response_status, response_data = api_get(build_hosts_url(query=f"?fields[hosts]={fields}"))
+
+    assert_response_status(response_status, 400)
+
+
+def test_get_host_list_sparse_fieldset_of_other_resource(api_get):
+    response_status, response_data = api_get(build_hosts_url(query="?fields[system_profile]=arch"))
+
+    assert_response_status(response_status, 400)
+
+
+def test_get_system_profile_sparse_fieldset(db_read_replica, db_create_host, api_get):
+    replica_statements, _ = db_read_replica
+    created_host = db_create_host(
+        db_host(system_profile_facts={"arch": "x86_64", "os_release": "8.2", "number_of_cpus": 4})
+    )
+
+    url = build_system_profile_url(
+        host_list_or_id=created_host.id, query="?fields[system_profile]=arch,os_kernel_version"
+    )
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"] == [{"id": str(created_host.id), "system_profile": {"arch": "x86_64"}}]
+    host_statement = next(statement for statement in replica_statements if "LIMIT" in statement)
+    assert "system_profile_facts ->" in host_statement
+    assert "hosts.system_profile_facts AS" not in host_statement
+
+
+def test_get_system_profile_invalid_sparse_fieldset(db_create_host, api_get):
+    created_host = db_create_host()
+
+    url = build_system_profile_url(host_list_or_id=created_host.id, query="?fields[system_profile]=arch,unknown")
+    response_status, response_data = api_get(url)
+
+    assert_response_status(response_status, 400)
+
+
+def test_get_host_list_serialized_hosts_cached(mocker, db_create_host, api_get):
+    serialize_host_mock = mocker.patch("api.host_query.serialize_host", wraps=serialize_host)
+    db_create_host()
+
+    first_response_status, first_response_data = api_get(HOST_URL)
+    second_response_status, second_response_data = api_get(HOST_URL)
+
+    assert_response_status(second_response_status, 200)
+    assert second_response_data == first_response_data
+    serialize_host_mock.assert_called_once()
+
+
+def test_get_host_list_modified_host_serialized_again(db_create_host, api_get):
+    created_host = db_create_host()
+    api_get(HOST_URL)
+
+    update_host_in_db(created_host.id, display_name="modified")
+    response_status, response_data = api_get(HOST_URL)
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"][0]["display_name"] == "modified"
+
+
+def test_get_host_list_cached_hosts_follow_culling_config(db_create_host, api_get, inventory_config, monkeypatch):
+    db_create_host()
+    _, response_data = api_get(HOST_URL)
+    culled_timestamp = response_data["results"][0]["culled_timestamp"]
+
+    monkeypatch.setattr(
+        inventory_config, "culling_culled_offset_days", inventory_config.culling_culled_offset_days + 1
+    )
+    response_status, response_data = api_get(HOST_URL)
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"][0]["culled_timestamp"] != culled_timestamp
+
+
+@pytest.mark.parametrize("build_url", (lambda host: HOST_URL, lambda host: build_hosts_url(host_list_or_id=host.id)))
+def test_get_hosts_builds_no_host_instances(db_create_host, api_get, build_url):
+    created_host = db_create_host()
+    loaded_hosts = []
+
+    def _record_loaded_host(host, context):
+        loaded_hosts.append(host)
+
+    event.listen(Host, "load", _record_loaded_host)
+    try:
+        response_status, response_data = api_get(build_url(created_host))
+    finally:
+        event.remove(Host, "load", _record_loaded_host)
+
+    assert_response_status(response_status, 200)
+    assert_host_ids_in_response(response_data, [created_host])
+    assert not loaded_hosts
+
+
+def _lookup_hosts(api_post, lookup_type, values):
+    url = build_hosts_url(host_list_or_id="lookup")
+    return api_post(url, {"type": lookup_type, "values": values})
+
+
+def test_lookup_hosts_by_insights_id(db_read_replica, db_create_multiple_hosts, api_post):
+    replica_statements, _ = db_read_replica
+    created_hosts = db_create_multiple_hosts(how_many=3)
+    insights_ids = [host.canonical_facts["insights_id"] for host in created_hosts]
+    db_create_multiple_hosts(
+        hosts=[minimal_db_host(account="000502", canonical_facts={"insights_id": insights_ids[0]})]
+    )
+    unknown_insights_id = generate_uuid()
+
+    values = [insights_ids[0], insights_ids[1], unknown_insights_id]
+    response_status, response_data = _lookup_hosts(api_post, "insights_id", values)
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"] == {
+        insights_ids[0]: [str(created_hosts[0].id)],
+        insights_ids[1]: [str(created_hosts[1].id)],
+        unknown_insights_id: [],
+    }
+    lookup_statements = [statement for statement in replica_statements if "ANY" in statement]
+    assert len(lookup_statements) == 1
+
+
+def test_lookup_hosts_by_fqdn(db_create_multiple_hosts, api_post):
+    created_hosts = db_create_multiple_hosts(
+        hosts=[minimal_db_host(canonical_facts={"fqdn": "shared.example.com"}) for _ in range(2)]
+    )
+
+    response_status, response_data = _lookup_hosts(api_post, "fqdn", ["shared.example.com"])
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"] == {"shared.example.com": sorted(str(host.id) for host in created_hosts)}
+
+
+def test_lookup_hosts_by_id(db_create_multiple_hosts, api_post):
+    created_hosts = db_create_multiple_hosts(how_many=2)
+    requested_id = str(created_hosts[0].id).upper()
+    unknown_id = generate_uuid()
+
+    response_status, response_data = _lookup_hosts(api_post, "id", [requested_id, unknown_id])
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"] == {requested_id: [str(created_hosts[0].id)], unknown_id: []}
+
+
+def test_lookup_hosts_culled_not_found(db_create_host, api_post):
+    culled_host = db_create_host(minimal_db_host(stale_timestamp=get_staleness_timestamps()["culled"].isoformat()))
+
+    response_status, response_data = _lookup_hosts(
+        api_post, "insights_id", [culled_host.canonical_facts["insights_id"]]
+    )
+
+    assert_response_status(response_status, 200)
+    assert response_data["results"] == {culled_host.canonical_facts["insights_id"]: []}
+
+
+@pytest.mark.parametrize(
+    "lookup_type,values",
+    (("id", ["not-a-uuid"]), ("display_name", ["some-host"]), ("insights_id", []), ("fqdn", ["host"] * 1001)),
+)
+def test_lookup_hosts_invalid(api_post, lookup_type, values):
+    response_status, response_data = _lookup_hosts(api_post, lookup_type, values)
+
+    assert_response_status(response_status, 400)
@@ -1,16 +1,24 @@
+import json
+
 import pytest
+from sqlalchemy import event
 
+from api.host import _emit_update_events
+from app.models import db
+from lib.host_repository import update_host_tags
 from tests.helpers.api_utils import assert_error_response
 from tests.helpers.api_utils import assert_response_status
 from tests.helpers.api_utils import build_facts_url
 from tests.helpers.api_utils import build_host_id_list_for_url
 from tests.helpers.api_utils import build_hosts_url
+from tests.helpers.api_utils import build_tags_operation_url
 from tests.helpers.api_utils import get_id_list_from_hosts
 from tests.helpers.db_utils import DB_FACTS
 from tests.helpers.db_utils import DB_FACTS_NAMESPACE
 from tests.helpers.db_utils import db_host
 from tests.helpers.db_utils import DB_NEW_FACTS
 from tests.helpers.db_utils import get_expected_facts_after_update
+from tests.helpers.db_utils import update_host_in_db
 from tests.helpers.mq_utils import assert_patch_event_is_valid
 from tests.helpers.test_utils import generate_uuid
 from tests.helpers.test_utils import get_staleness_timestamps
@@ -181,6 +189,54 @@ def test_patch_produces_update_event_no_insights_id(
     )
 
 
+def test_patch_produces_update_event_for_every_host(event_producer_mock, db_create_multiple_hosts, api_patch, mocker):
+    write_event = mocker.spy(event_producer_mock, "write_event")
+    hosts = db_create_multiple_hosts(how_many=5)
+
+    patch_doc = {"display_name": "patch_event_test"}
+
+    url = build_hosts_url(host_list_or_id=hosts)
+    response_status, response_data = api_patch(url, patch_doc)
+    assert_response_status(response_status, expected_status=200)
+
+    assert write_event.call_count == len(hosts)
+    emitted_keys = {call_args[0][1] for call_args in write_event.call_args_list}
+    assert emitted_keys == set(get_id_list_from_hosts(hosts))
+
+
+def test_patch_produces_update_events_after_commit(
+    event_producer_mock, db_create_host, db_get_host, api_patch, mocker
+):
+    host = db_create_host()
+    committed_display_names = []
+
+    def _write_event(*args, **kwargs):
+        committed_display_names.append(db_get_host(host.id).display_name)
+
+    mocker.patch.object(event_producer_mock, "write_event", side_effect=_write_event)
+
+    patch_doc = {"display_name": "patch_event_test"}
+
+    url = build_hosts_url(host_list_or_id=host.id)
+    response_status, response_data = api_patch(url, patch_doc)
+    assert_response_status(response_status, expected_status=200)
+
+    assert committed_display_names == ["patch_event_test"]
+
+
+def test_patch_fills_in_missing_display_name(event_producer_mock, db_create_host, db_get_host, api_patch):
+    host = db_create_host(extra_data={"canonical_facts": {"fqdn": "patch.fqdn.test"}})
+    update_host_in_db(host.id, display_name="")
+
+    patch_doc = {"ansible_host": "NEW_ansible_host"}
+
+    url = build_hosts_url(host_list_or_id=host.id)
+    response_status, response_data = api_patch(url, patch_doc)
+    assert_response_status(response_status, expected_status=200)
+
+    assert db_get_host(host.id).display_name == "patch.fqdn.test"
+
+
 def test_event_producer_instrumentation(mocker, event_producer, future_mock, db_create_host, api_patch):
     created_host = db_create_host()
     patch_doc = {"display_name": "patch_event_test"}
@@ -305,3 +361,168 @@ def test_add_facts_to_multiple_culled_hosts(db_create_multiple_hosts, db_get_hos
     # Try to replace the facts on a host that has been marked as culled
     response_status, response_data = api_patch(facts_url, DB_NEW_FACTS)
     assert_response_status(response_status, expected_status=400)
+
+
+def _update_host_tags_by_two(select_query, operation, tags):
+    return update_host_tags(select_query, operation, tags, chunk_size=2)
+
+
+def test_apply_tags_by_host_ids(event_producer_mock, db_create_multiple_hosts, db_get_host, api_post):
+    hosts = db_create_multiple_hosts(hosts=[db_host(), db_host(tags=None)])
+
+    body = {
+        "operation": "apply",
+        "tags": [
+            {"namespace": "ns1", "key": "key1", "value": "val1"},
+            {"namespace": "ns1", "key": "key1", "value": "val3"},
+            {"namespace": "ns1", "key": "key3", "value": None},
+            {"namespace": "new", "key": "key", "value": "val"},
+            {"namespace": None, "key": "key", "value": "val"},
+        ],
+        "host_ids": get_id_list_from_hosts(hosts),
+    }
+    response_status, response_data = api_post(build_tags_operation_url(), body)
+
+    assert_response_status(response_status, expected_status=200)
+    assert response_data == {"updated": 2}
+
+    assert db_get_host(hosts[0].id).tags == {
+        "ns1": {"key1": ["val1", "val2", "val3"], "key2": ["val1"], "key3": []},
+        "SPECIAL": {"tag": ["ToFind"]},
+        "new": {"key": ["val"]},
+        "null": {"key": ["val"]},
+    }
+    assert db_get_host(hosts[1].id).tags == {
+        "ns1": {"key1": ["val1", "val3"], "key3": []},
+        "new": {"key": ["val"]},
+        "null": {"key": ["val"]},
+    }
+
+
+def test_remove_tags_by_host_ids(event_producer_mock, db_create_host, db_get_host, api_post):
+    host = db_create_host(db_host(tags={**db_host().tags, "empty": {}, "other": {"key": []}}))
+
+    body = {
+        "operation": "remove",
+        "tags": [
+            {"namespace": "ns1", "key": "key1", "value": "val1"},
+            {"namespace": "ns1", "key": "key2", "value": None},
+            {"namespace": "SPECIAL", "key": "tag", "value": "ToFind"},
+            {"namespace": "missing", "key": "key", "value": "val"},
+        ],
+        "host_ids": [str(host.id)],
+    }
+    response_status, response_data = api_post(build_tags_operation_url(), body)
+
+    assert_response_status(response_status, expected_status=200)
+    assert db_get_host(host.id).tags == {"ns1": {"key1": ["val2"]}, "empty": {}, "other": {"key": []}}
+
+
+def test_apply_tags_by_filter(event_producer_mock, db_create_multiple_hosts, db_get_host, api_post):
+    matching_host, other_host = db_create_multiple_hosts(
+        hosts=[db_host(display_name="tag-me"), db_host(display_name="leave-me")]
+    )
+
+    body = {
+        "operation": "apply",
+        "tags": [{"namespace": "automation", "key": "managed", "value": "true"}],
+        "filters": {"display_name": "tag-me"},
+    }
+    response_status, response_data = api_post(build_tags_operation_url(), body)
+
+    assert_response_status(response_status, expected_status=200)
+    assert response_data == {"updated": 1}
+    assert db_get_host(matching_host.id).tags["automation"] == {"managed": ["true"]}
+    assert "automation" not in db_get_host(other_host.id).tags
+
+
+def test_tags_operation_produces_update_events_in_chunks(
+    event_producer_mock, db_create_multiple_hosts, api_post, flask_app, mocker
+):
+    mocker.patch("api.host.update_host_tags", wraps=_update_host_tags_by_two)
+    emit_update_events = mocker.spy(event_producer_mock, "write_event")
+    hosts = db_create_multiple_hosts(how_many=5)
+
+    # The UPDATE statements and the emitted event batches, in the order they happen.
+    operations = []
+
+    def _record_update(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE hosts"):
+            operations.append("UPDATE")
+
+    def _record_events(updated_hosts):
+        operations.append(len(updated_hosts))
+        _emit_update_events(updated_hosts)
+
+    mocker.patch("api.host._emit_update_events", _record_events)
+    engine = db.get_engine(flask_app)
+    event.listen(engine, "before_cursor_execute", _record_update)
+
+    body = {
+        "operation": "apply",
+        "tags": [{"namespace": "ns", "key": "key", "value": "val"}],
+        "host_ids": get_id_list_from_hosts(hosts),
+    }
+    try:
+        response_status, response_data = api_post(build_tags_operation_url(), body)
+    finally:
+        event.remove(engine, "before_cursor_execute", _record_update)
+
+    assert_response_status(response_status, expected_status=200)
+    assert response_data == {"updated": 5}
+
+    # Each chunk of at most two hosts is updated by its own statement, its events are emitted before the next one.
+    assert operations == ["UPDATE", 2, "UPDATE", 2, "UPDATE", 1]
+
+    assert emit_update_events.call_count == len(hosts)
+    for call_args in emit_update_events.call_args_list:
+        event_ = json.loads(call_args[0][0])
+        assert event_["type"] == "updated"
+        assert {"namespace": "ns", "key": "key", "value": "val"} in event_["host"]["tags"]
+    emitted_keys = {call_args[0][1] for call_args in emit_update_events.call_args_list}
+    assert emitted_keys == set(get_id_list_from_hosts(hosts))
+
+
+@pytest.mark.parametrize(
+    "hosts_selection", ({}, {"host_ids": [generate_uuid()], "filters": {"display_name": "name"}}, {"filters": {}})
+)
+def test_tags_operation_requires_either_host_ids_or_filters(hosts_selection, api_post):
+    body = {"operation": "apply", "tags": [{"namespace": "ns", "key": "key", "value": "val"}], **hosts_selection}
+    response_status, response_data = api_post(build_tags_operation_url(), body)
+
+    assert_response_status(response_status, expected_status=400)
+
+
+@pytest.mark.parametrize(
+    "tags",
+    ([], [{"namespace": "ns", "key": "", "value": "val"}], [{"namespace": "ns", "key": "k", "value": "v" * 256}]),
+)
+def test_tags_operation_with_invalid_tags(tags, db_create_host, api_post):
+    host = db_create_host()
+
+    body = {"operation": "apply", "tags": tags, "host_ids": [str(host.id)]}
+    response_status, response_data = api_post(build_tags_operation_url(), body)
+
+    assert_response_status(response_status, expected_status=400)
+
+
+def test_tags_operation_on_non_existent_hosts(api_post):
+    body = {
+        "operation": "remove",
+        "tags": [{"namespace": "ns", "key": "key", "value": "val"}],
+        "host_ids": [generate_uuid()],
+    }
+    response_status, response_data = api_post(build_tags_operation_url(), body)
+
+    assert_response_status(response_status, expected_status=404)
+
+
+def test_patch_host_writes_to_primary(db_read_replica, db_create_host, api_patch, event_producer_mock):
+    replica_statements, _ = db_read_replica
+    created_host = db_create_host()
+
+    url = build_hosts_url(host_list_or_id=created_host.id)
+    response_status, _ = api_patch(url, {"display_name": "patched"})
+
+    assert_response_status(response_status, 200)
+    assert not replica_statements
@@ -6,6 +6,8 @@ import pytest
 from app import db
 from app import threadctx
 from app import UNKNOWN_REQUEST_ID_VALUE
+from app.culling import staleness_to_ranges
+from app.models import PackageSet
 from host_reaper import run as host_reaper_run
 from tests.helpers.api_utils import assert_host_ids_in_response
 from tests.helpers.api_utils import build_facts_url
@@ -252,6 +254,33 @@ def test_system_profile_doesnt_use_staleness_parameter(mq_create_hosts_in_all_st
     assert response_status == 400
 
 
+@pytest.mark.parametrize(
+    "staleness,expected_ranges",
+    (
+        (("fresh",), (("now", None),)),
+        (("fresh", "stale"), (("stale_warning", None),)),
+        (("stale", "fresh"), (("stale_warning", None),)),
+        (("fresh", "stale", "stale_warning", "unknown"), (("culled", None),)),
+        (("fresh", "stale_warning"), (("now", None), ("culled", "stale_warning"))),
+        (("stale_warning", "stale"), (("culled", "now"),)),
+        (("culled", "fresh"), (("now", None), (None, "culled"))),
+        (("unknown",), ()),
+    ),
+)
+def test_staleness_to_ranges_merges_adjacent_states(
+    staleness, expected_ranges, culling_datetime_mock, inventory_config
+):
+    timestamps = {
+        None: None,
+        "now": culling_datetime_mock,
+        "stale_warning": culling_datetime_mock - timedelta(days=inventory_config.culling_stale_warning_offset_days),
+        "culled": culling_datetime_mock - timedelta(days=inventory_config.culling_culled_offset_days),
+    }
+    expected = [(timestamps[gt], timestamps[lte]) for gt, lte in expected_ranges]
+
+    assert staleness_to_ranges(inventory_config, staleness) == expected
+
+
 @pytest.mark.parametrize("culling_stale_warning_offset_days", (1, 7, 12))
 def test_stale_warning_timestamp(
     culling_stale_warning_offset_days, inventory_config, mq_create_or_update_host, api_get
@@ -408,6 +437,36 @@ def test_unknown_host_is_not_removed(
     assert event_producer_mock.event is None
 
 
+@pytest.mark.host_reaper
+def test_orphaned_package_sets_are_removed(event_producer_mock, event_datetime_mock, db_create_host, inventory_config):
+    staleness_timestamps = get_staleness_timestamps()
+    package_lists = (["culled-1.0"], ["fresh-1.0"], ["orphaned-1.0"])
+    package_sets = [PackageSet(hash=PackageSet.hash_items(items), items=items) for items in package_lists]
+    db.session.add_all(package_sets)
+
+    culled_package_set, fresh_package_set, _ = package_sets
+    for stale_timestamp, field, package_set in (
+        (staleness_timestamps["culled"], "installed_packages", culled_package_set),
+        (staleness_timestamps["fresh"], "enabled_services", fresh_package_set),
+    ):
+        host = minimal_db_host(
+            stale_timestamp=stale_timestamp.isoformat(),
+            system_profile_facts={field: PackageSet.reference(package_set.hash)},
+        )
+        db_create_host(host)
+
+    threadctx.request_id = UNKNOWN_REQUEST_ID_VALUE
+    host_reaper_run(
+        inventory_config,
+        mock.Mock(),
+        db.session,
+        event_producer_mock,
+        shutdown_handler=mock.Mock(**{"shut_down.return_value": False}),
+    )
+
+    assert [package_set.hash for package_set in PackageSet.query.all()] == [fresh_package_set.hash]
+
+
 def assert_system_culling_data(response_host, expected_stale_timestamp, expected_reporter):
     assert "stale_timestamp" in response_host
     assert "stale_warning_timestamp" in response_host
@@ -9,6 +9,8 @@ from app import db
 from app.models import Host
 from app.models import HttpHostSchema
 from app.models import MqHostSchema
+from app.replica import create_lag_check_engine
+from app.replica import ReplicaLagMonitor
 from app.utils import Tag
 from tests.helpers.test_utils import ACCOUNT
 from tests.helpers.test_utils import generate_uuid
@@ -324,3 +326,12 @@ def test_host_model_constraints(field, value, db_create_host):
 
     with pytest.raises(DataError):
         db_create_host(host)
+
+
+def test_replica_lag_check_on_primary(inventory_config):
+    # The database is not a replica, it has no lag.
+    engine = create_lag_check_engine(inventory_config.db_uri, 1)
+    try:
+        assert ReplicaLagMonitor(engine, 0, 5).usable()
+    finally:
+        engine.dispose()
@@ -9,6 +9,8 @@ from sqlalchemy import null
 from app import db
 from app.exceptions import InventoryException
 from app.exceptions import ValidationException
+from app.models import PACKAGE_SET_FIELDS
+from app.models import PackageSet
 from app.queue.event_producer import Topic
 from app.queue.queue import _validate_json_object_for_utf8
 from app.queue.queue import event_loop
@@ -396,6 +398,73 @@ def test_add_host_with_sap_system(event_datetime_mock, mq_create_or_update_host)
     assert_mq_host_data(key, event, expected_results, host_keys_to_check)
 
 
+@pytest.fixture(scope="function")
+def package_sets_enabled(inventory_config, monkeypatch):
+    monkeypatch.setattr(inventory_config, "package_sets_enabled", True)
+
+
+def test_add_hosts_share_package_set(package_sets_enabled, mq_create_or_update_host, db_get_host_by_insights_id):
+    system_profile = valid_system_profile()
+    insights_ids = (generate_uuid(), generate_uuid())
+
+    for insights_id in insights_ids:
+        host = minimal_host(insights_id=insights_id, system_profile=system_profile)
+        key, event, headers = mq_create_or_update_host(host, return_all_data=True)
+
+        assert event["host"]["system_profile"] == system_profile
+
+    package_set_hashes = {field: PackageSet.hash_items(system_profile[field]) for field in PACKAGE_SET_FIELDS}
+    for insights_id in insights_ids:
+        record = db_get_host_by_insights_id(insights_id)
+        for field, package_set_hash in package_set_hashes.items():
+            assert record.system_profile_facts[field] == {"package_set": package_set_hash}
+
+    package_sets = {package_set.hash: package_set.items for package_set in PackageSet.query.all()}
+    assert package_sets == {
+        package_set_hashes[field]: system_profile[field] for field in ("installed_packages", "installed_services")
+    }
+
+
+def test_update_host_package_set(package_sets_enabled, mq_create_or_update_host, db_get_host_by_insights_id):
+    insights_id = generate_uuid()
+    system_profile = valid_system_profile()
+    host = minimal_host(insights_id=insights_id, system_profile=system_profile)
+    mq_create_or_update_host(host)
+
+    def _package_set_version(items):
+        # The transaction that wrote the row.
+        query = "SELECT xmin FROM package_sets WHERE hash = :hash"
+        return db.session.execute(query, {"hash": PackageSet.hash_items(items)}).scalar()
+
+    original_version = _package_set_version(system_profile["installed_packages"])
+    mq_create_or_update_host(host)
+
+    assert _package_set_version(system_profile["installed_packages"]) == original_version
+
+    system_profile["installed_packages"] = ["rpm2-0:0.0.1.el7.i686"]
+    host = minimal_host(insights_id=insights_id, system_profile=system_profile)
+    key, event, headers = mq_create_or_update_host(host, return_all_data=True)
+
+    assert event["host"]["system_profile"]["installed_packages"] == ["rpm2-0:0.0.1.el7.i686"]
+
+    record = db_get_host_by_insights_id(insights_id)
+    assert record.system_profile_facts["installed_packages"] == {
+        "package_set": PackageSet.hash_items(["rpm2-0:0.0.1.el7.i686"])
+    }
+
+
+def test_add_host_without_package_sets(mq_create_or_update_host, db_get_host_by_insights_id):
+    insights_id = generate_uuid()
+    system_profile = valid_system_profile()
+    host = minimal_host(insights_id=insights_id, system_profile=system_profile)
+    mq_create_or_update_host(host)
+
+    record = db_get_host_by_insights_id(insights_id)
+
+    assert record.system_profile_facts == system_profile
+    assert PackageSet.query.count() == 0
+
+
 @pytest.mark.parametrize("tags", ({}, {"tags": None}, {"tags": []}, {"tags": {}}))
 def test_add_host_with_no_tags(tags, mq_create_or_update_host, db_get_host_by_insights_id):
     insights_id = generate_uuid()
@@ -1,12 +1,21 @@
+from datetime import timedelta
+
 import pytest
 from sqlalchemy import null
 
+from app.models import AccountTag
+from app.models import db
+from app.utils import Tag
 from tests.helpers.api_utils import api_pagination_test
 from tests.helpers.api_utils import api_tags_count_pagination_test
 from tests.helpers.api_utils import api_tags_pagination_test
 from tests.helpers.api_utils import build_host_tags_url
 from tests.helpers.api_utils import build_tags_count_url
+from tests.helpers.api_utils import build_tags_url
+from tests.helpers.db_utils import db_host
 from tests.helpers.db_utils import update_host_in_db
+from tests.helpers.test_utils import ACCOUNT
+from tests.helpers.test_utils import get_staleness_timestamps
 
 
 def test_get_tags_of_multiple_hosts(mq_create_four_specific_hosts, api_get, subtests):
@@ -285,3 +294,181 @@ def test_tags_count_pagination(mq_create_four_specific_hosts, api_get, subtests)
 
     # 2 per page test
     api_tags_count_pagination_test(api_get, subtests, url, len(created_hosts), 2, expected_responses_2_per_page)
+
+
+@pytest.mark.parametrize("search", (None, "", "val", "V", "key", "null", "ns"))
+def test_get_tags_same_as_python_filtering(search, db_create_host, api_get):
+    host = db_create_host(
+        db_host(tags={"ns": {"key1": ["val1", "Val2"], "key2": []}, "null": {"key3": ["val3"]}, "other": {}})
+    )
+
+    query = f"?search={search}" if search is not None else ""
+    url = build_host_tags_url(host_list_or_id=host.id, query=query)
+    response_status, response_data = api_get(url)
+
+    assert response_status == 200
+
+    tags = Tag.create_tags_from_nested(host.tags)
+    if search is not None:
+        tags = Tag.filter_tags(tags, search)
+    assert response_data["results"] == {str(host.id): [tag.data() for tag in tags]}
+
+
+def test_get_tags_count_of_multiple_values(db_create_host, api_get):
+    host = db_create_host(db_host(tags={"ns": {"key1": ["val1", "val2"], "key2": []}, "null": {"key3": ["val3"]}}))
+
+    url = build_tags_count_url(host_list_or_id=host.id)
+    response_status, response_data = api_get(url)
+
+    assert response_status == 200
+    assert response_data["results"] == {str(host.id): 4}
+
+
+def _tag_counts(response_data):
+    return [(tuple(item["tag"].values()), item["count"]) for item in response_data["results"]]
+
+
+def test_get_account_tags(db_create_multiple_hosts, api_get):
+    db_create_multiple_hosts(
+        hosts=[
+            db_host(tags={"ns1": {"key1": ["val1", "val2"]}, "null": {"key2": []}}),
+            db_host(tags={"ns1": {"key1": ["val1"]}}),
+            db_host(tags={}),
+            db_host(account="other", tags={"ns1": {"key1": ["val1"]}}),
+        ]
+    )
+
+    response_status, response_data = api_get(build_tags_url())
+
+    assert response_status == 200
+    assert response_data["total"] == 3
+    assert _tag_counts(response_data) == [
+        (("ns1", "key1", "val1"), 2),
+        (("ns1", "key1", "val2"), 1),
+        ((None, "key2", None), 1),
+    ]
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    (
+        ("?search=val", [(("ns1", "key1", "val1"), 2), (("ns1", "key1", "val2"), 1)]),
+        ("?search=y2", [((None, "key2", None), 1)]),
+        ("?search=null", []),
+        ("?search=%25", []),
+        ("?order_by=count&order_how=DESC", [(("ns1", "key1", "val1"), 2), (("ns1", "key2", None), 1)]),
+        ("?order_by=tag&order_how=DESC&per_page=1&page=2", [(("ns1", "key1", "val2"), 1)]),
+        (
+            "?tags=ns1/key1=val2",
+            [(("ns1", "key1", "val1"), 1), (("ns1", "key1", "val2"), 1), ((None, "key2", None), 1)],
+        ),
+        ("?registered_with=insights", [(("ns1", "key1", "val1"), 1)]),
+    ),
+)
+def test_get_account_tags_filtered(query, expected, db_create_multiple_hosts, api_get):
+    if "order_by=count" in query:
+        tags = ({"ns1": {"key1": ["val1"], "key2": []}}, {"ns1": {"key1": ["val1"]}})
+    else:
+        tags = ({"ns1": {"key1": ["val1", "val2"]}, "null": {"key2": []}}, {"ns1": {"key1": ["val1"]}})
+    db_create_multiple_hosts(hosts=[db_host(tags=tags[0], canonical_facts={"fqdn": "fqdn"}), db_host(tags=tags[1])])
+
+    response_status, response_data = api_get(build_tags_url(query=query))
+
+    assert response_status == 200
+    assert _tag_counts(response_data) == expected
+
+
+def test_get_account_tags_staleness(db_create_multiple_hosts, api_get, subtests):
+    # Moved an hour back, so the hosts are not on the border of two states.
+    staleness_timestamps = {
+        state: timestamp if state == "fresh" else timestamp - timedelta(hours=1)
+        for state, timestamp in get_staleness_timestamps().items()
+    }
+    db_create_multiple_hosts(
+        hosts=[
+            db_host(tags={"ns": {state: []}}, stale_timestamp=timestamp.isoformat())
+            for state, timestamp in staleness_timestamps.items()
+        ]
+    )
+
+    for query, expected_keys in (
+        ("", ["fresh", "stale"]),
+        ("?staleness=stale_warning", ["stale_warning"]),
+        ("?staleness=fresh,stale_warning", ["fresh", "stale_warning"]),
+    ):
+        with subtests.test(query=query):
+            response_status, response_data = api_get(build_tags_url(query=query))
+
+            assert response_status == 200
+            assert sorted(item["tag"]["key"] for item in response_data["results"]) == expected_keys
+
+
+def test_account_tags_follow_host_changes(db_create_host, db_get_host, api_delete_host, event_producer_mock):
+    host = db_create_host(db_host(tags={"ns": {"key": ["val1", "val2"]}}))
+    assert _account_tags() == {("ns", "key", "val1"): 1, ("ns", "key", "val2"): 1}
+
+    update_host_in_db(host.id, tags={"ns": {"key": ["val2", "val3"]}, "other": {"key": []}})
+    assert _account_tags() == {("ns", "key", "val2"): 1, ("ns", "key", "val3"): 1, ("other", "key", None): 1}
+
+    other_host = db_create_host(db_host(tags={"ns": {"key": ["val2"]}}))
+    assert _account_tags()[("ns", "key", "val2")] == 2
+
+    api_delete_host(host.id)
+    assert _account_tags() == {("ns", "key", "val2"): 1}
+
+    update_host_in_db(other_host.id, tags=None)
+    assert _account_tags() == {}
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    (
+        ("", [(("ns", "empty", ""), 2), (("ns", "none", None), 1)]),
+        ("?tags=ns/none", [(("ns", "empty", ""), 1), (("ns", "none", None), 1)]),
+    ),
+)
+def test_get_account_tags_with_empty_value(query, expected, db_create_multiple_hosts, api_get):
+    db_create_multiple_hosts(
+        hosts=[db_host(tags={"ns": {"empty": [""], "none": []}}), db_host(tags={"ns": {"empty": [""]}})]
+    )
+
+    response_status, response_data = api_get(build_tags_url(query=query))
+
+    assert response_status == 200
+    assert _tag_counts(response_data) == expected
+    assert _account_tags() == {("ns", "empty", ""): 2, ("ns", "none", None): 1}
+
+
+def test_account_tags_not_written_without_tag_change(db_create_host, db_get_host):
+    host = db_create_host(db_host(tags={"ns": {"key": ["val"]}}))
+    row_versions = _account_tag_row_versions()
+
+    update_host_in_db(host.id, display_name="renamed", stale_timestamp=db_get_host(host.id).stale_timestamp)
+    assert _account_tag_row_versions() == row_versions
+
+    update_host_in_db(host.id, tags={"ns": {"key": ["val"]}, "other": {"key": []}})
+    assert _account_tag_row_versions() != row_versions
+
+
+def _account_tags():
+    return {
+        (tag.namespace, tag.key, tag.value if tag.has_value else None): tag.host_count
+        for tag in AccountTag.query.filter_by(account=ACCOUNT)
+    }
+
+
+def _account_tag_row_versions():
+    # A row gets a new transaction id whenever it is written.
+    query = "SELECT namespace, key, value, xmin::text FROM account_tags WHERE account = :account ORDER BY 1, 2, 3"
+    return db.session.execute(query, {"account": ACCOUNT}).fetchall()
+
+
+def test_get_tags_sparse_fieldset(mq_create_four_specific_hosts, api_get):
+    created_hosts = mq_create_four_specific_hosts
+
+    url = build_host_tags_url(host_list_or_id=created_hosts[0].id, query="?fields[tags]=key,value")
+    response_status, response_data = api_get(url)
+
+    assert response_status == 200
+    expected_tags = [{"key": tag["key"], "value": tag["value"]} for tag in created_hosts[0].tags]
+    assert response_data["results"] == {created_hosts[0].id: expected_tags}
@@ -1,9 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Barrier
+
 import pytest
+from requests import Timeout
 
 from api.host_query_xjoin import QUERY as HOST_QUERY
 from api.tag import TAGS_QUERY
+from app.auth.identity import from_auth_header
+from app.logging import threadctx
+from tests.helpers.api_utils import build_account_auth_header
 from tests.helpers.api_utils import build_hosts_url
 from tests.helpers.api_utils import build_tags_url
+from tests.helpers.api_utils import do_request
 from tests.helpers.api_utils import HOST_URL
 from tests.helpers.api_utils import quote
 from tests.helpers.api_utils import quote_everything
@@ -52,6 +61,144 @@ def test_host_request_xjoin_status_200(patch_xjoin_post, api_get):
     assert response_status == 200
 
 
+def test_host_request_xjoin_cached(culling_datetime_mock, patch_xjoin_post, xjoin_query_cache, api_get):
+    post = patch_xjoin_post({"data": EMPTY_HOSTS_RESPONSE})
+
+    for _ in range(2):
+        response_status, response_data = api_get(HOST_URL)
+        assert response_status == 200
+
+    post.assert_called_once()
+    assert len(xjoin_query_cache) == 1
+
+
+@pytest.mark.parametrize("elapsed,post_count", ((timedelta(seconds=1), 1), (timedelta(seconds=5), 2)))
+def test_host_request_xjoin_cached_within_ttl(
+    mocker, elapsed, post_count, culling_datetime_mock, inventory_config, patch_xjoin_post, xjoin_query_cache, api_get
+):
+    # The cache TTL is 5 seconds, the current time is in the middle of its bucket.
+    post = patch_xjoin_post({"data": EMPTY_HOSTS_RESPONSE})
+    datetime_mock = mocker.patch("app.culling.datetime")
+
+    sent_staleness = []
+    for now in (culling_datetime_mock, culling_datetime_mock + elapsed):
+        datetime_mock.now.return_value = now
+        response_status, response_data = api_get(HOST_URL)
+        assert response_status == 200
+        sent_staleness.append(post.call_args[1]["json"]["variables"]["filter"][0]["OR"])
+
+    assert post.call_count == post_count
+    assert sent_staleness[0] == ({"stale_timestamp": {"gt": "2019-12-09T10:10:06.754201+00:00"}},)
+    if post_count == 2:
+        assert sent_staleness[1] == ({"stale_timestamp": {"gt": "2019-12-09T10:10:11.754201+00:00"}},)
+
+
+def test_host_request_xjoin_error_not_cached(patch_xjoin_post, xjoin_query_cache, api_get):
+    patch_xjoin_post({"data": EMPTY_HOSTS_RESPONSE}, status=403)
+    response_status, response_data = api_get(HOST_URL)
+    assert response_status == 500
+
+    post = patch_xjoin_post({"data": EMPTY_HOSTS_RESPONSE})
+    response_status, response_data = api_get(HOST_URL)
+    assert response_status == 200
+    post.assert_called_once()
+
+
+def test_concurrent_requests_keep_their_context(mocker, flask_app, query_source_xjoin, xjoin_query_cache):
+    in_flight = Barrier(2, timeout=5)
+    forwarded = []
+
+    def _post(url, json, headers, timeout):
+        # Both requests wait for xjoin-search at the same time.
+        in_flight.wait()
+        forwarded.append((threadctx.request_id, threadctx.account_number, headers))
+        return mocker.Mock(**{"status_code": 200, "json.return_value": {"data": EMPTY_HOSTS_RESPONSE}})
+
+    mocker.patch.object(flask_app.xjoin_client.session, "post", side_effect=_post)
+
+    def _get(account):
+        extra_headers = {**build_account_auth_header(account), "x-rh-insights-request-id": f"request-{account}"}
+        return do_request(flask_app.test_client().get, HOST_URL, extra_headers=extra_headers)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        responses = list(executor.map(_get, ("000001", "000002")))
+
+    assert [response_status for response_status, _ in responses] == [200, 200]
+    assert len(forwarded) == 2
+    for request_id, account_number, headers in forwarded:
+        assert request_id == headers["x-rh-insights-request-id"] == f"request-{account_number}"
+        assert from_auth_header(headers["x-rh-identity"]).account_number == account_number
+
+
+def test_host_request_xjoin_timeout(
+    mocker, flask_app, inventory_config, query_source_xjoin, xjoin_circuit_breaker, api_get
+):
+    mocker.patch("app.xjoin_client.sleep")
+    post = mocker.patch.object(flask_app.xjoin_client.session, "post", side_effect=Timeout())
+    inventory_config.xjoin_fallback_to_db = False
+
+    response_status, response_data = api_get(HOST_URL)
+    inventory_config.xjoin_fallback_to_db = True
+
+    assert response_status == 503
+    assert post.call_count == inventory_config.xjoin_retries + 1
+
+
+def test_host_request_xjoin_timeout_falls_back_to_db(
+    mocker, flask_app, query_source_xjoin, xjoin_circuit_breaker, db_create_host, api_get
+):
+    mocker.patch("app.xjoin_client.sleep")
+    post = mocker.patch.object(flask_app.xjoin_client.session, "post", side_effect=Timeout())
+    host = db_create_host()
+
+    response_status, response_data = api_get(HOST_URL)
+
+    assert response_status == 200
+    assert [result["id"] for result in response_data["results"]] == [str(host.id)]
+    post.assert_called()
+
+
+def test_tags_request_xjoin_timeout_falls_back_to_db(
+    mocker, flask_app, query_source_xjoin, xjoin_circuit_breaker, db_create_host, api_get
+):
+    mocker.patch("app.xjoin_client.sleep")
+    post = mocker.patch.object(flask_app.xjoin_client.session, "post", side_effect=Timeout())
+    db_create_host(extra_data={"tags": {"ns": {"key": ["value"]}}})
+
+    response_status, response_data = api_get(TAGS_URL)
+
+    assert response_status == 200
+    assert response_data["results"] == [{"tag": {"namespace": "ns", "key": "key", "value": "value"}, "count": 1}]
+    post.assert_called()
+
+
+def test_host_request_xjoin_circuit_open_falls_back_to_db(
+    query_source_xjoin, xjoin_circuit_breaker, graphql_query_with_response, api_get
+):
+    for _ in range(5):
+        xjoin_circuit_breaker.record_failure()
+
+    response_status, response_data = api_get(HOST_URL)
+
+    assert response_status == 200
+    graphql_query_with_response.assert_not_called()
+
+
+def test_host_request_xjoin_circuit_open_fails_fast(
+    inventory_config, xjoin_circuit_breaker, patch_xjoin_post, api_get
+):
+    post = patch_xjoin_post({"data": EMPTY_HOSTS_RESPONSE})
+    inventory_config.xjoin_fallback_to_db = False
+    for _ in range(5):
+        xjoin_circuit_breaker.record_failure()
+
+    response_status, response_data = api_get(HOST_URL)
+    inventory_config.xjoin_fallback_to_db = True
+
+    assert response_status == 503
+    post.assert_not_called()
+
+
 def test_query_variables_fqdn(mocker, query_source_xjoin, graphql_query_empty_response, api_get):
     fqdn = "host.domain.com"
 
@@ -296,6 +443,39 @@ def test_query_variables_registered_with_insights(mocker, query_source_xjoin, gr
     )
 
 
+@pytest.mark.parametrize(
+    "system_profile,expected",
+    (
+        ("arch=x86_64", {"spf_arch": {"eq": "x86_64"}}),
+        ("number_of_cpus=8", {"spf_number_of_cpus": {"eq": 8}}),
+        ("number_of_cpus>16", {"spf_number_of_cpus": {"gt": 16}}),
+        ("number_of_cpus>=16", {"spf_number_of_cpus": {"gte": 16}}),
+        ("number_of_cpus<16", {"spf_number_of_cpus": {"lt": 16}}),
+        ("number_of_cpus<=16", {"spf_number_of_cpus": {"lte": 16}}),
+        ("sap_system=true", {"spf_sap_system": {"is": True}}),
+        ("installed_packages=openssl-1.0.2k", {"spf_installed_packages": {"eq": "openssl-1.0.2k"}}),
+    ),
+)
+def test_query_variables_system_profile(
+    system_profile, expected, mocker, query_source_xjoin, graphql_query_empty_response, api_get
+):
+    url = build_hosts_url(query=f"?system_profile={quote(system_profile)}")
+    response_status, response_data = api_get(url)
+
+    assert response_status == 200
+
+    graphql_query_empty_response.assert_called_once_with(
+        HOST_QUERY,
+        {
+            "order_by": mocker.ANY,
+            "order_how": mocker.ANY,
+            "limit": mocker.ANY,
+            "offset": mocker.ANY,
+            "filter": (mocker.ANY, expected),
+        },
+    )
+
+
 @pytest.mark.parametrize("direction", ("ASC", "DESC"))
 def test_query_variables_ordering_dir(direction, mocker, query_source_xjoin, graphql_query_empty_response, api_get):
     url = build_hosts_url(query=f"?order_by=updated&order_how={quote(direction)}")
@@ -413,12 +593,7 @@ def test_query_variables_default_staleness(
     assert response_status == 200
 
     assert_graph_query_single_call_with_staleness(
-        mocker,
-        graphql_query_empty_response,
-        (
-            {"gt": "2019-12-16T10:10:06.754201+00:00"},  # fresh
-            {"gt": "2019-12-09T10:10:06.754201+00:00", "lte": "2019-12-16T10:10:06.754201+00:00"},  # stale
-        ),
+        mocker, graphql_query_empty_response, ({"gt": "2019-12-09T10:10:06.754201+00:00"},)  # fresh and stale
     )
 
 
@@ -461,6 +636,26 @@ def test_query_multiple_staleness(
     )
 
 
+def test_query_contiguous_staleness(
+    mocker, culling_datetime_mock, query_source_xjoin, graphql_query_empty_response, api_get
+):
+    staleness = "stale_warning,stale"
+
+    url = build_hosts_url(query=f"?staleness={staleness}")
+    response_status, response_data = api_get(url)
+
+    assert response_status == 200
+
+    assert_graph_query_single_call_with_staleness(
+        mocker,
+        graphql_query_empty_response,
+        (
+            # stale warning and stale
+            {"gt": "2019-12-02T10:10:06.754201+00:00", "lte": "2019-12-16T10:10:06.754201+00:00"},
+        ),
+    )
+
+
 @pytest.mark.parametrize(
     "field,value",
     (
@@ -642,17 +837,7 @@ def test_tags_query_variables_default_staleness(
             "order_how": mocker.ANY,
             "limit": mocker.ANY,
             "offset": mocker.ANY,
-            "hostFilter": {
-                "OR": [
-                    {"stale_timestamp": {"gt": "2019-12-16T10:10:06.754201+00:00"}},
-                    {
-                        "stale_timestamp": {
-                            "gt": "2019-12-09T10:10:06.754201+00:00",
-                            "lte": "2019-12-16T10:10:06.754201+00:00",
-                        }
-                    },
-                ]
-            },
+            "hostFilter": {"OR": [{"stale_timestamp": {"gt": "2019-12-09T10:10:06.754201+00:00"}}]},
         },
     )
 
@@ -1096,3 +1281,114 @@ def test_no_header_env_var_db(inventory_config, query_source_db_beta_xjoin, grap
     response_status, response_data = api_get(HOST_URL)
     assert response_status == 200
     graphql_query_with_response.assert_not_called()
+
+
+def test_shadow_read_hosts_from_xjoin(mocker, db_create_multiple_hosts, xjoin_stand_in, shadow_reader, api_get):
+    shadow_read_count = mocker.patch("api.shadow_read.bulk_query_shadow_read_count")
+    db_create_multiple_hosts(how_many=3)
+
+    response_status, response_data = api_get(HOST_URL)
+    shadow_reader.shutdown()
+
+    assert response_status == 200
+    assert len(xjoin_stand_in.queries) == 1
+    shadow_read_count.labels.assert_called_once_with("hosts", "match")
+
+
+def test_shadow_read_hosts_from_xjoin_not_cached(
+    mocker, db_create_multiple_hosts, xjoin_stand_in, xjoin_query_cache, shadow_reader, api_get
+):
+    shadow_read_count = mocker.patch("api.shadow_read.bulk_query_shadow_read_count")
+    db_create_multiple_hosts(how_many=3)
+
+    for _ in range(2):
+        response_status, response_data = api_get(HOST_URL)
+        assert response_status == 200
+    shadow_reader.shutdown()
+
+    assert len(xjoin_stand_in.queries) == 2
+    assert len(xjoin_query_cache) == 0
+    assert shadow_read_count.labels.call_count == 2
+
+
+def test_shadow_read_hosts_from_db(
+    mocker, query_source_xjoin, db_create_multiple_hosts, xjoin_stand_in, shadow_reader, api_get
+):
+    shadow_read_count = mocker.patch("api.shadow_read.bulk_query_shadow_read_count")
+    created_hosts = db_create_multiple_hosts(how_many=3)
+
+    response_status, response_data = api_get(HOST_URL)
+    shadow_reader.shutdown()
+
+    assert response_status == 200
+    assert [host["id"] for host in response_data["results"]] == [str(host.id) for host in reversed(created_hosts)]
+    shadow_read_count.labels.assert_called_once_with("hosts", "match")
+
+
+def test_shadow_read_hosts_mismatch(mocker, db_create_multiple_hosts, xjoin_stand_in, shadow_reader, api_get):
+    shadow_read_count = mocker.patch("api.shadow_read.bulk_query_shadow_read_count")
+    created_hosts = db_create_multiple_hosts(how_many=3)
+    xjoin_stand_in.hidden_host_ids.add(created_hosts[0].id)
+
+    response_status, response_data = api_get(HOST_URL)
+    shadow_reader.shutdown()
+
+    assert response_status == 200
+    assert response_data["total"] == 3
+    shadow_read_count.labels.assert_called_once_with("hosts", "total_mismatch")
+
+
+def test_shadow_read_tags_from_xjoin(mocker, db_create_multiple_hosts, xjoin_stand_in, shadow_reader, api_get):
+    shadow_read_count = mocker.patch("api.shadow_read.bulk_query_shadow_read_count")
+    tags = {"ns": {"env": ["prod"], "owner": ["team", "other-team"]}}
+    db_create_multiple_hosts(how_many=2, extra_data={"tags": tags})
+
+    response_status, response_data = api_get(TAGS_URL)
+    shadow_reader.shutdown()
+
+    assert response_status == 200
+    assert response_data["total"] == 3
+    assert len(xjoin_stand_in.queries) == 1
+    shadow_read_count.labels.assert_called_once_with("tags", "match")
+
+
+def test_shadow_read_timed_apart(mocker, db_create_multiple_hosts, xjoin_stand_in, shadow_reader, api_get):
+    bulk_query_time = mocker.patch("api.shadow_read.bulk_query_time")
+    bulk_query_shadow_time = mocker.patch("api.shadow_read.bulk_query_shadow_time")
+    db_create_multiple_hosts(how_many=1)
+
+    response_status, response_data = api_get(HOST_URL)
+    shadow_reader.shutdown()
+
+    assert response_status == 200
+    bulk_query_time.labels.assert_called_once_with("db", "hosts", "staleness")
+    bulk_query_shadow_time.labels.assert_called_once_with("xjoin", "hosts", "staleness")
+
+
+def test_shadow_read_failures_keep_circuit_closed(
+    mocker, flask_app, inventory_config, db_create_multiple_hosts, xjoin_circuit_breaker, shadow_reader, api_get
+):
+    mocker.patch("app.xjoin_client.sleep")
+    mocker.patch.object(flask_app.xjoin_client.session, "post", side_effect=Timeout())
+    shadow_read_count = mocker.patch("api.shadow_read.bulk_query_shadow_read_count")
+    db_create_multiple_hosts(how_many=1)
+
+    for _ in range(inventory_config.xjoin_circuit_breaker_failures):
+        response_status, response_data = api_get(HOST_URL)
+        assert response_status == 200
+    shadow_reader.shutdown()
+
+    shadow_read_count.labels.assert_called_with("hosts", "error")
+    assert flask_app.xjoin_client.shadow_circuit_breaker.is_open()
+    assert not xjoin_circuit_breaker.is_open()
+
+
+def test_shadow_read_not_sampled(mocker, flask_app, db_create_multiple_hosts, xjoin_stand_in, api_get):
+    submit = mocker.patch.object(flask_app.shadow_reader, "submit")
+    db_create_multiple_hosts(how_many=1)
+
+    response_status, response_data = api_get(HOST_URL)
+
+    assert response_status == 200
+    submit.assert_not_called()
+    assert not xjoin_stand_in.queries
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Measures the wall time of creating the API application, as every process of a starting pod does. Each run is a
+new process, once with no cached specification and then with the one cached by the first run. The command
+environment is used, it does not connect to Kafka.
+"""
+import json
+import os
+import sys
+from statistics import median
+from subprocess import PIPE
+from subprocess import run
+from tempfile import TemporaryDirectory
+
+RUNS = int(os.environ.get("BENCHMARK_RUNS", "5"))
+
+MEASURE_CREATE_APP = """
+import json
+from time import perf_counter
+
+started = perf_counter()
+from app import create_app
+from app.environment import RuntimeEnvironment
+
+imported = perf_counter()
+create_app(RuntimeEnvironment.COMMAND)
+created = perf_counter()
+print(json.dumps({"import": imported - started, "create_app": created - imported}))
+"""
+
+
+def measure(cache_dir):
+    environment = {**os.environ, "SPECIFICATION_CACHE_DIR": cache_dir, "INVENTORY_LOG_LEVEL": "ERROR"}
+    completed = run((sys.executable, "-c", MEASURE_CREATE_APP), env=environment, stdout=PIPE, check=True)
+    return json.loads(completed.stdout.decode().splitlines()[-1])
+
+
+def report(name, timings):
+    for phase in ("import", "create_app"):
+        phase_timings = [timing[phase] for timing in timings]
+        print(f"{name} {phase}: min {min(phase_timings):.3f} s, median {median(phase_timings):.3f} s")
+
+
+def main():
+    report("Not cached", [measure("") for _ in range(RUNS)])
+
+    with TemporaryDirectory() as cache_dir:
+        measure(cache_dir)
+        report("Cached", [measure(cache_dir) for _ in range(RUNS)])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 from marshmallow import ValidationError
 
-from app import create_app
 from app import UNKNOWN_REQUEST_ID_VALUE
+from app.bootstrap import init_config
+from app.bootstrap import init_db
 from app.environment import RuntimeEnvironment
+from app.logging import configure_logging
 from app.logging import get_logger
 from app.logging import threadctx
 from app.models import Host
 from app.queue.events import build_event
 from app.queue.events import EventType
+from lib.db import session_guard
 
 logger = get_logger("utils")
 
@@ -22,21 +25,23 @@ def test_validations(host):
 
 
 def main():
-    flask_app = create_app(RuntimeEnvironment.COMMAND)
-    with flask_app.app_context() as ctx:
-        threadctx.request_id = UNKNOWN_REQUEST_ID_VALUE
-        ctx.push()
-    query = Host.query
-    logger.info("Validating delete event for hosts.")
-    logger.info("Total number of hosts: %i", query.count())
-
-    number_of_errors = 0
-    for host in query.yield_per(1000):
-        host_validation_errors = test_validations(host)
-        if host_validation_errors:
-            number_of_errors += 1
-            logger.info("Output validation error host ID %s, error %s", host.id, host_validation_errors)
-    logger.info("Number of Host Validation Errors: %i", number_of_errors)
+    configure_logging()
+    config = init_config(RuntimeEnvironment.COMMAND)
+    Session = init_db(config)
+    threadctx.request_id = UNKNOWN_REQUEST_ID_VALUE
+
+    with session_guard(Session()) as session:
+        query = session.query(Host)
+        logger.info("Validating delete event for hosts.")
+        logger.info("Total number of hosts: %i", query.count())
+
+        number_of_errors = 0
+        for host in query.yield_per(1000):
+            host_validation_errors = test_validations(host)
+            if host_validation_errors:
+                number_of_errors += 1
+                logger.info("Output validation error host ID %s, error %s", host.id, host_validation_errors)
+        logger.info("Number of Host Validation Errors: %i", number_of_errors)
 
 
 if __name__ == "__main__":